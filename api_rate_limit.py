@@ -0,0 +1,233 @@
+"""
+Ограничение частоты запросов к API (token bucket, общий для рабочих процессов)
+Корзины хранятся в отдельной SQLite-базе в tmpfs (/dev/shm): все рабочие
+процессы gunicorn видят одни счетчики без Redis, а файл исчезает
+при перезагрузке. Пополнение и списание токена - один оператор UPSERT,
+поэтому проверка атомарна между процессами и потоками.
+
+Правила задаются строкой "[МЕТОД ]путь[@ip]=запросов_в_секунду/емкость"
+через запятую, например "*=20/60,POST /api/login=1/10,*@127.0.0.1=0".
+Путь - префикс (/api/entries включает /api/entries/5), * - любой путь,
+скорость 0 - без ограничения. Корзина своя для каждого правила и IP.
+Из подходящих правил выбирается правило с IP, затем с более длинным
+путем, затем с методом.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from lifecycle import ProcessSingleton
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES = (
+    '*=20/60,'
+    'GET /api/entries=5/20,'
+    'POST /api/login=1/10,'
+    'POST /api/init=0.1/3,'
+    'POST /api/change-master-password=0.1/3,'
+    'POST /api/rotate-mek=0.1/3'
+)
+
+# Интервал удаления полных (давно не использованных) корзин, с
+CLEANUP_INTERVAL = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Пополнение за прошедшее время и списание токена, если он есть; без токена строка не меняется
+_TAKE = """
+INSERT INTO buckets (key, tokens, updated) VALUES (:key, :burst - 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = MIN(:burst, tokens + MAX(0, :now - updated) * :rate) - 1,
+    updated = :now
+WHERE MIN(:burst, tokens + MAX(0, :now - updated) * :rate) >= 1
+RETURNING tokens
+"""
+
+
+class ApiRateLimited(Exception):
+    """Корзина запросов клиента пуста"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Слишком много запросов, повторите попытку позже")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateRule(NamedTuple):
+    """Правило ограничения (method и ip - None для любых)"""
+    key: str
+    method: Optional[str]
+    path: str
+    ip: Optional[str]
+    rate: float
+    burst: float
+
+    def matches(self, method: str, path: str, ip: str) -> bool:
+        if self.method is not None and self.method != method:
+            return False
+        if self.ip is not None and self.ip != ip:
+            return False
+        return self.path == '*' or path == self.path or path.startswith(self.path.rstrip('/') + '/')
+
+    def priority(self) -> Tuple[bool, int, bool]:
+        return self.ip is not None, 0 if self.path == '*' else len(self.path), self.method is not None
+
+
+def parse_rules(spec: str) -> List[RateRule]:
+    """Разбор строки правил; ValueError при ошибке формата"""
+    rules = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        target, sep, limit = item.rpartition('=')
+        if not sep:
+            raise ValueError(f"Правило без '=': {item}")
+        target = target.strip()
+        method, _, route = target.rpartition(' ')
+        path, _, ip = route.partition('@')
+        if not path or not (path == '*' or path.startswith('/')):
+            raise ValueError(f"Путь правила должен начинаться с '/' или быть '*': {item}")
+        rate, _, burst = limit.partition('/')
+        try:
+            rate = float(rate)
+            burst = float(burst) if burst else max(1.0, rate)
+        except ValueError:
+            raise ValueError(f"Ожидается запросов_в_секунду/емкость: {item}") from None
+        if rate < 0 or (rate > 0 and burst < 1):
+            raise ValueError(f"Скорость должна быть >= 0, емкость >= 1: {item}")
+        rules.append(RateRule(target, method.strip().upper() or None, path, ip or None, rate, burst))
+    return rules
+
+
+def default_path(database_path: str) -> str:
+    """Файл корзин в tmpfs, свой для каждой основной БД"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    digest = hashlib.sha256(os.path.abspath(database_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, f'gostvault-ratelimit-{digest}.db')
+
+
+class ApiRateLimiter:
+    """
+    Token bucket по правилам и IP в общей SQLite-базе
+
+    Ошибка базы корзин (например, занята дольше busy_timeout) не блокирует
+    API: запрос пропускается и учитывается в errors.
+    """
+
+    def __init__(self, path: str, rules: List[RateRule], enabled: bool = True):
+        self.path = path
+        self.rules = sorted(rules, key=RateRule.priority, reverse=True)
+        self.enabled = enabled
+        # Корзина, не тронутая дольше времени заполнения, полна - ее строку можно удалить
+        self._idle_seconds = max([rule.burst / rule.rate for rule in rules if rule.rate > 0] + [0]) + 1
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._next_cleanup = 0.0
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def rule_for(self, method: str, path: str, ip: str) -> Optional[RateRule]:
+        """Самое конкретное подходящее правило"""
+        for rule in self.rules:
+            if rule.matches(method, path, ip):
+                return rule
+        return None
+
+    def acquire(self, method: str, path: str, ip: str) -> Tuple[bool, float]:
+        """
+        Списание токена для запроса
+        Возвращает: (allowed, retry_after) - через сколько секунд появится токен
+        """
+        rule = self.rule_for(method, path, ip) if self.enabled else None
+        if rule is None or rule.rate == 0:
+            return True, 0.0
+
+        now = time.time()
+        params = {'key': f'{rule.key}|{ip}', 'burst': rule.burst, 'rate': rule.rate, 'now': now}
+        try:
+            with self._lock:
+                connection = self._connect()
+                taken = connection.execute(_TAKE, params).fetchone()
+                if taken is None:
+                    tokens, updated = connection.execute(
+                        'SELECT tokens, updated FROM buckets WHERE key = :key', params).fetchone()
+                if now >= self._next_cleanup:
+                    self._next_cleanup = now + CLEANUP_INTERVAL
+                    connection.execute('DELETE FROM buckets WHERE updated < ?', (now - self._idle_seconds,))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Ошибка базы ограничения запросов %s: %s", self.path, e)
+            return True, 0.0
+
+        if taken is not None:
+            self.allowed += 1
+            return True, 0.0
+        self.limited += 1
+        available = min(rule.burst, tokens + max(0.0, now - updated) * rule.rate)
+        return False, (1 - available) / rule.rate
+
+    def stats(self) -> Dict:
+        """Пропущенные и отклоненные запросы, число корзин"""
+        buckets = None
+        if self.enabled:
+            try:
+                with self._lock:
+                    buckets = self._connect().execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'rules': [rule.key for rule in self.rules],
+            'buckets': buckets,
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'errors': self.errors
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def _create_api_rate_limiter() -> ApiRateLimiter:
+    database_path = os.getenv('DATABASE_PATH', 'password_manager.db')
+    return ApiRateLimiter(
+        os.getenv('API_RATE_LIMIT_DB') or default_path(database_path),
+        parse_rules(os.getenv('API_RATE_LIMITS', DEFAULT_RULES)),
+        enabled=os.getenv('API_RATE_LIMIT', 'true').lower() == 'true'
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_limiter_instance = ProcessSingleton(_create_api_rate_limiter)
+
+def get_api_rate_limiter() -> ApiRateLimiter:
+    """Получение singleton экземпляра ограничителя запросов к API"""
+    return _limiter_instance.get()
@@ -16,9 +16,19 @@ from io import BytesIO
 
 from models import (
     get_database, MasterPassword, PasswordEntry, 
-    AuditLog, LoginAttempt, SessionToken
+    AuditLog, SessionToken, MasterEncryptionKey
 )
-from crypto_gost import get_crypto
+from crypto_gost import get_crypto, KeyRing
+from entry_integrity import ENTRY_COLUMNS
+from kdf_pool import get_kdf_pool, KdfPoolBusy
+from key_rotation import get_key_rotation_manager
+from parallel_decrypt import get_parallel_decryptor
+from read_repair import get_read_repairer
+from password_generator import get_password_generator
+from lifecycle import SingletonProxy, preload
+from audit_log import get_audit_writer
+from login_limiter import get_login_limiter
+from api_rate_limit import ApiRateLimited, get_api_rate_limiter
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -32,65 +42,194 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=10)  # Сессия
 
 CORS(app, supports_credentials=True)
 
-# Инициализация
-db = get_database()
-crypto = get_crypto()
+# Инициализация: объекты создаются при первом запросе в каждом рабочем процессе
+# (движок БД, пулы и кэши ключей не переживают fork); до fork загружаются
+# только неизменяемые таблицы, общие для рабочих процессов
+if os.getenv('PRELOAD_TABLES', 'true').lower() == 'true':
+    preload()
+db = SingletonProxy(get_database)
+crypto = SingletonProxy(get_crypto)
+decryptor = SingletonProxy(get_parallel_decryptor)
+repairer = SingletonProxy(get_read_repairer)
+rotations = SingletonProxy(get_key_rotation_manager)
+kdf = SingletonProxy(get_kdf_pool)
+audit = SingletonProxy(get_audit_writer)
+limiter = SingletonProxy(get_login_limiter)
+api_limiter = SingletonProxy(get_api_rate_limiter)
 
 # Константы безопасности
-MAX_LOGIN_ATTEMPTS = int(os.getenv('MAX_LOGIN_ATTEMPTS', 5))
 LOCKOUT_DURATION = int(os.getenv('LOCKOUT_DURATION', 30))  # секунды
 
+# Режим записи: все поля записи шифруются одним шифртекстом в record_enc
+RECORD_ENCRYPTION = os.getenv('RECORD_ENCRYPTION', 'false').lower() == 'true'
 
-def log_audit(action: str, entry_id: int = None, success: bool = True, details: str = None):
-    """Логирование действий в аудит"""
+# Имитовставки CMAC для новых и измененных записей (записи с имитовставкой сохраняют ее всегда)
+ENTRY_MAC = os.getenv('ENTRY_MAC', 'false').lower() == 'true'
+
+# Поля записи, хранившиеся ранее в отдельных колонках <поле>_enc
+ENTRY_FIELDS = ('site_name', 'url', 'username', 'password', 'notes', 'totp_secret', 'custom_fields')
+
+
+def log_audit(action: str, entry_id: int = None, success: bool = True, details: str = None,
+              sync: bool = False):
+    """
+    Логирование действий в аудит
+    Запись - фоновым потоком пакетами; sync=True (вход, смена мастер-пароля)
+    возвращается после записи в БД
+    """
     try:
-        db_session = db.get_session()
-        log = AuditLog(
-            action=action,
+        audit.log(
+            action,
             entry_id=entry_id,
             success=success,
             ip_address=request.remote_addr,
             user_agent=request.headers.get('User-Agent', '')[:255],
-            details=details
+            details=details,
+            sync=sync
         )
-        db_session.add(log)
-        db_session.commit()
-        db_session.close()
     except Exception as e:
         print(f"Ошибка логирования: {e}")
 
 
-def check_rate_limit(ip_address: str) -> tuple[bool, int]:
+def encrypt_field(encryption_key: bytes, value: str):
+    """Шифрование поля записи сразу в формате хранения БД (base64 или сырые байты)"""
+    return crypto.encrypt_data(encryption_key, value, raw=db.binary_storage)
+
+
+def read_entry_fields(encryption_key: bytes, entry: PasswordEntry) -> dict:
+    """Открытые значения всех полей записи (из record_enc или из отдельных колонок)"""
+    if entry.record_enc:
+        return crypto.decrypt_record(encryption_key, entry.record_enc)
+    
+    encrypted = [getattr(entry, f'{field}_enc') or '' for field in ENTRY_FIELDS]
+    return dict(zip(ENTRY_FIELDS, crypto.decrypt_many(encryption_key, encrypted)))
+
+
+def write_entry_fields(encryption_key: bytes, entry: PasswordEntry, fields: dict):
     """
-    Проверка ограничения попыток входа
-    Возвращает: (allowed, remaining_attempts)
+    Запись полей одним шифртекстом; отдельные колонки очищаются
+    (так старые записи переводятся в новый формат при изменении)
     """
-    db_session = db.get_session()
+    entry.record_enc = crypto.encrypt_record(encryption_key, fields, raw=db.binary_storage)
+    for field in ENTRY_FIELDS:
+        setattr(entry, f'{field}_enc', None)
+    # Колонки NOT NULL заполняются пустым значением
+    empty = b'' if db.binary_storage else ''
+    entry.site_name_enc = entry.username_enc = entry.password_enc = empty
+
+
+def seal_entry(encryption_key, entry: PasswordEntry):
+    """Имитовставка записи по ее шифртекстам (id уже назначен)"""
+    if ENTRY_MAC or entry.mac_tag:
+        values = tuple(getattr(entry, column) for column in ENTRY_COLUMNS)
+        entry.mac_tag = crypto.entry_tags(encryption_key, [(entry.id, values)])[0]
+
+
+def session_key():
+    """
+    Ключ шифрования сессии
+    Во время ротации MEK - KeyRing: запись новым ключом, чтение обоими
+    """
+    key = base64.b64decode(session['encryption_key'])
+    if 'previous_encryption_key' in session:
+        return KeyRing(key, base64.b64decode(session['previous_encryption_key']))
+    return key
+
+
+def set_session_key(key):
+    """Сохранение ключа (или KeyRing) в сессии"""
+    if isinstance(key, KeyRing):
+        session['encryption_key'] = base64.b64encode(key.current).decode('utf-8')
+        session['previous_encryption_key'] = base64.b64encode(key.previous).decode('utf-8')
+    else:
+        session['encryption_key'] = base64.b64encode(key).decode('utf-8')
+        session.pop('previous_encryption_key', None)
+
+
+def forget_session_key():
+    """Обнуление развернутых ключей текущей сессии в кэше шифра"""
+    for name in ('encryption_key', 'previous_encryption_key'):
+        if name in session:
+            crypto.forget_key(base64.b64decode(session[name]))
+
+
+def load_mek(db_session, master: MasterPassword, master_password: str):
+    """
+    Запись MEK, сам MEK и ключ его обёртки (KEK)
+    Для хранилищ без MEK он создается из ключа, полученного из мастер-пароля.
+    Деривации выполняются в пуле KDF (KdfPoolBusy при перегрузке)
+    """
+    mek_record = db_session.query(MasterEncryptionKey).first()
     
-    # Получаем попытки за последние LOCKOUT_DURATION секунд
-    cutoff_time = datetime.utcnow() - timedelta(seconds=LOCKOUT_DURATION)
-    recent_attempts = db_session.query(LoginAttempt).filter(
-        LoginAttempt.ip_address == ip_address,
-        LoginAttempt.timestamp > cutoff_time,
-        LoginAttempt.success == False
-    ).count()
+    if not mek_record:
+        # Миграция: текущий ключ становится MEK и шифруется мастер-паролем
+        mek = kdf.derive_kek(crypto, master_password, base64.b64decode(master.salt))
+        mek_record = MasterEncryptionKey()
+        _, kek = wrap_mek(mek_record, mek, master_password)
+        
+        db_session.add(mek_record)
+        db_session.commit()
+        return mek_record, mek, kek
     
-    db_session.close()
+    kek = kdf.derive_kek(crypto, master_password, base64.b64decode(mek_record.kdf_salt),
+                         mek_record.kdf_iterations, mek_record.kdf_algorithm)
+    mek = crypto.unwrap_mek(base64.b64decode(mek_record.encrypted_key), kek)
+    return mek_record, mek, kek
+
+
+def wrap_mek(mek_record: MasterEncryptionKey, mek: bytes, master_password: str, timeout: float = None):
+    """
+    Обёртка MEK мастер-паролем с новой солью и текущими параметрами KDF
+    Возвращает: (новая соль, KEK)
+    """
+    new_salt = crypto.generate_salt()
+    kek = kdf.derive_kek(crypto, master_password, new_salt, crypto.pbkdf2_iterations, crypto.kdf_algorithm,
+                         timeout=timeout)
+    encrypted_mek = crypto.wrap_mek(mek, kek)
     
-    remaining = MAX_LOGIN_ATTEMPTS - recent_attempts
-    return remaining > 0, remaining
+    mek_record.encrypted_key = base64.b64encode(encrypted_mek).decode('utf-8')
+    mek_record.kdf_salt = base64.b64encode(new_salt).decode('utf-8')
+    mek_record.kdf_iterations = crypto.pbkdf2_iterations
+    mek_record.kdf_algorithm = crypto.kdf_algorithm
+    mek_record.updated_at = datetime.utcnow()
+    return new_salt, kek
 
 
-def record_login_attempt(ip_address: str, success: bool):
-    """Запись попытки входа"""
-    db_session = db.get_session()
-    attempt = LoginAttempt(
-        ip_address=ip_address,
-        success=success
-    )
-    db_session.add(attempt)
-    db_session.commit()
-    db_session.close()
+def upgrade_kdf(db_session, master: MasterPassword, mek_record: MasterEncryptionKey,
+                master_password: str, mek: bytes):
+    """
+    Перевод хэша мастер-пароля и обёртки MEK на текущие параметры KDF
+    Выполняется после успешного входа, пока пароль известен
+    """
+    upgraded = []
+    
+    if crypto.needs_rehash(master.password_hash):
+        # Без ожидания в очереди: при нагрузке хэш обновится при следующем входе
+        try:
+            master.password_hash = kdf.hash(crypto, master_password, timeout=0)
+            upgraded.append('argon2')
+        except KdfPoolBusy:
+            pass
+    
+    # Новый MEK ротации обернут тем же KEK - обёртка меняется только вне ротации
+    if mek_record and not rotations.active(db_session) and \
+            (mek_record.kdf_iterations, mek_record.kdf_algorithm or crypto.KDF_PBKDF2_SHA512) != \
+            (crypto.pbkdf2_iterations, crypto.kdf_algorithm):
+        try:
+            wrap_mek(mek_record, mek, master_password, timeout=0)
+            upgraded.append(crypto.kdf_algorithm)
+        except KdfPoolBusy:
+            pass
+    
+    if not upgraded:
+        return
+    
+    try:
+        db_session.commit()
+        log_audit('kdf_upgrade', success=True, details=', '.join(upgraded))
+    except Exception as e:
+        db_session.rollback()
+        app.logger.error(f"Ошибка обновления параметров KDF: {e}")
 
 
 def require_auth(f):
@@ -104,14 +243,50 @@ def require_auth(f):
         if 'last_activity' in session:
             last_activity = datetime.fromisoformat(session['last_activity'])
             if datetime.utcnow() - last_activity > timedelta(minutes=5):
+                forget_session_key()
                 session.clear()
                 return jsonify({'error': 'Сессия истекла'}), 401
         
+        # После ротации MEK ключ сессии, открытой раньше, больше не подходит
+        latest_key_id = rotations.latest_key_id()
+        if latest_key_id is not None and \
+                crypto.key_id(base64.b64decode(session['encryption_key'])) != latest_key_id:
+            forget_session_key()
+            session.clear()
+            return jsonify({'error': 'Ключ шифрования обновлен, войдите снова'}), 401
+        
         session['last_activity'] = datetime.utcnow().isoformat()
         return f(*args, **kwargs)
     return decorated_function
 
 
+@app.before_request
+def limit_api_rate():
+    """Ограничение частоты запросов к /api/* по правилам и IP (счетчики общие для рабочих процессов)"""
+    if request.path.startswith('/api/'):
+        allowed, retry_after = api_limiter.acquire(request.method, request.path, request.remote_addr)
+        if not allowed:
+            raise ApiRateLimited(retry_after)
+
+
+@app.errorhandler(ApiRateLimited)
+def api_rate_limited(error):
+    """Корзина запросов клиента пуста: клиент повторяет запрос через Retry-After секунд"""
+    response = jsonify({'error': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(KdfPoolBusy)
+def kdf_pool_busy(error):
+    """Пул KDF перегружен: клиент повторяет запрос через Retry-After секунд"""
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
 @app.route('/')
 def index():
     """Главная страница"""
@@ -158,7 +333,7 @@ def initialize():
     
     # Генерация соли и хэширование
     salt = crypto.generate_salt()
-    password_hash = crypto.hash_master_password(master_password)
+    password_hash = kdf.hash(crypto, master_password)
     
     master = MasterPassword(
         password_hash=password_hash,
@@ -169,7 +344,7 @@ def initialize():
     db_session.commit()
     db_session.close()
     
-    log_audit('init_master_password', success=True)
+    log_audit('init_master_password', success=True, sync=True)
     
     return jsonify({'success': True, 'message': 'Мастер-пароль установлен'})
 
@@ -186,44 +361,76 @@ def login():
     ip_address = request.remote_addr
     
     # Проверка rate limit
-    allowed, remaining = check_rate_limit(ip_address)
+    allowed, remaining = limiter.check(ip_address)
     if not allowed:
+        # Отказ не пишется синхронно: при переборе паролей он не должен нагружать БД
         log_audit('login', success=False, details='Rate limit exceeded')
         return jsonify({
             'error': f'Слишком много неудачных попыток. Попробуйте через {LOCKOUT_DURATION} секунд'
         }), 429
     
-    db_session = db.get_session()
-    master = db_session.query(MasterPassword).first()
+    db_session = None
+    try:
+        db_session = db.get_session()
+        master = db_session.query(MasterPassword).first()
+        
+        if master:
+            # Проверка пароля (Argon2) и деривация ключа (PBKDF2) - одна операция пула KDF:
+            # с MEK это ключ его обёртки, без MEK - сам ключ шифрования
+            mek_record = db_session.query(MasterEncryptionKey).first()
+            if mek_record:
+                kdf_salt, kdf_iterations = base64.b64decode(mek_record.kdf_salt), mek_record.kdf_iterations
+                kdf_algorithm = mek_record.kdf_algorithm
+            else:
+                kdf_salt, kdf_iterations, kdf_algorithm = base64.b64decode(master.salt), None, None
+            
+            valid, derived_key = kdf.verify_and_derive(crypto, master_password, master.password_hash,
+                                                       kdf_salt, kdf_iterations, kdf_algorithm)
+    except Exception:
+        # Попытка без вердикта (перегрузка пула KDF, ошибка БД) не считается неудачной
+        limiter.release(ip_address)
+        if db_session is not None:
+            db_session.close()
+        raise
     
     if not master:
+        limiter.release(ip_address)
         db_session.close()
         return jsonify({'error': 'Мастер-пароль не установлен'}), 400
     
-    # Проверка пароля
-    if crypto.verify_master_password(master_password, master.password_hash):
+    if valid:
         # Успешный вход
-        record_login_attempt(ip_address, True)
+        limiter.record(ip_address, True)
         
-        # Деривация ключа шифрования из мастер-пароля
-        salt = base64.b64decode(master.salt)
-        encryption_key = crypto.derive_key_pbkdf2_gost(master_password, salt)
+        if mek_record:
+            # MEK расшифровывается мастер-паролем (после смены пароля ключ из него - только KEK)
+            encryption_key = crypto.unwrap_mek(base64.b64decode(mek_record.encrypted_key), derived_key)
+            upgrade_kdf(db_session, master, mek_record, master_password, encryption_key)
+            
+            # Во время ротации нужны оба ключа; прерванная ротация продолжается
+            rotation = rotations.active(db_session)
+            if rotation:
+                encryption_key = KeyRing(rotations.unwrap_new_key(rotation, derived_key), encryption_key)
+                rotations.resume(rotation.id, encryption_key)
+        else:
+            encryption_key = derived_key
+            upgrade_kdf(db_session, master, None, master_password, encryption_key)
         
         # Сохранение в сессии
         session['authenticated'] = True
-        session['encryption_key'] = base64.b64encode(encryption_key).decode('utf-8')
+        set_session_key(encryption_key)
         session['last_activity'] = datetime.utcnow().isoformat()
         session.permanent = True
         
         db_session.close()
-        log_audit('login', success=True)
+        log_audit('login', success=True, sync=True)
         
         return jsonify({'success': True, 'message': 'Вход выполнен'})
     else:
         # Неудачная попытка
-        record_login_attempt(ip_address, False)
+        limiter.record(ip_address, False)
         db_session.close()
-        log_audit('login', success=False)
+        log_audit('login', success=False, sync=True)
         
         return jsonify({
             'error': f'Неверный мастер-пароль. Осталось попыток: {remaining - 1}'
@@ -235,6 +442,7 @@ def login():
 def logout():
     """Выход из системы"""
     log_audit('logout', success=True)
+    forget_session_key()
     session.clear()
     return jsonify({'success': True, 'message': 'Выход выполнен'})
 
@@ -244,33 +452,59 @@ def logout():
 def get_entries():
     """Получение всех записей паролей"""
     db_session = db.get_session()
-    entries = db_session.query(PasswordEntry).all()
-    
-    encryption_key = base64.b64decode(session['encryption_key'])
+    entries = db_session.query(PasswordEntry).order_by(PasswordEntry.id).all()
+    
+    encryption_key = session_key()
+    
+    # Все поля всех записей расшифровываются пакетно (при большом хранилище - пулом процессов)
+    # Записи нового формата расшифровываются целиком из record_enc
+    fields = ('site_name_enc', 'url_enc', 'username_enc', 'password_enc', 'notes_enc')
+    rows = [(entry.id, entry.record_enc) + tuple(getattr(entry, field) for field in fields) for entry in entries]
+    decrypted, errors = decryptor.decrypt_rows(encryption_key, rows)
+    
+    entries_by_id = {entry.id: entry for entry in entries}
+    
+    # Записи с неверной имитовставкой не отдаются
+    tagged = [entry for entry in entries if entry.mac_tag]
+    valid = crypto.verify_entry_tags(encryption_key, [
+        (entry.id, tuple(getattr(entry, column) for column in ENTRY_COLUMNS), entry.mac_tag) for entry in tagged
+    ])
+    tampered = {entry.id for entry, ok in zip(tagged, valid) if not ok}
+    if tampered:
+        decrypted = [(entry_id, values) for entry_id, values in decrypted if entry_id not in tampered]
+        errors = errors + [{'entry_id': entry_id, 'error': 'Имитовставка записи не совпадает'}
+                           for entry_id in sorted(tampered)]
+    
+    # Строки в старом формате шифртекста перезаписываются в фоне
+    for entry in entries:
+        if repairer.is_stale('password_entries', entry):
+            repairer.submit('password_entries', entry.id, encryption_key)
     
     result = []
-    for entry in entries:
-        try:
-            decrypted_entry = {
-                'id': entry.id,
-                'site_name': crypto.decrypt_data(encryption_key, entry.site_name_enc),
-                'url': crypto.decrypt_data(encryption_key, entry.url_enc) if entry.url_enc else '',
-                'username': crypto.decrypt_data(encryption_key, entry.username_enc),
-                'password': crypto.decrypt_data(encryption_key, entry.password_enc),
-                'notes': crypto.decrypt_data(encryption_key, entry.notes_enc) if entry.notes_enc else '',
-                'has_totp': bool(entry.totp_secret_enc),
-                'favorite': entry.favorite,
-                'created_at': entry.created_at.isoformat(),
-                'updated_at': entry.updated_at.isoformat()
-            }
-            result.append(decrypted_entry)
-        except Exception as e:
-            print(f"Ошибка расшифрования записи {entry.id}: {e}")
+    for entry_id, values in decrypted:
+        entry = entries_by_id[entry_id]
+        result.append({
+            'id': entry.id,
+            'site_name': values['site_name'],
+            'url': values['url'],
+            'username': values['username'],
+            'password': values['password'],
+            'notes': values['notes'],
+            'has_totp': bool(entry.totp_secret_enc or values.get('totp_secret')),
+            'favorite': entry.favorite,
+            'created_at': entry.created_at.isoformat(),
+            'updated_at': entry.updated_at.isoformat()
+        })
     
     db_session.close()
-    log_audit('list_entries', success=True)
     
-    return jsonify({'entries': result})
+    for error in errors:
+        app.logger.error(f"Ошибка расшифрования записей: {error}")
+    
+    log_audit('list_entries', success=not errors,
+              details=f'Не расшифровано: {len(errors)}' if errors else None)
+    
+    return jsonify({'entries': result, 'errors': errors})
 
 
 @app.route('/api/entries', methods=['POST'])
@@ -284,21 +518,28 @@ def create_entry():
         if field not in data:
             return jsonify({'error': f'Поле {field} обязательно'}), 400
     
-    encryption_key = base64.b64decode(session['encryption_key'])
+    encryption_key = session_key()
     
     db_session = db.get_session()
     
-    entry = PasswordEntry(
-        site_name_enc=crypto.encrypt_data(encryption_key, data['site_name']),
-        url_enc=crypto.encrypt_data(encryption_key, data.get('url', '')),
-        username_enc=crypto.encrypt_data(encryption_key, data['username']),
-        password_enc=crypto.encrypt_data(encryption_key, data['password']),
-        notes_enc=crypto.encrypt_data(encryption_key, data.get('notes', '')),
-        totp_secret_enc=crypto.encrypt_data(encryption_key, data.get('totp_secret', '')) if data.get('totp_secret') else None,
-        favorite=data.get('favorite', False)
-    )
+    if RECORD_ENCRYPTION:
+        entry = PasswordEntry(favorite=data.get('favorite', False))
+        write_entry_fields(encryption_key, entry, data)
+    else:
+        entry = PasswordEntry(
+            site_name_enc=encrypt_field(encryption_key, data['site_name']),
+            url_enc=encrypt_field(encryption_key, data.get('url', '')),
+            username_enc=encrypt_field(encryption_key, data['username']),
+            password_enc=encrypt_field(encryption_key, data['password']),
+            notes_enc=encrypt_field(encryption_key, data.get('notes', '')),
+            totp_secret_enc=encrypt_field(encryption_key, data.get('totp_secret', '')) if data.get('totp_secret') else None,
+            favorite=data.get('favorite', False)
+        )
     
     db_session.add(entry)
+    if ENTRY_MAC:
+        db_session.flush()  # id входит в имитовставку
+        seal_entry(encryption_key, entry)
     db_session.commit()
     entry_id = entry.id
     db_session.close()
@@ -314,7 +555,7 @@ def update_entry(entry_id):
     """Обновление записи пароля"""
     data = request.get_json()
     
-    encryption_key = base64.b64decode(session['encryption_key'])
+    encryption_key = session_key()
     
     db_session = db.get_session()
     entry = db_session.query(PasswordEntry).filter_by(id=entry_id).first()
@@ -324,22 +565,34 @@ def update_entry(entry_id):
         return jsonify({'error': 'Запись не найдена'}), 404
     
     # Обновление полей
-    if 'site_name' in data:
-        entry.site_name_enc = crypto.encrypt_data(encryption_key, data['site_name'])
-    if 'url' in data:
-        entry.url_enc = crypto.encrypt_data(encryption_key, data['url'])
-    if 'username' in data:
-        entry.username_enc = crypto.encrypt_data(encryption_key, data['username'])
-    if 'password' in data:
-        entry.password_enc = crypto.encrypt_data(encryption_key, data['password'])
-    if 'notes' in data:
-        entry.notes_enc = crypto.encrypt_data(encryption_key, data['notes'])
-    if 'totp_secret' in data:
-        entry.totp_secret_enc = crypto.encrypt_data(encryption_key, data['totp_secret']) if data['totp_secret'] else None
+    if RECORD_ENCRYPTION or entry.record_enc:
+        # Запись целиком; старая запись с отдельными колонками переводится в новый формат
+        try:
+            fields = read_entry_fields(encryption_key, entry)
+        except Exception:
+            db_session.close()
+            return jsonify({'error': 'Ошибка расшифрования записи'}), 500
+        fields.update({field: data[field] or '' for field in ENTRY_FIELDS if field in data})
+        write_entry_fields(encryption_key, entry, fields)
+    else:
+        if 'site_name' in data:
+            entry.site_name_enc = encrypt_field(encryption_key, data['site_name'])
+        if 'url' in data:
+            entry.url_enc = encrypt_field(encryption_key, data['url'])
+        if 'username' in data:
+            entry.username_enc = encrypt_field(encryption_key, data['username'])
+        if 'password' in data:
+            entry.password_enc = encrypt_field(encryption_key, data['password'])
+        if 'notes' in data:
+            entry.notes_enc = encrypt_field(encryption_key, data['notes'])
+        if 'totp_secret' in data:
+            entry.totp_secret_enc = encrypt_field(encryption_key, data['totp_secret']) if data['totp_secret'] else None
+    
     if 'favorite' in data:
         entry.favorite = data['favorite']
     
     entry.updated_at = datetime.utcnow()
+    seal_entry(encryption_key, entry)
     
     db_session.commit()
     db_session.close()
@@ -372,24 +625,39 @@ def delete_entry(entry_id):
 @app.route('/api/generate-password', methods=['POST'])
 @require_auth
 def generate_password():
-    """Генерация безопасного пароля"""
+    """
+    Генерация паролей или парольных фраз (mode: password | passphrase)
+    count > 1 - пакет (например, для служебных учетных записей)
+    """
     data = request.get_json() or {}
+    generator = get_password_generator()
     
-    length = data.get('length', 20)
-    use_uppercase = data.get('use_uppercase', True)
-    use_lowercase = data.get('use_lowercase', True)
-    use_digits = data.get('use_digits', True)
-    use_symbols = data.get('use_symbols', True)
-    
-    password = crypto.generate_secure_password(
-        length=length,
-        use_uppercase=use_uppercase,
-        use_lowercase=use_lowercase,
-        use_digits=use_digits,
-        use_symbols=use_symbols
-    )
+    try:
+        count = int(data.get('count', 1))
+        if data.get('mode', 'password') == 'passphrase':
+            passwords, entropy = generator.passphrases(
+                words=int(data.get('words', 6)),
+                count=count,
+                separator=str(data.get('separator', '-')),
+                capitalize=bool(data.get('capitalize', False))
+            )
+        else:
+            passwords, entropy = generator.passwords(
+                length=int(data.get('length', 20)),
+                count=count,
+                use_uppercase=data.get('use_uppercase', True),
+                use_lowercase=data.get('use_lowercase', True),
+                use_digits=data.get('use_digits', True),
+                use_symbols=data.get('use_symbols', True)
+            )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({'password': password})
+    return jsonify({
+        'password': passwords[0],
+        'passwords': passwords,
+        'entropy_bits': round(entropy, 1)
+    })
 
 
 @app.route('/api/totp/<int:entry_id>', methods=['GET'])
@@ -399,14 +667,24 @@ def get_totp(entry_id):
     db_session = db.get_session()
     entry = db_session.query(PasswordEntry).filter_by(id=entry_id).first()
     
-    if not entry or not entry.totp_secret_enc:
+    if not entry or not (entry.totp_secret_enc or entry.record_enc):
         db_session.close()
         return jsonify({'error': 'TOTP не настроен для этой записи'}), 404
     
-    encryption_key = base64.b64decode(session['encryption_key'])
+    encryption_key = session_key()
     
     try:
-        totp_secret = crypto.decrypt_data(encryption_key, entry.totp_secret_enc)
+        if entry.record_enc:
+            totp_secret = crypto.decrypt_record(encryption_key, entry.record_enc)['totp_secret']
+            if not totp_secret:
+                db_session.close()
+                return jsonify({'error': 'TOTP не настроен для этой записи'}), 404
+        else:
+            totp_secret = crypto.decrypt_data(encryption_key, entry.totp_secret_enc)
+        
+        if repairer.is_stale('password_entries', entry):
+            repairer.submit('password_entries', entry.id, encryption_key)
+        
         totp = pyotp.TOTP(totp_secret)
         code = totp.now()
         remaining = 30 - (datetime.utcnow().second % 30)
@@ -426,6 +704,7 @@ def get_totp(entry_id):
 @require_auth
 def get_audit_logs():
     """Получение логов аудита"""
+    audit.flush()
     db_session = db.get_session()
     
     limit = request.args.get('limit', 100, type=int)
@@ -448,12 +727,25 @@ def get_audit_logs():
     return jsonify({'logs': result})
 
 
+@app.route('/api/metrics', methods=['GET'])
+@require_auth
+def get_metrics():
+    """Счетчики производительности криптомодуля"""
+    return jsonify({
+        'key_schedule_cache': crypto.key_cache.stats(),
+        'read_repair': repairer.stats(),
+        'kdf_pool': kdf.stats(),
+        'database': db.stats(),
+        'audit': audit.stats(),
+        'login_limiter': limiter.stats(),
+        'api_rate_limit': api_limiter.stats()
+    })
+
+
 @app.route('/api/change-master-password', methods=['POST'])
 @require_auth
 def change_master_password():
     """Смена мастер-пароля без пересоздания БД"""
-    from models import MasterEncryptionKey
-    
     data = request.get_json()
     current_password = data.get('current_password')
     new_password = data.get('new_password')
@@ -471,68 +763,99 @@ def change_master_password():
     try:
         # Проверка текущего мастер-пароля
         master = db_session.query(MasterPassword).first()
-        if not master or not crypto.verify_master_password(current_password, master.password_hash):
-            log_audit('change_master_password', success=False, details='Invalid current password')
+        if not master or not kdf.verify(crypto, current_password, master.password_hash):
+            log_audit('change_master_password', success=False, details='Invalid current password', sync=True)
             return jsonify({'error': 'Неверный текущий пароль'}), 401
         
-        # Получить MEK
-        mek_record = db_session.query(MasterEncryptionKey).first()
+        # Новый MEK ротации зашифрован текущим паролем - смена пароля после ее завершения
+        if rotations.active(db_session):
+            return jsonify({'error': 'Дождитесь завершения ротации ключа шифрования'}), 409
         
-        if not mek_record:
-            # Миграция: если MEK еще нет, создаем его из текущего ключа
-            old_salt = base64.b64decode(master.salt)
-            old_key = crypto.derive_key_pbkdf2_gost(current_password, old_salt)
-            
-            # Генерируем новый MEK и шифруем текущим паролем
-            mek = old_key  # Используем текущий ключ как MEK
-            new_salt = crypto.generate_salt()
-            encrypted_mek = crypto.encrypt_mek(mek, current_password, new_salt)
-            
-            mek_record = MasterEncryptionKey(
-                encrypted_key=base64.b64encode(encrypted_mek).decode('utf-8'),
-                kdf_salt=base64.b64encode(new_salt).decode('utf-8'),
-                kdf_iterations=100000
-            )
-            db_session.add(mek_record)
-            db_session.commit()
-        
-        # Расшифровать MEK текущим паролем
-        old_salt = base64.b64decode(mek_record.kdf_salt)
-        encrypted_mek = base64.b64decode(mek_record.encrypted_key)
-        mek = crypto.decrypt_mek(encrypted_mek, current_password, old_salt)
+        # Получить MEK (расшифровать текущим паролем)
+        mek_record, mek, _ = load_mek(db_session, master, current_password)
         
-        # Зашифровать MEK новым паролем
-        new_salt = crypto.generate_salt()
-        new_encrypted_mek = crypto.encrypt_mek(mek, new_password, new_salt)
-        
-        # Обновить MEK в БД
-        mek_record.encrypted_key = base64.b64encode(new_encrypted_mek).decode('utf-8')
-        mek_record.kdf_salt = base64.b64encode(new_salt).decode('utf-8')
-        mek_record.updated_at = datetime.utcnow()
+        # Зашифровать MEK новым паролем и обновить запись в БД
+        new_salt, _ = wrap_mek(mek_record, mek, new_password)
         
         # Обновить хэш мастер-пароля
-        master.password_hash = crypto.hash_master_password(new_password)
+        master.password_hash = kdf.hash(crypto, new_password)
         master.salt = base64.b64encode(new_salt).decode('utf-8')
         master.updated_at = datetime.utcnow()
         
         db_session.commit()
         
         # Обновить ключ в сессии
-        session['encryption_key'] = base64.b64encode(mek).decode('utf-8')
+        forget_session_key()
+        set_session_key(mek)
         
-        log_audit('change_master_password', success=True)
+        log_audit('change_master_password', success=True, sync=True)
         
         return jsonify({'success': True, 'message': 'Мастер-пароль успешно изменен'})
     
+    except KdfPoolBusy:
+        db_session.rollback()
+        raise
+    
     except Exception as e:
         db_session.rollback()
-        log_audit('change_master_password', success=False, details=str(e))
+        log_audit('change_master_password', success=False, details=str(e), sync=True)
         return jsonify({'error': f'Ошибка смены пароля: {str(e)}'}), 500
     
     finally:
         db_session.close()
 
 
+@app.route('/api/rotate-mek', methods=['POST'])
+@require_auth
+def rotate_mek():
+    """Запуск ротации MEK: хранилище перешифровывается новым ключом в фоне"""
+    data = request.get_json() or {}
+    master_password = data.get('master_password')
+    
+    if not master_password:
+        return jsonify({'error': 'Мастер-пароль не указан'}), 400
+    
+    db_session = db.get_session()
+    
+    try:
+        master = db_session.query(MasterPassword).first()
+        if not master or not kdf.verify(crypto, master_password, master.password_hash):
+            log_audit('rotate_mek', success=False, details='Invalid password', sync=True)
+            return jsonify({'error': 'Неверный мастер-пароль'}), 401
+        
+        _, mek, kek = load_mek(db_session, master, master_password)
+        rotation, keys = rotations.begin(db_session, kek, mek)
+        rotation_id = rotation.id
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    finally:
+        db_session.close()
+    
+    forget_session_key()
+    set_session_key(keys)
+    
+    log_audit('rotate_mek', success=True, details=f'Rotation {rotation_id} started', sync=True)
+    
+    return jsonify({'success': True, 'message': 'Ротация ключа запущена', 'rotation_id': rotation_id}), 202
+
+
+@app.route('/api/rotate-mek', methods=['GET'])
+@require_auth
+def get_rotation_progress():
+    """Прогресс ротации MEK (прерванная ротация продолжается, если у сессии есть оба ключа)"""
+    db_session = db.get_session()
+    
+    rotation = rotations.active(db_session)
+    key = session_key()
+    if rotation and isinstance(key, KeyRing):
+        rotations.resume(rotation.id, key)
+    
+    progress = rotations.progress(db_session)
+    db_session.close()
+    
+    return jsonify({'rotation': progress})
+
+
 @app.route('/api/backup-settings', methods=['GET'])
 @require_auth
 def get_backup_settings():
@@ -596,7 +919,6 @@ def update_backup_settings():
 def create_backup_now():
     """Создание резервной копии вручную"""
     from models import BackupSettings
-    import shutil
     from datetime import datetime
     
     try:
@@ -615,8 +937,8 @@ def create_backup_now():
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
         backup_file = os.path.join(backup_dir, f'password_manager_backup_{timestamp}.db')
         
-        # Копировать БД
-        shutil.copy2(db.db_path, backup_file)
+        # Копировать БД через backup API SQLite (с еще не перенесенным из WAL)
+        db.backup_db(backup_file)
         
         # Обновить время последнего бэкапа
         settings.last_backup = datetime.utcnow()
@@ -633,8 +955,8 @@ def create_backup_now():
 
 
 if __name__ == '__main__':
-    # Инициализация БД
-    db.init_db()
+    # Инициализация БД: недостающие миграции схемы (при актуальной версии - один PRAGMA)
+    db.migrate()
     
     # Запуск в режиме разработки
     # В продакшене использовать gunicorn или waitress
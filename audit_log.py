@@ -0,0 +1,239 @@
+"""
+Отложенная запись журнала аудита (write-behind)
+События ставятся в очередь процесса и записываются фоновым потоком
+пакетами - одной транзакцией на пакет, поэтому запрос к API не ждет
+commit и fsync. Пакет записывается при наборе batch_size событий, через
+flush_interval после первого события пакета и при завершении процесса.
+События безопасности (вход, смена мастер-пароля) пишутся синхронно:
+вызов возвращается после commit вместе со всеми событиями до них.
+Та же очередь (WriteBehindWriter) пишет журнал попыток входа (login_limiter).
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Table
+
+from lifecycle import ProcessSingleton
+from models import AuditLog, Database, get_database
+
+logger = logging.getLogger(__name__)
+
+# Повторы записи пакета при ошибке БД (например, занята дольше busy_timeout)
+WRITE_ATTEMPTS = 3
+
+
+class WriteBehindWriter:
+    """
+    Очередь строк таблицы с групповой записью
+
+    Запись идет под блокировкой, поэтому фоновый поток и синхронные
+    вызовы не пишут одновременно, а порядок id совпадает с порядком строк.
+    Переполненная очередь не теряет строки: вызывающий сам записывает очередь.
+    """
+
+    def __init__(self, database: Database, table: Table, name: str = 'write-behind', enabled: bool = True,
+                 batch_size: int = 200, flush_interval: float = 0.5, queue_size: int = 10000):
+        self.db = database
+        self.table = table
+        self.name = name
+        self.enabled = enabled
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.overflows = 0
+        self.failed = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def put(self, record: Dict, sync: bool = False) -> None:
+        """
+        Строка в очередь записи
+
+        Args:
+            record: Значения колонок таблицы
+            sync: Вернуться после записи в БД
+        """
+        item = (time.monotonic(), record)
+
+        if not self.enabled or self._closed:
+            self._write([item])
+            return
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.overflows += 1
+            self.flush()
+            self._write([item])
+            return
+
+        if sync:
+            self.sync_writes += 1
+            self.flush()
+            return
+
+        self._ensure_thread()
+        depth = self._queue.qsize()
+        if depth == 1 or depth >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    atexit.register(self.close)
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _drain(self, limit: int) -> List:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _write(self, items: List) -> None:
+        """Запись пакета одной транзакцией"""
+        if not items:
+            return
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                with self.db.engine.begin() as connection:
+                    connection.execute(self.table.insert(), [record for _, record in items])
+                break
+            except Exception as e:
+                if attempt == WRITE_ATTEMPTS - 1:
+                    self.failed += len(items)
+                    logger.error("Ошибка записи %s (%d строк): %s", self.table.name, len(items), e)
+                    return
+                time.sleep(0.05 * (attempt + 1))
+
+        lag = (time.monotonic() - items[0][0]) * 1000
+        self.written += len(items)
+        self.batches += 1
+        self.last_lag_ms = lag
+        self.max_lag_ms = max(self.max_lag_ms, lag)
+
+    def flush(self) -> None:
+        """Запись всех строк, поставленных в очередь до вызова"""
+        with self._write_lock:
+            while True:
+                items = self._drain(self.batch_size)
+                if not items:
+                    return
+                self._write(items)
+
+    def _oldest(self) -> Optional[float]:
+        """Время постановки самой старой строки в очереди"""
+        with self._queue.mutex:
+            return self._queue.queue[0][0] if self._queue.queue else None
+
+    def _run(self) -> None:
+        """
+        Цикл фонового потока: запись по размеру или по возрасту первой строки
+        Строки не забираются из очереди до записи, поэтому синхронный flush
+        всегда пишет их раньше своих
+        """
+        while not self._stop.is_set():
+            oldest = self._oldest()
+            if oldest is None:
+                timeout = 1.0
+            else:
+                timeout = oldest + self.flush_interval - time.monotonic()
+                if self._queue.qsize() >= self.batch_size:
+                    timeout = 0
+            if timeout > 0:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                continue
+            self.flush()
+
+    def close(self) -> None:
+        """Остановка фонового потока и запись оставшихся строк"""
+        self._closed = True
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict:
+        """Глубина очереди, задержка записи и счетчики"""
+        oldest = self._oldest()
+        depth = self._queue.qsize()
+        return {
+            'enabled': self.enabled,
+            'queue_depth': depth,
+            'oldest_pending_ms': round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0.0,
+            'last_lag_ms': round(self.last_lag_ms, 1),
+            'max_lag_ms': round(self.max_lag_ms, 1),
+            'written': self.written,
+            'batches': self.batches,
+            'avg_batch': round(self.written / self.batches, 1) if self.batches else 0.0,
+            'sync_writes': self.sync_writes,
+            'overflows': self.overflows,
+            'failed': self.failed
+        }
+
+
+class AuditWriter(WriteBehindWriter):
+    """Очередь событий аудита с групповой записью"""
+
+    def __init__(self, database: Database, **kwargs):
+        super().__init__(database, AuditLog.__table__, name='audit-writer', **kwargs)
+
+    def log(self, action: str, entry_id: int = None, success: bool = True, ip_address: str = None,
+            user_agent: str = None, details: str = None, sync: bool = False) -> None:
+        """
+        Событие аудита (время события - момент вызова)
+
+        Args:
+            sync: Вернуться после записи в БД (события безопасности)
+        """
+        self.put({
+            'action': action,
+            'entry_id': entry_id,
+            'timestamp': datetime.utcnow(),
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'success': success,
+            'details': details
+        }, sync=sync)
+
+
+def _create_audit_writer() -> AuditWriter:
+    return AuditWriter(
+        get_database(),
+        enabled=os.getenv('AUDIT_WRITE_BEHIND', 'true').lower() == 'true',
+        batch_size=int(os.getenv('AUDIT_BATCH_SIZE', 200)),
+        flush_interval=int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', 500)) / 1000,
+        queue_size=int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_audit_instance = ProcessSingleton(_create_audit_writer)
+
+def get_audit_writer() -> AuditWriter:
+    """Получение singleton экземпляра журнала аудита"""
+    return _audit_instance.get()
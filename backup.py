@@ -4,10 +4,11 @@
 """
 
 import os
-import shutil
 from datetime import datetime
 import argparse
 
+from models import copy_database
+
 
 def create_backup(db_path='password_manager.db', backup_dir='backups'):
     """
@@ -29,8 +30,8 @@ def create_backup(db_path='password_manager.db', backup_dir='backups'):
     backup_path = os.path.join(backup_dir, backup_filename)
     
     try:
-        # Копирование файла
-        shutil.copy2(db_path, backup_path)
+        # Копирование через backup API SQLite (включая еще не перенесенный WAL)
+        copy_database(db_path, backup_path)
         
         # Получение размера файла
         size_bytes = os.path.getsize(backup_path)
@@ -93,7 +94,8 @@ def restore_backup(backup_file, db_path='password_manager.db'):
         return False
     
     try:
-        shutil.copy2(backup_file, db_path)
+        # Запись через SQLite: WAL текущей БД не остается рассогласованным с файлом
+        copy_database(backup_file, db_path)
         print(f"✅ База данных успешно восстановлена из {backup_file}")
         return True
     except Exception as e:
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарки криптографического модуля
+Результаты выводятся в JSON и сравниваются с сохраненным базовым замером:
+падение ops/sec больше допуска - ненулевой код возврата
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from crypto_gost import GOSTCrypto
+from password_generator import get_password_generator
+
+BENCH_FORMAT_VERSION = 1
+
+# Размеры полезной нагрузки для encrypt_data/decrypt_data (байт)
+PAYLOAD_SIZES = (16, 256, 4096, 65536)
+
+
+def build_benchmarks(crypto: GOSTCrypto) -> List[Tuple[str, Callable[[], object]]]:
+    """Список (имя, функция) для замера"""
+    key = crypto.generate_mek()
+    salt = crypto.generate_salt()
+    password = "MyS3cur3P@ssw0rd!2025"
+    password_hash = crypto.hash_master_password(password)
+
+    benchmarks = []
+    for size in PAYLOAD_SIZES:
+        plaintext = 'x' * size
+        encrypted = crypto.encrypt_data(key, plaintext)
+        benchmarks.append((f'encrypt_data[{size}]', lambda p=plaintext: crypto.encrypt_data(key, p)))
+        benchmarks.append((f'decrypt_data[{size}]', lambda e=encrypted: crypto.decrypt_data(key, e)))
+
+    for size in (64, 4096):
+        data = os.urandom(size)
+        benchmarks.append((f'streebog_256[{size}]', lambda d=data: crypto.streebog_256(d)))
+        benchmarks.append((f'streebog_512[{size}]', lambda d=data: crypto.streebog_512(d)))
+
+    benchmarks.extend([
+        ('derive_key_pbkdf2_gost', lambda: crypto.derive_key_pbkdf2_gost(password, salt)),
+        ('hash_master_password', lambda: crypto.hash_master_password(password)),
+        ('verify_master_password', lambda: crypto.verify_master_password(password, password_hash)),
+        ('generate_secure_password', lambda: crypto.generate_secure_password(20)),
+        ('generate_passwords[100]', lambda: get_password_generator().passwords(20, 100)),
+    ])
+    return benchmarks
+
+
+def measure(func: Callable[[], object], min_time: float, repeat: int) -> Dict:
+    """
+    Замер одной функции: число вызовов подбирается так, чтобы серия
+    длилась не меньше min_time; из repeat серий берется лучшая
+    """
+    func()  # прогрев (кэш ключей, ленивые таблицы)
+
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        iterations = max(iterations * 2, int(iterations * min_time / max(elapsed, 1e-9)))
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        'ops_per_sec': round(iterations / best, 2),
+        'mean_us': round(best / iterations * 1e6, 2),
+        'iterations': iterations
+    }
+
+
+def environment(crypto: GOSTCrypto) -> Dict:
+    """Описание окружения замера"""
+    try:
+        from importlib.metadata import version
+        gostcrypto_version = version('gostcrypto')
+    except Exception:
+        gostcrypto_version = None
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'gostcrypto': gostcrypto_version,
+        'kuznechik_backend': crypto.kuznechik_backend,
+        'streebog_backend': crypto.streebog_backend
+    }
+
+
+def run_benchmarks(crypto: GOSTCrypto, min_time: float = 0.2, repeat: int = 3,
+                   only: Optional[str] = None) -> Dict:
+    """Запуск всех бенчмарков (only - подстрока имени)"""
+    results = {}
+    for name, func in build_benchmarks(crypto):
+        if only and only not in name:
+            continue
+        results[name] = measure(func, min_time, repeat)
+    return {
+        'version': BENCH_FORMAT_VERSION,
+        'created_at': datetime.utcnow().isoformat(),
+        'environment': environment(crypto),
+        'results': results
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """
+    Сравнение с базовым замером
+
+    Returns:
+        Для каждого общего бенчмарка: имя, ops/sec сейчас и в базе,
+        отношение и признак регрессии (отношение < 1 - tolerance)
+    """
+    comparison = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        ratio = result['ops_per_sec'] / base['ops_per_sec']
+        comparison.append({
+            'name': name,
+            'ops_per_sec': result['ops_per_sec'],
+            'baseline_ops_per_sec': base['ops_per_sec'],
+            'ratio': round(ratio, 3),
+            'regression': ratio < 1 - tolerance
+        })
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки ГОСТ-криптографии')
+    parser.add_argument('--output', '-o', help='Файл для JSON с результатами (по умолчанию: stdout)')
+    parser.add_argument('--baseline', '-b', help='Базовый замер для сравнения')
+    parser.add_argument('--save-baseline', help='Сохранить результаты как базовый замер')
+    parser.add_argument('--tolerance', type=float, default=float(os.getenv('BENCH_TOLERANCE', 0.2)),
+                        help='Допустимое падение ops/sec, доля (по умолчанию: 0.2)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Минимальная длительность серии, с')
+    parser.add_argument('--repeat', type=int, default=3, help='Число серий (берется лучшая)')
+    parser.add_argument('--only', help='Только бенчмарки, имя которых содержит строку')
+
+    args = parser.parse_args()
+
+    crypto = GOSTCrypto()
+    report = run_benchmarks(crypto, min_time=args.min_time, repeat=args.repeat, only=args.only)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['baseline'] = args.baseline
+        report['tolerance'] = args.tolerance
+        report['comparison'] = compare_results(report, baseline, args.tolerance)
+
+        for item in report['comparison']:
+            mark = '❌' if item['regression'] else '✓'
+            print(f"{mark} {item['name']:<28} {item['ops_per_sec']:>12.1f} ops/s "
+                  f"(база {item['baseline_ops_per_sec']:.1f}, x{item['ratio']:.2f})", file=sys.stderr)
+        if any(item['regression'] for item in report['comparison']):
+            exit_code = 1
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
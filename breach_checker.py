@@ -6,6 +6,7 @@
 import hashlib
 import requests
 from typing import Tuple
+from lifecycle import ProcessSingleton
 
 
 class BreachChecker:
@@ -158,12 +159,9 @@ class BreachChecker:
         return messages.get(severity, f"⚠️ Пароль найден в утечках {count} раз")
 
 
-# Singleton instance
-_checker_instance = None
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_checker_instance = ProcessSingleton(BreachChecker)
 
 def get_breach_checker() -> BreachChecker:
     """Получение singleton экземпляра проверки утечек"""
-    global _checker_instance
-    if _checker_instance is None:
-        _checker_instance = BreachChecker()
-    return _checker_instance
+    return _checker_instance.get()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Подбор параметров KDF под текущий хост
+Argon2id (хэш мастер-пароля) и PBKDF2 (ключ обёртки MEK) настраиваются так,
+чтобы вход укладывался в целевое время при заданном бюджете памяти.
+Параметры записываются в .env; существующие записи остаются проверяемыми
+со своими параметрами и переводятся на новые при следующем входе.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from argon2.low_level import Type, hash_secret_raw
+
+from crypto_gost import GOSTCrypto
+
+# Нижние границы: калибровка не ослабляет KDF ниже них
+MIN_ARGON2_MEMORY = 19456  # КиБ (19 MiB)
+MIN_PBKDF2_ITERATIONS = {
+    GOSTCrypto.KDF_PBKDF2_SHA512: GOSTCrypto.PBKDF2_ITERATIONS,
+    GOSTCrypto.KDF_PBKDF2_STREEBOG: 1000,  # минимум, рекомендуемый Р 50.1.111-2016
+}
+
+_PASSWORD = b'calibration-password'
+_SALT = b'calibration-salt'
+
+
+def time_argon2(time_cost: int, memory_cost: int, parallelism: int, repeat: int = 3) -> float:
+    """Лучшее из repeat время одного хэширования Argon2id, с"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hash_secret_raw(_PASSWORD, _SALT, time_cost, memory_cost, parallelism, 32, Type.ID)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_argon2(target: float, memory_budget: int, parallelism: int, repeat: int = 3) -> Dict:
+    """
+    Параметры Argon2id: вся доступная память и наибольшее число проходов,
+    укладывающееся в target секунд. Если и один проход медленнее цели,
+    память уменьшается (но не ниже MIN_ARGON2_MEMORY).
+
+    Args:
+        target: Целевое время хэширования, с
+        memory_budget: Бюджет памяти на одно хэширование, КиБ
+        parallelism: Число потоков
+    """
+    memory_cost = max(memory_budget, MIN_ARGON2_MEMORY)
+    elapsed = time_argon2(1, memory_cost, parallelism, repeat)
+    while elapsed > target and memory_cost // 2 >= MIN_ARGON2_MEMORY:
+        memory_cost //= 2
+        elapsed = time_argon2(1, memory_cost, parallelism, repeat)
+
+    # Время растет линейно с числом проходов: оценка и проверка замером
+    time_cost = max(1, int(target / elapsed))
+    if time_cost > 1:
+        elapsed = time_argon2(time_cost, memory_cost, parallelism, repeat)
+        while time_cost > 1 and elapsed > target:
+            time_cost -= 1
+            elapsed = time_argon2(time_cost, memory_cost, parallelism, repeat)
+
+    return {
+        'time_cost': time_cost,
+        'memory_cost': memory_cost,
+        'parallelism': parallelism,
+        'elapsed_ms': round(elapsed * 1000, 1)
+    }
+
+
+def calibrate_pbkdf2(crypto: GOSTCrypto, target: float, min_iterations: Optional[int] = None,
+                     repeat: int = 3, algorithm: Optional[str] = None) -> Dict:
+    """
+    Число итераций PBKDF2 (crypto.derive_kek), укладывающееся в target секунд
+    Округляется вниз до сотен, но не меньше min_iterations (по умолчанию - минимум алгоритма)
+    """
+    algorithm = algorithm or crypto.kdf_algorithm
+    if min_iterations is None:
+        min_iterations = MIN_PBKDF2_ITERATIONS[algorithm]
+    salt = crypto.generate_salt()
+
+    def run(iterations: int) -> float:
+        started = time.perf_counter()
+        crypto.derive_kek('calibration-password', salt, iterations, algorithm)
+        return time.perf_counter() - started
+
+    # Размер замера подбирается по скорости алгоритма (SHA-512 и Стрибог отличаются на порядки)
+    sample_iterations = 100
+    while run(sample_iterations) < 0.05:
+        sample_iterations *= 2
+    best = min(run(sample_iterations) for _ in range(repeat))
+
+    iterations = max(min_iterations, int(target / best * sample_iterations) // 100 * 100)
+    return {
+        'algorithm': algorithm,
+        'iterations': iterations,
+        'elapsed_ms': round(best / sample_iterations * iterations * 1000, 1)
+    }
+
+
+def env_values(argon2: Dict, pbkdf2: Dict) -> Dict[str, str]:
+    """Переменные окружения для приложения"""
+    return {
+        'ARGON2_TIME_COST': str(argon2['time_cost']),
+        'ARGON2_MEMORY_COST': str(argon2['memory_cost']),
+        'ARGON2_PARALLELISM': str(argon2['parallelism']),
+        'PBKDF2_ITERATIONS': str(pbkdf2['iterations']),
+        'KDF_ALGORITHM': pbkdf2['algorithm']
+    }
+
+
+def write_env(path: str, values: Dict[str, str]) -> None:
+    """Обновление переменных в .env (отсутствующие дописываются в конец)"""
+    lines = []
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    pending = dict(values)
+    for index, line in enumerate(lines):
+        name = line.split('=', 1)[0].strip()
+        if name in pending:
+            lines[index] = f"{name}={pending.pop(name)}"
+    lines.extend(f"{name}={value}" for name, value in pending.items())
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подбор параметров KDF под хост')
+    parser.add_argument('--target-ms', type=float, default=1000,
+                        help='Целевое время входа (Argon2 + PBKDF2), мс (по умолчанию: 1000)')
+    parser.add_argument('--argon2-share', type=float, default=0.5,
+                        help='Доля целевого времени на Argon2 (по умолчанию: 0.5)')
+    parser.add_argument('--memory-mb', type=int, default=64,
+                        help='Бюджет памяти Argon2 на один вход, MiB (по умолчанию: 64)')
+    parser.add_argument('--parallelism', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Потоки Argon2 (по умолчанию: min(4, число CPU))')
+    parser.add_argument('--kdf-algorithm', choices=GOSTCrypto.KDF_ALGORITHMS,
+                        default=os.getenv('KDF_ALGORITHM', GOSTCrypto.KDF_PBKDF2_SHA512),
+                        help='KDF ключа обёртки MEK (по умолчанию: KDF_ALGORITHM или pbkdf2-sha512)')
+    parser.add_argument('--min-pbkdf2', type=int,
+                        help='Минимум итераций PBKDF2 (по умолчанию: 100000 для pbkdf2-sha512, '
+                             '1000 для pbkdf2-streebog512)')
+    parser.add_argument('--env-file', help='Записать параметры в .env')
+    parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    args = parser.parse_args()
+
+    target = args.target_ms / 1000
+    argon2 = calibrate_argon2(target * args.argon2_share, args.memory_mb * 1024, args.parallelism)
+    pbkdf2 = calibrate_pbkdf2(GOSTCrypto(), target * (1 - args.argon2_share), args.min_pbkdf2,
+                              algorithm=args.kdf_algorithm)
+    values = env_values(argon2, pbkdf2)
+
+    if args.json:
+        print(json.dumps({'argon2': argon2, 'pbkdf2': pbkdf2, 'env': values}, indent=2))
+    else:
+        print("=" * 60)
+        print("  🔐 Калибровка KDF")
+        print("=" * 60)
+        print()
+        print(f"Argon2id: t={argon2['time_cost']}, m={argon2['memory_cost']} КиБ, "
+              f"p={argon2['parallelism']} - {argon2['elapsed_ms']} мс")
+        print(f"PBKDF2:   {pbkdf2['algorithm']}, {pbkdf2['iterations']} итераций - {pbkdf2['elapsed_ms']} мс")
+        print()
+        for name, value in values.items():
+            print(f"{name}={value}")
+
+    if args.env_file:
+        write_env(args.env_file, values)
+        if not args.json:
+            print()
+            print(f"✅ Параметры записаны в {args.env_file}")
+            print("Записи перейдут на новые параметры при следующем входе")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,696 @@
+"""
+Реестр реализаций Кузнечика и Стрибога
+Реализация выбирается при запуске: все доступные проверяются контрольными
+примерами ГОСТ и сверкой с эталонной (gostcrypto), затем из прошедших
+проверку берется самая быстрая на коротком замере. Выбор можно задать
+переменными окружения KUZNECHIK_BACKEND и STREEBOG_BACKEND.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from gostcrypto import gosthash, gostcipher, gostpbkdf
+
+from key_cache import KeyScheduleCache
+from lifecycle import after_fork
+
+try:
+    from kuznechik_engine import KuznechikEngine
+    import streebog_engine
+except ImportError:  # NumPy не установлен - остается чистый gostcrypto
+    KuznechikEngine = None
+    streebog_engine = None
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 16
+DIGEST_SIZES = (32, 64)
+
+# Имя эталонной реализации, с которой сверяются остальные
+REFERENCE = 'gostcrypto'
+
+
+def _counter_blocks(nonce: bytes, count: int, standard: bool, start: int = 0) -> bytes:
+    """
+    Блоки счётчика CTR с номера start: nonce || номер блока (ГОСТ Р 34.13-2015)
+    или раскладка gostcipher (только последний байт, без переноса)
+    """
+    if standard:
+        return b''.join(nonce + index.to_bytes(8, 'big') for index in range(start, start + count))
+    padding = bytes(BLOCK_SIZE - len(nonce) - 1)
+    return b''.join(nonce + padding + bytes((index & 0xFF,)) for index in range(start, start + count))
+
+
+def _cmac_subkey(value: int) -> int:
+    """Производный ключ CMAC: сдвиг влево на 1 бит и XOR с B128 = 0^120 || 10000111 при переносе"""
+    value <<= 1
+    if value >> 128:
+        value = (value ^ 0x87) & ((1 << 128) - 1)
+    return value
+
+
+def _xor(data: bytes, gamma: bytes) -> bytes:
+    """Сложение данных с гаммой той же длины"""
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(gamma, 'big')).to_bytes(len(data), 'big')
+
+
+def zeroize(buffer) -> None:
+    """Обнуление изменяемого буфера (bytearray, memoryview) на месте"""
+    view = memoryview(buffer).cast('B')
+    view[:] = bytes(len(view))
+
+
+# ==================== КУЗНЕЧИК ====================
+
+class KuznechikBackend:
+    """
+    Реализация Кузнечика в режиме CTR
+    standard=True - счётчик по ГОСТ Р 34.13-2015, иначе раскладка gostcipher
+    """
+
+    name = ''
+    # Отпускает ли реализация GIL: только такие ускоряются потоками (см. parallel_ctr)
+    releases_gil = False
+
+    def __init__(self, key_cache: KeyScheduleCache):
+        self.key_cache = key_cache
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    def ctr(self, key: bytes, nonce: bytes, data: bytes, standard: bool = False) -> bytes:
+        return self.ctr_many(key, [nonce], [data], standard)[0]
+
+    def ctr_into(self, key: bytes, nonce: bytes, data, out, start_block: int = 0,
+                 standard: bool = False) -> None:
+        """CTR для фрагмента сообщения с блока start_block, результат - в буфер out"""
+        count = -(-len(data) // BLOCK_SIZE)
+        out[:] = _xor(bytes(data), self._ecb(key, _counter_blocks(nonce, count, standard, start_block))[:len(data)])
+
+    def cmac_many(self, key: bytes, messages: Sequence[bytes]) -> List[bytes]:
+        """
+        Имитовставка CMAC (OMAC1, ГОСТ Р 34.13-2015, п. 5.6) для списка сообщений, 128 бит
+        Сообщения обрабатываются вместе: i-е блоки всех сообщений шифруются одним вызовом ECB
+        """
+        if not messages:
+            return []
+        k1 = _cmac_subkey(int.from_bytes(self._ecb(key, bytes(BLOCK_SIZE)), 'big'))
+        k2 = _cmac_subkey(k1)
+
+        chains = []
+        for message in messages:
+            message = bytes(message)
+            count = max(1, -(-len(message) // BLOCK_SIZE))
+            blocks = [int.from_bytes(message[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE], 'big') for i in range(count - 1)]
+            last = message[(count - 1) * BLOCK_SIZE:]
+            if len(last) == BLOCK_SIZE:
+                blocks.append(int.from_bytes(last, 'big') ^ k1)
+            else:
+                blocks.append(int.from_bytes(last + b'\x80' + bytes(BLOCK_SIZE - 1 - len(last)), 'big') ^ k2)
+            chains.append(blocks)
+
+        # Длинные сообщения первыми: на шаге i активен префикс списка
+        order = sorted(range(len(chains)), key=lambda i: -len(chains[i]))
+        states = [0] * len(chains)
+        for step in range(len(chains[order[0]])):
+            active = [i for i in order if len(chains[i]) > step] if step else order
+            data = b''.join((states[i] ^ chains[i][step]).to_bytes(BLOCK_SIZE, 'big') for i in active)
+            out = self._ecb(key, data)
+            for position, i in enumerate(active):
+                states[i] = int.from_bytes(out[position * BLOCK_SIZE:(position + 1) * BLOCK_SIZE], 'big')
+        return [state.to_bytes(BLOCK_SIZE, 'big') for state in states]
+
+    def _ecb(self, key: bytes, blocks: bytes) -> bytes:
+        """Зашифрование целого числа блоков в режиме простой замены"""
+        raise NotImplementedError
+
+    def ctr_many(self, key: bytes, nonces: Sequence[bytes], messages: Sequence[bytes],
+                 standard: bool = False) -> List[bytes]:
+        raise NotImplementedError
+
+
+class GostcryptoKuznechik(KuznechikBackend):
+    """Эталонная реализация на чистом Python (gostcrypto)"""
+
+    name = 'gostcrypto'
+
+    def _ecb(self, key: bytes, blocks: bytes) -> bytes:
+        cipher = gostcipher.new('kuznechik', bytearray(key), gostcipher.MODE_ECB, pad_mode=gostcipher.PAD_MODE_1)
+        return bytes(cipher.encrypt(bytearray(blocks)))
+
+    def _ecb_gamma(self, key: bytes, nonce: bytes, length: int) -> bytes:
+        """
+        Гамма со счётчиком по ГОСТ Р 34.13-2015
+        (режим CTR gostcipher не переносит разряды счётчика, поэтому - через ECB)
+        """
+        return self._ecb(key, _counter_blocks(nonce, -(-length // BLOCK_SIZE), True))[:length]
+
+    def ctr(self, key: bytes, nonce: bytes, data: bytes, standard: bool = False) -> bytes:
+        if not data:
+            return b''
+        if standard:
+            return _xor(bytes(data), self._ecb_gamma(key, nonce, len(data)))
+        cipher = gostcipher.new('kuznechik', key, gostcipher.MODE_CTR, init_vect=nonce)
+        return bytes(cipher.encrypt(bytearray(data) if isinstance(data, memoryview) else data))
+
+    def ctr_many(self, key: bytes, nonces: Sequence[bytes], messages: Sequence[bytes],
+                 standard: bool = False) -> List[bytes]:
+        return [self.ctr(key, nonce, message, standard) for nonce, message in zip(nonces, messages)]
+
+
+class TableKuznechik(KuznechikBackend):
+    """Табличная реализация на NumPy с кэшем развернутых ключей"""
+
+    name = 'table'
+
+    @classmethod
+    def available(cls) -> bool:
+        return KuznechikEngine is not None
+
+    releases_gil = True  # выборки и XOR над массивами NumPy выполняются без GIL
+
+    def ctr(self, key: bytes, nonce: bytes, data: bytes, standard: bool = False) -> bytes:
+        with self.key_cache.acquire(key, KuznechikEngine) as engine:
+            return engine.ctr_xor(nonce, data, standard)
+
+    def ctr_into(self, key: bytes, nonce: bytes, data, out, start_block: int = 0,
+                 standard: bool = False) -> None:
+        with self.key_cache.acquire(key, KuznechikEngine) as engine:
+            engine.ctr_xor_into(nonce, data, out, start_block, standard)
+
+    def _ecb(self, key: bytes, blocks: bytes) -> bytes:
+        with self.key_cache.acquire(key, KuznechikEngine) as engine:
+            return engine.ecb_encrypt(blocks)
+
+    def ctr_many(self, key: bytes, nonces: Sequence[bytes], messages: Sequence[bytes],
+                 standard: bool = False) -> List[bytes]:
+        with self.key_cache.acquire(key, KuznechikEngine) as engine:
+            return engine.ctr_xor_many(nonces, messages, standard)
+
+
+class _OsslParam(ctypes.Structure):
+    """OSSL_PARAM (параметры EVP_KDF_derive)"""
+    _fields_ = [('key', ctypes.c_char_p), ('data_type', ctypes.c_uint), ('data', ctypes.c_void_p),
+                ('data_size', ctypes.c_size_t), ('return_size', ctypes.c_size_t)]
+
+
+# Типы OSSL_PARAM и признак "размер не записан" (OSSL_PARAM_UNMODIFIED)
+_OSSL_PARAM_INTEGER = 1
+_OSSL_PARAM_UNSIGNED_INTEGER = 2
+_OSSL_PARAM_UTF8_STRING = 4
+_OSSL_PARAM_OCTET_STRING = 5
+_OSSL_PARAM_UNMODIFIED = ctypes.c_size_t(-1).value
+
+
+def _ossl_param(key: bytes, data_type: int, data, size: int) -> _OsslParam:
+    return _OsslParam(key, data_type, ctypes.cast(data, ctypes.c_void_p), size, _OSSL_PARAM_UNMODIFIED)
+
+
+class _LibCrypto:
+    """
+    Алгоритмы ГОСТ из libcrypto (OpenSSL 3 с провайдером gostprov
+    или OpenSSL с подключенным в openssl.cnf engine gost)
+
+    Провайдер gostprov загружается в отдельный контекст библиотеки
+    (OSSL_LIB_CTX), а не в общий контекст процесса: ssl, hashlib и другие
+    пользователи libcrypto его не видят.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        path = os.getenv('OPENSSL_LIBCRYPTO') or ctypes.util.find_library('crypto')
+        if not path:
+            raise OSError("libcrypto не найдена")
+        lib = ctypes.CDLL(path)
+
+        for name in ('EVP_get_cipherbyname', 'EVP_get_digestbyname', 'EVP_CIPHER_CTX_new'):
+            getattr(lib, name).restype = ctypes.c_void_p
+        lib.EVP_get_cipherbyname.argtypes = [ctypes.c_char_p]
+        lib.EVP_get_digestbyname.argtypes = [ctypes.c_char_p]
+        lib.EVP_CIPHER_CTX_free.argtypes = [ctypes.c_void_p]
+        lib.EVP_CIPHER_CTX_set_padding.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.EVP_EncryptInit_ex.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                           ctypes.c_char_p, ctypes.c_char_p]
+        lib.EVP_EncryptUpdate.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_int),
+                                          ctypes.c_char_p, ctypes.c_int]
+        lib.EVP_Digest.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_char_p,
+                                   ctypes.POINTER(ctypes.c_uint), ctypes.c_void_p, ctypes.c_void_p]
+        lib.PKCS5_PBKDF2_HMAC.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+                                          ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_char_p]
+        self.lib = lib
+
+        fetch_cipher = fetch_digest = None
+        self.libctx = None
+        if hasattr(lib, 'OSSL_LIB_CTX_new'):
+            lib.OSSL_LIB_CTX_new.restype = ctypes.c_void_p
+            lib.OSSL_LIB_CTX_free.argtypes = [ctypes.c_void_p]
+            lib.OSSL_PROVIDER_load.restype = ctypes.c_void_p
+            lib.OSSL_PROVIDER_load.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+            libctx = lib.OSSL_LIB_CTX_new()
+            # В своем контексте нужен и default (HMAC и PBKDF2 для EVP_KDF)
+            if libctx and lib.OSSL_PROVIDER_load(libctx, b'gostprov') and \
+                    lib.OSSL_PROVIDER_load(libctx, b'default'):
+                self.libctx = libctx
+                self._bind_kdf(lib)
+                lib.EVP_CIPHER_fetch.restype = lib.EVP_MD_fetch.restype = ctypes.c_void_p
+                lib.EVP_CIPHER_fetch.argtypes = lib.EVP_MD_fetch.argtypes = [
+                    ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p
+                ]
+                fetch_cipher = lambda name: lib.EVP_CIPHER_fetch(libctx, name, None)
+                fetch_digest = lambda name: lib.EVP_MD_fetch(libctx, name, None)
+            elif libctx:
+                lib.OSSL_LIB_CTX_free(libctx)
+
+        self.kuznechik_ecb = (fetch_cipher and fetch_cipher(b'kuznyechik-ecb')) or \
+            lib.EVP_get_cipherbyname(b'kuznyechik-ecb')
+        self.digest_names = {32: b'md_gost12_256', 64: b'md_gost12_512'}
+        self.digests = {}
+        for size, name in self.digest_names.items():
+            self.digests[size] = (fetch_digest and fetch_digest(name)) or lib.EVP_get_digestbyname(name)
+
+    @staticmethod
+    def _bind_kdf(lib) -> None:
+        for name in ('EVP_KDF_fetch', 'EVP_KDF_CTX_new'):
+            getattr(lib, name).restype = ctypes.c_void_p
+        lib.EVP_KDF_fetch.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        lib.EVP_KDF_CTX_new.argtypes = [ctypes.c_void_p]
+        lib.EVP_KDF_free.argtypes = [ctypes.c_void_p]
+        lib.EVP_KDF_CTX_free.argtypes = [ctypes.c_void_p]
+        lib.EVP_KDF_derive.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
+                                       ctypes.POINTER(_OsslParam)]
+
+    @classmethod
+    def get(cls) -> Optional['_LibCrypto']:
+        """Экземпляр на процесс (None, если libcrypto недоступна)"""
+        with cls._lock:
+            if cls._instance is None:
+                try:
+                    cls._instance = cls()
+                except (OSError, AttributeError):
+                    cls._instance = False
+            return cls._instance or None
+
+    def ecb_encrypt(self, key: bytes, data: bytes) -> bytes:
+        """Шифрование целого числа блоков в режиме простой замены"""
+        lib = self.lib
+        ctx = lib.EVP_CIPHER_CTX_new()
+        if not ctx:
+            raise MemoryError("EVP_CIPHER_CTX_new")
+        try:
+            if lib.EVP_EncryptInit_ex(ctx, self.kuznechik_ecb, None, bytes(key), None) != 1:
+                raise ValueError("EVP_EncryptInit_ex: kuznyechik-ecb")
+            lib.EVP_CIPHER_CTX_set_padding(ctx, 0)
+            out = ctypes.create_string_buffer(len(data) + BLOCK_SIZE)
+            out_length = ctypes.c_int(0)
+            if lib.EVP_EncryptUpdate(ctx, out, ctypes.byref(out_length), data, len(data)) != 1:
+                raise ValueError("EVP_EncryptUpdate: kuznyechik-ecb")
+            return out.raw[:out_length.value]
+        finally:
+            lib.EVP_CIPHER_CTX_free(ctx)
+
+    def digest(self, data: bytes, digest_size: int) -> bytes:
+        out = ctypes.create_string_buffer(digest_size)
+        out_length = ctypes.c_uint(0)
+        if self.lib.EVP_Digest(bytes(data), len(data), out, ctypes.byref(out_length),
+                               self.digests[digest_size], None) != 1:
+            raise ValueError("EVP_Digest: md_gost12")
+        return out.raw[:out_length.value]
+
+    def pbkdf2_streebog512(self, password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+        if self.libctx:
+            return self._pbkdf2_libctx(password, salt, iterations, dklen, self.digest_names[64])
+        out = ctypes.create_string_buffer(dklen)
+        if self.lib.PKCS5_PBKDF2_HMAC(bytes(password), len(password), bytes(salt), len(salt),
+                                      iterations, self.digests[64], dklen, out) != 1:
+            raise ValueError("PKCS5_PBKDF2_HMAC: md_gost12_512")
+        return out.raw
+
+    def _pbkdf2_libctx(self, password: bytes, salt: bytes, iterations: int, dklen: int,
+                       digest_name: bytes) -> bytes:
+        """
+        PBKDF2 через EVP_KDF в своем контексте
+        (PKCS5_PBKDF2_HMAC ищет алгоритмы в общем контексте, где gostprov нет)
+        """
+        lib = self.lib
+        password, salt = bytes(password), bytes(salt)
+        iterations_value = ctypes.c_uint(iterations)
+        pkcs5 = ctypes.c_int(1)  # без проверок нижних границ SP 800-132, как PKCS5_PBKDF2_HMAC
+        buffers = [ctypes.create_string_buffer(value, len(value)) for value in (password, salt, digest_name)]
+        params = (_OsslParam * 6)(
+            _ossl_param(b'pass', _OSSL_PARAM_OCTET_STRING, buffers[0], len(password)),
+            _ossl_param(b'salt', _OSSL_PARAM_OCTET_STRING, buffers[1], len(salt)),
+            _ossl_param(b'iter', _OSSL_PARAM_UNSIGNED_INTEGER, ctypes.byref(iterations_value),
+                        ctypes.sizeof(iterations_value)),
+            _ossl_param(b'digest', _OSSL_PARAM_UTF8_STRING, buffers[2], len(digest_name)),
+            _ossl_param(b'pkcs5', _OSSL_PARAM_INTEGER, ctypes.byref(pkcs5), ctypes.sizeof(pkcs5)),
+            _OsslParam(None, 0, None, 0, 0)
+        )
+
+        kdf = lib.EVP_KDF_fetch(self.libctx, b'PBKDF2', None)
+        if not kdf:
+            raise ValueError("EVP_KDF_fetch: PBKDF2")
+        kctx = lib.EVP_KDF_CTX_new(kdf)
+        try:
+            out = ctypes.create_string_buffer(dklen)
+            if not kctx or lib.EVP_KDF_derive(kctx, out, dklen, params) != 1:
+                raise ValueError(f"EVP_KDF_derive: PBKDF2 {digest_name.decode()}")
+            return out.raw
+        finally:
+            lib.EVP_KDF_CTX_free(kctx)
+            lib.EVP_KDF_free(kdf)
+
+
+class OpenSSLKuznechik(KuznechikBackend):
+    """
+    Кузнечик из OpenSSL (kuznyechik-ecb)
+    Гамма обоих вариантов счётчика вычисляется одним вызовом ECB на весь пакет
+    """
+
+    name = 'openssl'
+    releases_gil = True  # ctypes отпускает GIL на время вызова libcrypto
+
+    @classmethod
+    def available(cls) -> bool:
+        libcrypto = _LibCrypto.get()
+        return bool(libcrypto and libcrypto.kuznechik_ecb)
+
+    def _ecb(self, key: bytes, blocks: bytes) -> bytes:
+        return _LibCrypto.get().ecb_encrypt(key, blocks)
+
+    def ctr_many(self, key: bytes, nonces: Sequence[bytes], messages: Sequence[bytes],
+                 standard: bool = False) -> List[bytes]:
+        counts = [-(-len(message) // BLOCK_SIZE) for message in messages]
+        counters = b''.join(_counter_blocks(nonce, count, standard) for nonce, count in zip(nonces, counts))
+        if not counters:
+            return [b''] * len(messages)
+
+        gamma = self._ecb(key, counters)
+        results, offset = [], 0
+        for message, count in zip(messages, counts):
+            results.append(_xor(bytes(message), gamma[offset:offset + len(message)]) if message else b'')
+            offset += count * BLOCK_SIZE
+        return results
+
+
+# ==================== СТРИБОГ ====================
+
+class StreebogBackend:
+    """Реализация Стрибога (размер хэша 32 или 64 байта)"""
+
+    name = ''
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    def digest(self, data: bytes, digest_size: int = 64) -> bytes:
+        return self.digest_many([data], digest_size)[0]
+
+    def digest_many(self, messages: Sequence[bytes], digest_size: int = 64) -> List[bytes]:
+        raise NotImplementedError
+
+    def pbkdf2(self, password: bytes, salt: bytes, iterations: int, dklen: int = 64) -> bytes:
+        """PBKDF2-HMAC-Стрибог-512 (Р 50.1.111-2016)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _check_size(digest_size: int) -> None:
+        if digest_size not in DIGEST_SIZES:
+            raise ValueError("Размер хэша Стрибог должен быть 32 или 64 байта")
+
+
+class GostcryptoStreebog(StreebogBackend):
+    """Эталонная реализация на чистом Python (gostcrypto)"""
+
+    name = 'gostcrypto'
+
+    def digest_many(self, messages: Sequence[bytes], digest_size: int = 64) -> List[bytes]:
+        self._check_size(digest_size)
+        name = 'streebog512' if digest_size == 64 else 'streebog256'
+        return [bytes(gosthash.new(name, data=message).digest()) for message in messages]
+
+    def pbkdf2(self, password: bytes, salt: bytes, iterations: int, dklen: int = 64) -> bytes:
+        # gostcrypto принимает ключ HMAC не длиннее блока - длинный сокращается как в RFC 2104
+        if len(password) > 64:
+            password = self.digest(password, 64)
+        return bytes(gostpbkdf.new(bytearray(password), salt=bytearray(salt), counter=iterations).derive(dklen))
+
+
+class TableStreebog(StreebogBackend):
+    """Табличная реализация на NumPy"""
+
+    name = 'table'
+
+    @classmethod
+    def available(cls) -> bool:
+        return streebog_engine is not None
+
+    def digest(self, data: bytes, digest_size: int = 64) -> bytes:
+        self._check_size(digest_size)
+        if digest_size == 64:
+            return streebog_engine.streebog512(data)
+        return streebog_engine.streebog256(data)
+
+    def digest_many(self, messages: Sequence[bytes], digest_size: int = 64) -> List[bytes]:
+        return streebog_engine.streebog_many(messages, digest_size)
+
+    def pbkdf2(self, password: bytes, salt: bytes, iterations: int, dklen: int = 64) -> bytes:
+        return streebog_engine.pbkdf2_hmac_streebog512(password, salt, iterations, dklen)
+
+
+class OpenSSLStreebog(StreebogBackend):
+    """Стрибог из OpenSSL (md_gost12_256 / md_gost12_512)"""
+
+    name = 'openssl'
+
+    @classmethod
+    def available(cls) -> bool:
+        libcrypto = _LibCrypto.get()
+        return bool(libcrypto and all(libcrypto.digests.values()))
+
+    def digest_many(self, messages: Sequence[bytes], digest_size: int = 64) -> List[bytes]:
+        self._check_size(digest_size)
+        libcrypto = _LibCrypto.get()
+        return [libcrypto.digest(message, digest_size) for message in messages]
+
+    def pbkdf2(self, password: bytes, salt: bytes, iterations: int, dklen: int = 64) -> bytes:
+        return _LibCrypto.get().pbkdf2_streebog512(password, salt, iterations, dklen)
+
+
+# ==================== РЕЕСТР ====================
+
+KUZNECHIK_BACKENDS: Dict[str, type] = {}
+STREEBOG_BACKENDS: Dict[str, type] = {}
+
+
+def register_kuznechik_backend(cls: type) -> type:
+    """Регистрация реализации Кузнечика (можно использовать как декоратор)"""
+    KUZNECHIK_BACKENDS[cls.name] = cls
+    return cls
+
+
+def register_streebog_backend(cls: type) -> type:
+    """Регистрация реализации Стрибога (можно использовать как декоратор)"""
+    STREEBOG_BACKENDS[cls.name] = cls
+    return cls
+
+
+for _backend in (GostcryptoKuznechik, TableKuznechik, OpenSSLKuznechik):
+    register_kuznechik_backend(_backend)
+for _backend in (GostcryptoStreebog, TableStreebog, OpenSSLStreebog):
+    register_streebog_backend(_backend)
+
+
+# Контрольные примеры: ГОСТ Р 34.13-2015 (А.2.2, CTR) и ГОСТ Р 34.11-2012 (M1)
+_KAT_KEY = bytes.fromhex('8899aabbccddeeff0011223344556677fedcba98765432100123456789abcdef')
+_KAT_NONCE = bytes.fromhex('1234567890abcef0')
+_KAT_PLAINTEXT = bytes.fromhex(
+    '1122334455667700ffeeddccbbaa9988' '00112233445566778899aabbcceeff0a'
+    '112233445566778899aabbcceeff0a00' '2233445566778899aabbcceeff0a0011'
+)
+_KAT_CIPHERTEXT = bytes.fromhex(
+    'f195d8bec10ed1dbd57b5fa240bda1b8' '85eee733f6a13e5df33ce4b33c45dee4'
+    'a5eae88be6356ed3d5e877f13564a3a5' 'cb91fab1f20cbab6d1c6d15820bdba73'
+)
+_KAT_MESSAGE = b'012345678901234567890123456789012345678901234567890123456789012'
+_KAT_DIGESTS = {
+    64: bytes.fromhex('1b54d01a4af5b9d5cc3d86d68d285462b19abc2475222f35c085122be4ba1ffa'
+                      '00ad30f8767b3a82384c6574f024c311e2a481332b08ef7f41797891c1646f48'),
+    32: bytes.fromhex('9d151eefd8590b89daa6ba6cb74af9275dd051026bb149a452fd84e5e57b5500'),
+}
+
+# PBKDF2-HMAC-Стрибог-512, Р 50.1.111-2016: P = "password", S = "salt", c = 2
+_KAT_PBKDF2 = bytes.fromhex('5a585bafdfbb6e8830d6d68aa3b43ac00d2e4aebce01c9b31c2caed56f0236d4'
+                            'd34b2b8fbd2c4e89d54d46f50e47d45bbac301571743119e8d3c42ba66d348de')
+
+# Имитовставка ГОСТ Р 34.13-2015 (А.2.6, открытый текст - _KAT_PLAINTEXT); в стандарте - старшие 64 бита
+_KAT_MAC = bytes.fromhex('336f4d296059fbe34ddeb35b37749c67')
+
+# Длины для сверки с эталоном (4129 байт - больше 256 блоков, проверяет перенос счётчика)
+_CROSS_CHECK_LENGTHS = (1, 16, 100, 4096 + 33)
+
+
+def verify_kuznechik(backend: KuznechikBackend, reference: Optional[KuznechikBackend] = None) -> bool:
+    """Контрольный пример ГОСТ и сверка с эталоном для обоих вариантов счётчика"""
+    try:
+        if backend.ctr(_KAT_KEY, _KAT_NONCE, _KAT_PLAINTEXT, True) != _KAT_CIPHERTEXT:
+            return False
+        if backend.cmac_many(_KAT_KEY, [_KAT_PLAINTEXT]) != [_KAT_MAC]:
+            return False
+        if reference is None:
+            return True
+
+        key = os.urandom(32)
+        nonces = [os.urandom(8) for _ in _CROSS_CHECK_LENGTHS]
+        messages = [os.urandom(length) for length in _CROSS_CHECK_LENGTHS]
+        for standard in (True, False):
+            expected = reference.ctr_many(key, nonces, messages, standard)
+            if backend.ctr_many(key, nonces, messages, standard) != expected:
+                return False
+            if backend.ctr(key, nonces[-1], messages[-1], standard) != expected[-1]:
+                return False
+        if backend.cmac_many(key, messages) != reference.cmac_many(key, messages):
+            return False
+        return True
+    except Exception:
+        logger.exception("Ошибка проверки реализации Кузнечика %s", backend.name)
+        return False
+
+
+def verify_streebog(backend: StreebogBackend, reference: Optional[StreebogBackend] = None) -> bool:
+    """Контрольные примеры ГОСТ и сверка с эталоном на сообщениях разной длины"""
+    try:
+        for size, expected in _KAT_DIGESTS.items():
+            if backend.digest(_KAT_MESSAGE, size) != expected:
+                return False
+        if backend.pbkdf2(b'password', b'salt', 2) != _KAT_PBKDF2:
+            return False
+        if reference is None:
+            return True
+
+        messages = [os.urandom(length) for length in (0, 63, 64, 65, 1000)]
+        for size in DIGEST_SIZES:
+            if backend.digest_many(messages, size) != reference.digest_many(messages, size):
+                return False
+        salt = os.urandom(16)
+        for password in (b'', os.urandom(64), os.urandom(100)):
+            if backend.pbkdf2(password, salt, 3, 32) != reference.pbkdf2(password, salt, 3, 32):
+                return False
+        return True
+    except Exception:
+        logger.exception("Ошибка проверки реализации Стрибога %s", backend.name)
+        return False
+
+
+def _ops_per_second(func: Callable[[], object], budget: float = 0.02) -> float:
+    """Короткий замер: вызовы в течение budget секунд (не меньше одного)"""
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= budget:
+            return calls / elapsed
+
+
+def _bench_kuznechik(backend: KuznechikBackend) -> float:
+    """Типичная нагрузка: пакет коротких полей под одним ключом"""
+    key = os.urandom(32)
+    nonces = [os.urandom(8) for _ in range(32)]
+    messages = [os.urandom(64) for _ in range(32)]
+    return _ops_per_second(lambda: backend.ctr_many(key, nonces, messages, True))
+
+
+def _bench_streebog(backend: StreebogBackend) -> float:
+    messages = [os.urandom(64) for _ in range(16)]
+    return _ops_per_second(lambda: backend.digest_many(messages, 64))
+
+
+_KINDS = {
+    'kuznechik': (KUZNECHIK_BACKENDS, verify_kuznechik, _bench_kuznechik, 'Кузнечика'),
+    'streebog': (STREEBOG_BACKENDS, verify_streebog, _bench_streebog, 'Стрибога'),
+}
+
+# Результаты проверки и выбора кэшируются на процесс
+_verified: Dict[tuple, bool] = {}
+_selected: Dict[str, str] = {}
+_selection_lock = threading.Lock()
+
+
+@after_fork
+def _reset_locks() -> None:
+    """Новые блокировки в дочернем процессе (блокировку родителя мог держать другой поток)"""
+    global _selection_lock
+    _selection_lock = threading.Lock()
+    _LibCrypto._lock = threading.Lock()
+
+
+def _instantiate(kind: str, name: str):
+    registry = _KINDS[kind][0]
+    if kind == 'kuznechik':
+        return registry[name](KeyScheduleCache())
+    return registry[name]()
+
+
+def _is_verified(kind: str, name: str) -> bool:
+    """Проверка реализации (один раз на процесс)"""
+    if (kind, name) not in _verified:
+        verify = _KINDS[kind][1]
+        reference = None if name == REFERENCE else _instantiate(kind, REFERENCE)
+        _verified[(kind, name)] = verify(_instantiate(kind, name), reference)
+    return _verified[(kind, name)]
+
+
+def available_backends(kind: str) -> List[str]:
+    """Зарегистрированные реализации, доступные на этом хосте"""
+    return [name for name, cls in _KINDS[kind][0].items() if cls.available()]
+
+
+def resolve_backend(kind: str, requested: Optional[str] = None) -> str:
+    """
+    Имя реализации: заданная явно (после проверки) или выбранная автоматически
+
+    Args:
+        kind: 'kuznechik' или 'streebog'
+        requested: Имя реализации, None или 'auto'
+    """
+    registry, _, bench, title = _KINDS[kind]
+
+    with _selection_lock:
+        if requested and requested != 'auto':
+            if requested not in registry:
+                raise ValueError(f"Неизвестная реализация {title}: {requested}")
+            if not registry[requested].available():
+                raise ValueError(f"Реализация {title} {requested} недоступна на этом хосте")
+            if not _is_verified(kind, requested):
+                raise ValueError(f"Реализация {title} {requested} не прошла контрольные примеры")
+            return requested
+
+        if kind not in _selected:
+            speeds = {}
+            for name in available_backends(kind):
+                if _is_verified(kind, name):
+                    speeds[name] = bench(_instantiate(kind, name))
+                else:
+                    logger.warning("Реализация %s %s не прошла контрольные примеры и не используется", title, name)
+            _selected[kind] = max(speeds, key=speeds.get) if speeds else REFERENCE
+            logger.info("Реализация %s: %s (замер, оп/с: %s)", title, _selected[kind],
+                        ', '.join(f'{name}={speed:.0f}' for name, speed in speeds.items()))
+        return _selected[kind]
+
+
+def create_kuznechik_backend(name: str, key_cache: KeyScheduleCache) -> KuznechikBackend:
+    return KUZNECHIK_BACKENDS[name](key_cache)
+
+
+def create_streebog_backend(name: str) -> StreebogBackend:
+    return STREEBOG_BACKENDS[name]()
@@ -6,13 +6,50 @@
 import os
 import secrets
 import hashlib
-from typing import Tuple, Optional
+from typing import BinaryIO, Tuple, Optional, List, Sequence, Union, Dict
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
-from gostcrypto import gosthash, gostcipher
 import base64
+import hmac
 import struct
 
+from key_cache import KeyScheduleCache
+from entry_record import pack_record, unpack_record
+from envelope import (Envelope, pack_header, parse as parse_envelope, peek_version,
+                      HEADER_LENGTH, HEADER_BASE64_LENGTH, VERSION_LEGACY, CURRENT_VERSION, VERSIONS)
+
+from crypto_backends import (BLOCK_SIZE, KUZNECHIK_BACKENDS, STREEBOG_BACKENDS, resolve_backend,
+                             create_kuznechik_backend, create_streebog_backend, zeroize)
+from parallel_ctr import ParallelCTR
+from password_generator import get_password_generator
+from crypto_stream import STREAM_CHUNK_SIZE, ProgressCallback, StreamDecryptor, StreamEncryptor
+from lifecycle import ProcessSingleton
+
+# Шифртекст: base64-строка или сырые байты nonce + ciphertext (bytes, bytearray, memoryview)
+EncryptedValue = Union[str, bytes, bytearray, memoryview]
+
+
+class KeyRing:
+    """
+    Ключи хранилища во время ротации MEK
+
+    Запись идет новым ключом (current), чтение - ключом, чей идентификатор
+    указан в заголовке шифртекста. Значения без заголовка созданы до ротации
+    и расшифровываются предыдущим ключом.
+    """
+    
+    def __init__(self, current: bytes, previous: bytes):
+        self.current = current
+        self.previous = previous
+    
+    @property
+    def keys(self) -> Tuple[bytes, bytes]:
+        return self.current, self.previous
+
+
+# Ключ шифрования: один ключ или набор ключей на время ротации
+EncryptionKey = Union[bytes, KeyRing]
+
 
 class GOSTCrypto:
     """
@@ -23,13 +60,57 @@ class GOSTCrypto:
     SALT_LENGTH = 32  # 256 бит
     NONCE_LENGTH = 8  # 64 бит для CTR режима
     KEY_LENGTH = 32  # 256 бит для Кузнечика
-    PBKDF2_ITERATIONS = 100000
+    PBKDF2_ITERATIONS = 100000  # Исходное значение (ключи без записанного числа итераций)
+    
+    # KDF ключа обёртки MEK: исходный (PBKDF2-HMAC-SHA512 + Стрибог-256)
+    # и PBKDF2-HMAC-Стрибог-512 по Р 50.1.111-2016; выбирается для каждой записи MEK
+    KDF_PBKDF2_SHA512 = 'pbkdf2-sha512'
+    KDF_PBKDF2_STREEBOG = 'pbkdf2-streebog512'
+    KDF_ALGORITHMS = (KDF_PBKDF2_SHA512, KDF_PBKDF2_STREEBOG)
+    
+    # Параметры Argon2id по умолчанию (подбираются под хост скриптом calibrate_kdf.py)
+    ARGON2_TIME_COST = 3
+    ARGON2_MEMORY_COST = 65536  # КиБ (64 MB)
+    ARGON2_PARALLELISM = 4
+    
+    # Зарегистрированные реализации (см. crypto_backends)
+    KUZNECHIK_BACKENDS = tuple(KUZNECHIK_BACKENDS)
+    STREEBOG_BACKENDS = tuple(STREEBOG_BACKENDS)
     
-    def __init__(self):
+    def __init__(self, kuznechik_backend: Optional[str] = None, streebog_backend: Optional[str] = None):
+        # Кэш развернутых ключей (используется табличной реализацией)
+        self.key_cache = KeyScheduleCache(max_size=int(os.getenv('KEY_CACHE_SIZE', 32)))
+        
+        # Реализации: заданные явно или выбранные при запуске ('auto')
+        self.kuznechik_backend = resolve_backend('kuznechik', kuznechik_backend or os.getenv('KUZNECHIK_BACKEND'))
+        self.streebog_backend = resolve_backend('streebog', streebog_backend or os.getenv('STREEBOG_BACKEND'))
+        self.kuznechik = create_kuznechik_backend(self.kuznechik_backend, self.key_cache)
+        self.streebog = create_streebog_backend(self.streebog_backend)
+        
+        # Многопоточная гамма CTR для больших сообщений (заметки, экспорт, резервные копии)
+        self.parallel_ctr = ParallelCTR(
+            workers=int(os.getenv('PARALLEL_CTR_WORKERS', 0)) or None,
+            threshold=int(os.getenv('PARALLEL_CTR_THRESHOLD', 1 << 20)),
+            chunk_size=int(os.getenv('PARALLEL_CTR_CHUNK', 256 << 10))
+        )
+        
+        # Версия формата новых шифртекстов (0 - исходный формат без заголовка)
+        self.envelope_version = int(os.getenv('CIPHERTEXT_FORMAT_VERSION', CURRENT_VERSION))
+        if self.envelope_version not in VERSIONS:
+            raise ValueError(f"Неизвестная версия формата шифртекста: {self.envelope_version}")
+        self._key_ids: Dict[bytes, int] = {}
+        self._mac_keys: Dict[bytes, bytes] = {}
+        
+        # Стоимость KDF для новых хэшей и новых обёрток MEK; старые записи
+        # проверяются со своими параметрами (из хэша Argon2 и kdf_iterations)
+        self.pbkdf2_iterations = int(os.getenv('PBKDF2_ITERATIONS', self.PBKDF2_ITERATIONS))
+        self.kdf_algorithm = os.getenv('KDF_ALGORITHM', self.KDF_PBKDF2_SHA512)
+        if self.kdf_algorithm not in self.KDF_ALGORITHMS:
+            raise ValueError(f"Неизвестный алгоритм KDF: {self.kdf_algorithm}")
         self.ph = PasswordHasher(
-            time_cost=3,
-            memory_cost=65536,  # 64 MB
-            parallelism=4,
+            time_cost=int(os.getenv('ARGON2_TIME_COST', self.ARGON2_TIME_COST)),
+            memory_cost=int(os.getenv('ARGON2_MEMORY_COST', self.ARGON2_MEMORY_COST)),
+            parallelism=int(os.getenv('ARGON2_PARALLELISM', self.ARGON2_PARALLELISM)),
             hash_len=32,
             salt_len=16
         )
@@ -46,13 +127,20 @@ class GOSTCrypto:
         """
         Хэширование по ГОСТ Р 34.11-2012 (Стрибог-512)
         """
-        return gosthash.new('streebog512', data=data).digest()
+        return self.streebog.digest(data, 64)
     
     def streebog_256(self, data: bytes) -> bytes:
         """
         Хэширование по ГОСТ Р 34.11-2012 (Стрибог-256)
         """
-        return gosthash.new('streebog256', data=data).digest()
+        return self.streebog.digest(data, 32)
+    
+    def streebog_many(self, messages: List[bytes], digest_size: int = 64) -> List[bytes]:
+        """
+        Хэширование списка сообщений одним вызовом (Стрибог-512 или Стрибог-256)
+        Порядок результатов совпадает с входным
+        """
+        return self.streebog.digest_many(messages, digest_size)
     
     def derive_key_pbkdf2_gost(self, password: str, salt: bytes, iterations: int = None) -> bytes:
         """
@@ -67,6 +155,25 @@ class GOSTCrypto:
         # Дополнительное хэширование через Стрибог для соответствия ГОСТ
         return self.streebog_256(key)
     
+    def derive_key_pbkdf2_streebog(self, password: str, salt: bytes, iterations: int = None) -> bytes:
+        """
+        Деривация ключа PBKDF2-HMAC-Стрибог-512 (Р 50.1.111-2016)
+        Ключ - первые 32 байта результата
+        """
+        if iterations is None:
+            iterations = self.PBKDF2_ITERATIONS
+        return self.streebog.pbkdf2(password.encode('utf-8'), salt, iterations, self.KEY_LENGTH)
+    
+    def derive_kek(self, password: str, salt: bytes, iterations: int = None, algorithm: str = None) -> bytes:
+        """
+        Ключ обёртки MEK по алгоритму записи (None - исходный PBKDF2-HMAC-SHA512)
+        """
+        if algorithm is None or algorithm == self.KDF_PBKDF2_SHA512:
+            return self.derive_key_pbkdf2_gost(password, salt, iterations)
+        if algorithm == self.KDF_PBKDF2_STREEBOG:
+            return self.derive_key_pbkdf2_streebog(password, salt, iterations)
+        raise ValueError(f"Неизвестный алгоритм KDF: {algorithm}")
+    
     def hash_master_password(self, password: str) -> str:
         """
         Хэширование мастер-пароля с использованием Argon2id
@@ -84,97 +191,475 @@ class GOSTCrypto:
         except VerifyMismatchError:
             return False
     
-    def _kuznechik_ctr_encrypt(self, key: bytes, nonce: bytes, plaintext: bytes) -> bytes:
+    def needs_rehash(self, hash_str: str) -> bool:
+        """Создан ли хэш мастер-пароля с параметрами Argon2, отличными от текущих"""
+        return self.ph.check_needs_rehash(hash_str)
+    
+    def kdf_parameters(self) -> Dict[str, int]:
+        """Текущие параметры KDF"""
+        return {
+            'argon2_time_cost': self.ph.time_cost,
+            'argon2_memory_cost': self.ph.memory_cost,
+            'argon2_parallelism': self.ph.parallelism,
+            'pbkdf2_iterations': self.pbkdf2_iterations,
+            'kdf_algorithm': self.kdf_algorithm
+        }
+    
+    def key_id(self, key: bytes) -> int:
+        """
+        Идентификатор ключа для заголовка шифртекста
+        (32 бита Стрибог-256 от ключа, вычисляется один раз на ключ)
+        """
+        fingerprint = self.key_cache.fingerprint(key)
+        key_id = self._key_ids.get(fingerprint)
+        if key_id is None:
+            key_id = struct.unpack('>I', self.streebog_256(b'gostvault-key-id' + key)[:4])[0]
+            if len(self._key_ids) >= 1024:
+                self._key_ids.clear()
+            self._key_ids[fingerprint] = key_id
+        return key_id
+    
+    def _kuznechik_ctr_encrypt(self, key: bytes, nonce: bytes, plaintext: bytes, standard: bool = False) -> bytes:
         """
         Шифрование в режиме CTR с использованием Кузнечика
+        standard=True - счётчик по ГОСТ Р 34.13-2015 (формат конверта), иначе раскладка gostcipher
+        Сообщения от PARALLEL_CTR_THRESHOLD байт шифруются в несколько потоков
         """
-        cipher = gostcipher.new('kuznechik', key, gostcipher.MODE_CTR, init_vect=nonce)
-        return cipher.encrypt(plaintext)
+        return self.parallel_ctr.ctr(self.kuznechik, key, nonce, plaintext, standard)
     
-    def _kuznechik_ctr_decrypt(self, key: bytes, nonce: bytes, ciphertext: bytes) -> bytes:
+    def _kuznechik_ctr_decrypt(self, key: bytes, nonce: bytes, ciphertext: bytes, standard: bool = False) -> bytes:
         """
         Расшифрование в режиме CTR с использованием Кузнечика
         """
-        cipher = gostcipher.new('kuznechik', key, gostcipher.MODE_CTR, init_vect=nonce)
-        return cipher.decrypt(ciphertext)
+        return self.parallel_ctr.ctr(self.kuznechik, key, nonce, ciphertext, standard)
     
-    def encrypt_data(self, key: bytes, plaintext: str) -> str:
+    def _kuznechik_ctr_many(self, key: bytes, nonces: List[bytes], messages: List[bytes],
+                            standard: bool = False) -> List[bytes]:
         """
-        Шифрование данных с использованием Кузнечика в режиме CTR
-        Возвращает: base64(nonce + ciphertext)
+        CTR для списка сообщений под одним ключом
+        Ключ развертывается один раз, блоки всех сообщений шифруются вместе
         """
-        if not plaintext:
-            return ""
+        return self.kuznechik.ctr_many(key, nonces, messages, standard)
+    
+    def forget_key(self, key: bytes) -> None:
+        """
+        Удаление развернутого ключа из кэша с обнулением раундовых ключей
+        Вызывается при выходе и по истечении сессии
+        """
+        fingerprint = self.key_cache.fingerprint(key)
+        self._key_ids.pop(fingerprint, None)
+        mac_key = self._mac_keys.pop(fingerprint, None)
+        if mac_key is not None:
+            self.key_cache.evict(mac_key)
+        self.key_cache.evict(key)
+    
+    @staticmethod
+    def _write_key(key: EncryptionKey) -> bytes:
+        """Ключ для шифрования новых значений"""
+        return key.current if isinstance(key, KeyRing) else key
+    
+    def _seal(self, key: bytes, nonce: bytes, ciphertext: bytes, raw: bool) -> Union[str, bytes]:
+        """Сборка шифртекста в текущем формате: [заголовок] + nonce + ciphertext"""
+        if self.envelope_version == VERSION_LEGACY:
+            encrypted_data = nonce + ciphertext
+        else:
+            encrypted_data = pack_header(self.key_id(key), self.envelope_version) + nonce + ciphertext
+        
+        if raw:
+            return encrypted_data
+        return base64.b64encode(encrypted_data).decode('utf-8')
+    
+    def _open(self, encrypted_data: EncryptedValue) -> Envelope:
+        """
+        Разбор шифртекста любой поддерживаемой версии
+        Сырые байты не копируются: тело возвращается как memoryview
+        """
+        if isinstance(encrypted_data, str):
+            encrypted_data = base64.b64decode(encrypted_data)
+        return parse_envelope(encrypted_data)
+    
+    def _read_key(self, key: EncryptionKey, envelope: Envelope) -> bytes:
+        """Выбор ключа по идентификатору из заголовка (с проверкой)"""
+        if isinstance(key, KeyRing):
+            if envelope.key_id is None:
+                return key.previous
+            for candidate in key.keys:
+                if self.key_id(candidate) == envelope.key_id:
+                    return candidate
+        elif envelope.key_id is None or envelope.key_id == self.key_id(key):
+            return key
+        raise ValueError("шифртекст зашифрован другим ключом")
+    
+    def _open_body(self, key: EncryptionKey, encrypted_data: EncryptedValue) -> bytearray:
+        """Расшифрование тела шифртекста в новый bytearray (вызывающий обнуляет его после использования)"""
+        envelope = self._open(encrypted_data)
+        plaintext = bytearray(len(envelope.body))
+        self.parallel_ctr.ctr_into(self.kuznechik, self._read_key(key, envelope), envelope.nonce, envelope.body,
+                                   plaintext, 0, envelope.version != VERSION_LEGACY)
+        return plaintext
+    
+    def encrypted_size(self, length: int) -> int:
+        """Размер сырого шифртекста для открытого текста длиной length (пустой дает пустой)"""
+        if not length:
+            return 0
+        header_length = 0 if self.envelope_version == VERSION_LEGACY else HEADER_LENGTH
+        return header_length + self.NONCE_LENGTH + length
+    
+    def plaintext_size(self, encrypted_data: EncryptedValue) -> int:
+        """Размер открытого текста (разбирается только заголовок)"""
+        if not encrypted_data:
+            return 0
+        return len(self._open(encrypted_data).body)
+    
+    def encrypt_into(self, key: EncryptionKey, plaintext, out) -> int:
+        """
+        Шифрование буфера в сырой шифртекст без промежуточных копий:
+        заголовок, nonce и тело пишутся прямо в out
+        
+        Args:
+            plaintext: Открытый текст (bytes, bytearray, memoryview)
+            out: Изменяемый буфер не меньше encrypted_size(len(plaintext))
+        
+        Returns:
+            Число записанных байт
+        """
+        source = memoryview(plaintext).cast('B')
+        size = self.encrypted_size(len(source))
+        if not size:
+            return 0
+        target = memoryview(out).cast('B')
+        if len(target) < size:
+            raise ValueError(f"буфер меньше шифртекста ({len(target)} < {size})")
         
+        key = self._write_key(key)
         nonce = self.generate_nonce()
-        plaintext_bytes = plaintext.encode('utf-8')
+        if self.envelope_version == VERSION_LEGACY:
+            prefix = nonce
+        else:
+            prefix = pack_header(self.key_id(key), self.envelope_version) + nonce
+        target[:len(prefix)] = prefix
+        self.parallel_ctr.ctr_into(self.kuznechik, key, nonce, source, target[len(prefix):size], 0,
+                                   self.envelope_version != VERSION_LEGACY)
+        return size
+    
+    def decrypt_into(self, key: EncryptionKey, encrypted_data: EncryptedValue, out) -> int:
+        """
+        Расшифрование в буфер вызывающего (например, bytearray, который
+        затем обнуляется zeroize) без промежуточных копий открытого текста
         
-        ciphertext = self._kuznechik_ctr_encrypt(key, nonce, plaintext_bytes)
+        Args:
+            out: Изменяемый буфер не меньше plaintext_size(encrypted_data)
         
-        # Объединяем nonce и ciphertext
-        encrypted_data = nonce + ciphertext
+        Returns:
+            Число записанных байт
+        """
+        if not encrypted_data:
+            return 0
+        envelope = self._open(encrypted_data)
+        size = len(envelope.body)
+        target = memoryview(out).cast('B')
+        if len(target) < size:
+            raise ValueError(f"буфер меньше открытого текста ({len(target)} < {size})")
+        self.parallel_ctr.ctr_into(self.kuznechik, self._read_key(key, envelope), envelope.nonce, envelope.body,
+                                   target[:size], 0, envelope.version != VERSION_LEGACY)
+        return size
+    
+    # Обнуление буфера с открытым текстом или ключом на месте
+    zeroize = staticmethod(zeroize)
+    
+    def _encrypt_bytes(self, key: EncryptionKey, plaintext, raw: bool) -> Union[str, bytes]:
+        """Шифрование байтов в один заранее выделенный буфер"""
+        encrypted_data = bytearray(self.encrypted_size(len(plaintext)))
+        self.encrypt_into(key, plaintext, encrypted_data)
+        if raw:
+            return bytes(encrypted_data)
+        return base64.b64encode(encrypted_data).decode('ascii')
+    
+    def ciphertext_version(self, encrypted_data: EncryptedValue) -> int:
+        """Версия формата шифртекста (читается только заголовок, без расшифрования)"""
+        if isinstance(encrypted_data, str):
+            return peek_version(base64.b64decode(encrypted_data[:HEADER_BASE64_LENGTH]))
+        return peek_version(memoryview(encrypted_data)[:HEADER_LENGTH])
+    
+    def needs_upgrade(self, encrypted_data: EncryptedValue) -> bool:
+        """Записан ли непустой шифртекст в формате старее текущего"""
+        if not encrypted_data:
+            return False
+        try:
+            return self.ciphertext_version(encrypted_data) < self.envelope_version
+        except Exception:
+            return False
+    
+    def encrypt_data(self, key: EncryptionKey, plaintext: str, raw: bool = False) -> Union[str, bytes]:
+        """
+        Шифрование данных с использованием Кузнечика в режиме CTR
+        Возвращает: base64(заголовок + nonce + ciphertext), при raw=True - сырые байты
+        """
+        if not plaintext:
+            return b"" if raw else ""
         
-        return base64.b64encode(encrypted_data).decode('utf-8')
+        return self._encrypt_bytes(key, plaintext.encode('utf-8'), raw)
     
-    def decrypt_data(self, key: bytes, encrypted_data: str) -> str:
+    def decrypt_data(self, key: EncryptionKey, encrypted_data: EncryptedValue) -> str:
         """
-        Расшифрование данных
+        Расшифрование данных любой версии формата
+        Принимает base64-строку или сырые байты (bytes, bytearray, memoryview)
         """
         if not encrypted_data:
             return ""
         
         try:
-            encrypted_bytes = base64.b64decode(encrypted_data.encode('utf-8'))
-            
-            # Извлекаем nonce и ciphertext
-            nonce = encrypted_bytes[:self.NONCE_LENGTH]
-            ciphertext = encrypted_bytes[self.NONCE_LENGTH:]
-            
-            plaintext_bytes = self._kuznechik_ctr_decrypt(key, nonce, ciphertext)
-            
-            return plaintext_bytes.decode('utf-8')
+            plaintext = self._open_body(key, encrypted_data)
+            try:
+                return plaintext.decode('utf-8')
+            finally:
+                zeroize(plaintext)
         except Exception as e:
             raise ValueError(f"Ошибка расшифрования: {str(e)}")
     
-    def generate_secure_password(self, length: int = 20, 
-                                 use_uppercase: bool = True,
-                                 use_lowercase: bool = True,
-                                 use_digits: bool = True,
-                                 use_symbols: bool = True) -> str:
+    def encrypt_stream(self, key: EncryptionKey, source: BinaryIO, destination: BinaryIO,
+                       chunk_size: int = STREAM_CHUNK_SIZE, progress: Optional[ProgressCallback] = None) -> int:
         """
-        Генерация криптографически стойкого пароля
-        Использует secrets для CSPRNG
+        Потоковое шифрование двоичного файла (экспорт, резервная копия, вложение)
+        Память постоянна: данные обрабатываются блоками chunk_size
+        
+        Returns:
+            Число зашифрованных байт
+        """
+        return StreamEncryptor(self, key, chunk_size, progress).run(source, destination)
+    
+    def decrypt_stream(self, key: EncryptionKey, source: BinaryIO, destination: BinaryIO,
+                       chunk_size: int = STREAM_CHUNK_SIZE, progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Потоковое расшифрование (поток в формате encrypt_stream или encrypt_data(raw=True))
+        
+        Returns:
+            Число расшифрованных байт
+        """
+        return StreamDecryptor(self, key, chunk_size, progress).run(source, destination)
+    
+    def _encrypt_many_bytes(self, key: EncryptionKey, messages: List[bytes], raw: bool) -> List[Union[str, bytes]]:
+        """
+        Пакетное шифрование байтовых сообщений (пустые дают пустой результат)
+        Все nonce берутся одним вызовом CSPRNG
+        """
+        key = self._write_key(key)
+        positions = [i for i, message in enumerate(messages) if message]
+        results = [b"" if raw else ""] * len(messages)
+        if not positions:
+            return results
+        
+        nonce_pool = secrets.token_bytes(self.NONCE_LENGTH * len(positions))
+        nonces = [nonce_pool[i * self.NONCE_LENGTH:(i + 1) * self.NONCE_LENGTH]
+                  for i in range(len(positions))]
+        
+        ciphertexts = self._kuznechik_ctr_many(key, nonces, [messages[i] for i in positions],
+                                               self.envelope_version != VERSION_LEGACY)
+        
+        for position, nonce, ciphertext in zip(positions, nonces, ciphertexts):
+            results[position] = self._seal(key, nonce, ciphertext, raw)
+        
+        return results
+    
+    def encrypt_many(self, key: EncryptionKey, plaintexts: List[str], raw: bool = False) -> List[Union[str, bytes]]:
+        """
+        Пакетное шифрование списка строк одним ключом
+        Порядок результатов совпадает с входным
+        Пустые строки, как и в encrypt_data, дают пустой результат
+        """
+        return self._encrypt_many_bytes(key, [(plaintext or '').encode('utf-8') for plaintext in plaintexts], raw)
+    
+    def _decrypt_many_bytes(self, key: EncryptionKey, encrypted_items: List[EncryptedValue],
+                            strict: bool) -> List[Optional[bytes]]:
+        """
+        Пакетное расшифрование в байты (пустые элементы дают b'')
+        Элементы разных версий формата и ключей расшифровываются отдельными пакетами
         """
-        if length < 15:
-            length = 15  # Минимум по требованиям
+        results: List[Optional[bytes]] = [b""] * len(encrypted_items)
+        groups: Dict[Tuple[bytes, bool], Tuple[list, list, list]] = {}
         
-        charset = ""
-        if use_lowercase:
-            charset += "abcdefghijklmnopqrstuvwxyz"
-        if use_uppercase:
-            charset += "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-        if use_digits:
-            charset += "0123456789"
-        if use_symbols:
-            charset += "!@#$%^&*()_+-=[]{}|;:,.<>?"
+        for i, encrypted_data in enumerate(encrypted_items):
+            if not encrypted_data:
+                continue
+            try:
+                envelope = self._open(encrypted_data)
+                read_key = self._read_key(key, envelope)
+            except Exception as e:
+                if strict:
+                    raise ValueError(f"Ошибка расшифрования: {str(e)}")
+                results[i] = None
+                continue
+            group = (read_key, envelope.version != VERSION_LEGACY)
+            positions, nonces, messages = groups.setdefault(group, ([], [], []))
+            positions.append(i)
+            nonces.append(envelope.nonce)
+            messages.append(envelope.body)
+        
+        for (read_key, standard), (positions, nonces, messages) in groups.items():
+            plaintexts = self._kuznechik_ctr_many(read_key, nonces, messages, standard)
+            for position, plaintext_bytes in zip(positions, plaintexts):
+                results[position] = plaintext_bytes
+        
+        return results
+    
+    def decrypt_many(self, key: EncryptionKey, encrypted_items: List[EncryptedValue], strict: bool = True) -> List[Optional[str]]:
+        """
+        Пакетное расшифрование списка значений одним ключом
+        При strict=False поврежденные элементы возвращаются как None,
+        иначе первая ошибка поднимает ValueError
+        """
+        results: List[Optional[str]] = []
+        
+        for plaintext_bytes in self._decrypt_many_bytes(key, encrypted_items, strict):
+            if plaintext_bytes is None:
+                results.append(None)
+                continue
+            try:
+                results.append(plaintext_bytes.decode('utf-8'))
+            except UnicodeDecodeError as e:
+                if strict:
+                    raise ValueError(f"Ошибка расшифрования: {str(e)}")
+                results.append(None)
+        
+        return results
+    
+    def reencrypt_many(self, key: EncryptionKey, encrypted_items: List[EncryptedValue], new_key: bytes = None,
+                       raw: bool = False, strict: bool = True) -> List[Optional[Union[str, bytes]]]:
+        """
+        Перешифрование значений в текущий формат (и под new_key, если задан)
+        Открытый текст не декодируется, поэтому подходит и для полей, и для записей
+        При strict=False поврежденные элементы возвращаются как None
+        """
+        plaintexts = self._decrypt_many_bytes(key, encrypted_items, strict)
+        positions = [i for i, plaintext in enumerate(plaintexts) if plaintext is not None]
+        
+        encrypted = self._encrypt_many_bytes(new_key or key, [plaintexts[i] for i in positions], raw)
+        
+        results: List[Optional[Union[str, bytes]]] = [None] * len(encrypted_items)
+        for position, value in zip(positions, encrypted):
+            results[position] = value
+        return results
+    
+    def encrypt_record(self, key: EncryptionKey, fields: Dict[str, str], raw: bool = False) -> Union[str, bytes]:
+        """
+        Шифрование всех чувствительных полей записи одним потоком CTR с одним nonce
+        Возвращает: base64(заголовок + nonce + ciphertext), при raw=True - сырые байты
+        """
+        packed = pack_record(fields)
+        try:
+            return self._encrypt_bytes(key, packed, raw)
+        finally:
+            zeroize(packed)
+    
+    def decrypt_record(self, key: EncryptionKey, encrypted_data: EncryptedValue) -> Dict[str, str]:
+        """
+        Расшифрование записи, зашифрованной encrypt_record
+        """
+        try:
+            plaintext = self._open_body(key, encrypted_data)
+            try:
+                return unpack_record(plaintext)
+            finally:
+                zeroize(plaintext)
+        except Exception as e:
+            raise ValueError(f"Ошибка расшифрования: {str(e)}")
+    
+    def decrypt_records(self, key: EncryptionKey, encrypted_items: List[EncryptedValue],
+                        strict: bool = True) -> List[Optional[Dict[str, str]]]:
+        """
+        Пакетное расшифрование записей (поврежденные при strict=False - None)
+        """
+        results: List[Optional[Dict[str, str]]] = []
         
-        if not charset:
-            charset = "abcdefghijklmnopqrstuvwxyz0123456789"
+        for plaintext_bytes in self._decrypt_many_bytes(key, encrypted_items, strict):
+            try:
+                if plaintext_bytes is None:
+                    raise ValueError("поврежденный шифртекст")
+                results.append(unpack_record(plaintext_bytes))
+            except Exception as e:
+                if strict:
+                    raise ValueError(f"Ошибка расшифрования: {str(e)}")
+                results.append(None)
         
-        # Генерация пароля с гарантией наличия всех типов символов
-        password = ''.join(secrets.choice(charset) for _ in range(length))
+        return results
+    
+    def _mac_key(self, key: bytes) -> bytes:
+        """Ключ имитовставки записей, производный от ключа шифрования (вычисляется один раз на ключ)"""
+        fingerprint = self.key_cache.fingerprint(key)
+        mac_key = self._mac_keys.get(fingerprint)
+        if mac_key is None:
+            mac_key = self.streebog_256(b'gostvault-mac' + key)
+            if len(self._mac_keys) >= 1024:
+                self._mac_keys.clear()
+            self._mac_keys[fingerprint] = mac_key
+        return mac_key
+    
+    @staticmethod
+    def _entry_mac_message(entry_id: int, values: Sequence[Optional[EncryptedValue]]) -> bytes:
+        """
+        Сообщение для имитовставки строки: id и шифртексты колонок с длинами
+        Имитовставка вычисляется по сырым байтам, поэтому не зависит от формата хранения
+        """
+        parts = [struct.pack('>Q', entry_id)]
+        for value in values:
+            if isinstance(value, str):
+                value = base64.b64decode(value)
+            value = bytes(value or b'')
+            parts.append(struct.pack('>I', len(value)))
+            parts.append(value)
+        return b''.join(parts)
+    
+    def entry_tags(self, key: EncryptionKey, rows: Sequence[Tuple[int, Sequence]]) -> List[bytes]:
+        """
+        Имитовставки строк записей: идентификатор ключа (4 байта) + CMAC Кузнечик (16 байт)
         
-        # Проверка наличия всех типов символов
-        has_lower = any(c.islower() for c in password) if use_lowercase else True
-        has_upper = any(c.isupper() for c in password) if use_uppercase else True
-        has_digit = any(c.isdigit() for c in password) if use_digits else True
-        has_symbol = any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in password) if use_symbols else True
+        Args:
+            rows: Кортежи (id, шифртексты колонок в порядке CIPHERTEXT_COLUMNS)
+        """
+        key = self._write_key(key)
+        prefix = struct.pack('>I', self.key_id(key))
+        messages = [self._entry_mac_message(entry_id, values) for entry_id, values in rows]
+        return [prefix + tag for tag in self.kuznechik.cmac_many(self._mac_key(key), messages)]
+    
+    def verify_entry_tags(self, key: EncryptionKey, rows: Sequence[Tuple[int, Sequence, bytes]]) -> List[bool]:
+        """
+        Проверка имитовставок строк (id, шифртексты колонок, имитовставка)
+        Строки проверяются пакетно, отдельно для каждого ключа
+        """
+        keys = key.keys if isinstance(key, KeyRing) else (key,)
+        keys_by_id = {struct.pack('>I', self.key_id(candidate)): candidate for candidate in keys}
         
-        # Если не все типы присутствуют, генерируем заново
-        if not (has_lower and has_upper and has_digit and has_symbol):
-            return self.generate_secure_password(length, use_uppercase, use_lowercase, use_digits, use_symbols)
+        results = [False] * len(rows)
+        groups: Dict[bytes, Tuple[list, list, list]] = {}
+        for i, (entry_id, values, tag) in enumerate(rows):
+            tag = bytes(tag or b'')
+            read_key = keys_by_id.get(tag[:4])
+            if len(tag) != 4 + BLOCK_SIZE or read_key is None:
+                continue
+            positions, messages, expected = groups.setdefault(read_key, ([], [], []))
+            positions.append(i)
+            messages.append(self._entry_mac_message(entry_id, values))
+            expected.append(tag[4:])
         
-        return password
+        for read_key, (positions, messages, expected) in groups.items():
+            tags = self.kuznechik.cmac_many(self._mac_key(read_key), messages)
+            for position, tag, expected_tag in zip(positions, tags, expected):
+                results[position] = hmac.compare_digest(tag, expected_tag)
+        return results
+    
+    def generate_secure_password(self, length: int = 20, 
+                                 use_uppercase: bool = True,
+                                 use_lowercase: bool = True,
+                                 use_digits: bool = True,
+                                 use_symbols: bool = True) -> str:
+        """
+        Генерация криптографически стойкого пароля
+        Все выбранные классы символов гарантированы без повторных попыток
+        (см. password_generator)
+        """
+        passwords, _ = get_password_generator().passwords(length, 1, use_uppercase, use_lowercase,
+                                                          use_digits, use_symbols)
+        return passwords[0]
     
     def validate_password_strength(self, password: str) -> Tuple[bool, str]:
         """
@@ -210,47 +695,55 @@ class GOSTCrypto:
         """
         return secrets.token_bytes(self.KEY_LENGTH)
     
-    def encrypt_mek(self, mek: bytes, master_password: str, salt: bytes) -> bytes:
+    def encrypt_mek(self, mek: bytes, master_password: str, salt: bytes, iterations: int = None,
+                    algorithm: str = None) -> bytes:
         """
         Шифрование MEK ключом, полученным из мастер-пароля
+        iterations и algorithm - параметры KDF (сохраняются в записи MEK)
         """
         # Деривация ключа из мастер-пароля
-        kek = self.derive_key_pbkdf2_gost(master_password, salt)
-        
+        kek = self.derive_kek(master_password, salt, iterations, algorithm)
+        return self.wrap_mek(mek, kek)
+    
+    def wrap_mek(self, mek: bytes, kek: bytes) -> bytes:
+        """
+        Шифрование MEK уже полученным ключом обёртки (KEK)
+        """
         # Генерация nonce для шифрования MEK
         nonce = self.generate_nonce()
         
         # Шифрование MEK
-        cipher = gostcipher.new('kuznechik', kek, gostcipher.MODE_CTR, init_vect=nonce)
-        encrypted_mek = cipher.encrypt(mek)
+        encrypted_mek = self._kuznechik_ctr_encrypt(kek, nonce, mek)
         
         # Возвращаем nonce + encrypted_mek
         return nonce + encrypted_mek
     
-    def decrypt_mek(self, encrypted_mek_with_nonce: bytes, master_password: str, salt: bytes) -> bytes:
+    def decrypt_mek(self, encrypted_mek_with_nonce: bytes, master_password: str, salt: bytes,
+                    iterations: int = None, algorithm: str = None) -> bytes:
         """
         Расшифрование MEK с использованием мастер-пароля
         """
         # Деривация ключа из мастер-пароля
-        kek = self.derive_key_pbkdf2_gost(master_password, salt)
-        
+        kek = self.derive_kek(master_password, salt, iterations, algorithm)
+        return self.unwrap_mek(encrypted_mek_with_nonce, kek)
+    
+    def unwrap_mek(self, encrypted_mek_with_nonce: bytes, kek: bytes) -> bytes:
+        """
+        Расшифрование MEK уже полученным ключом обёртки (KEK)
+        """
         # Извлечение nonce и зашифрованного MEK
         nonce = encrypted_mek_with_nonce[:self.NONCE_LENGTH]
         encrypted_mek = encrypted_mek_with_nonce[self.NONCE_LENGTH:]
         
         # Расшифрование MEK
-        cipher = gostcipher.new('kuznechik', kek, gostcipher.MODE_CTR, init_vect=nonce)
-        mek = cipher.decrypt(encrypted_mek)
+        mek = self._kuznechik_ctr_decrypt(kek, nonce, encrypted_mek)
         
         return mek
 
 
-# Singleton instance
-_crypto_instance = None
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_crypto_instance = ProcessSingleton(GOSTCrypto)
 
 def get_crypto() -> GOSTCrypto:
     """Получение singleton экземпляра криптомодуля"""
-    global _crypto_instance
-    if _crypto_instance is None:
-        _crypto_instance = GOSTCrypto()
-    return _crypto_instance
+    return _crypto_instance.get()
@@ -0,0 +1,155 @@
+"""
+Потоковое шифрование файлов и других двоичных потоков
+Данные читаются блоками фиксированного размера в заранее выделенные
+буферы, счётчик CTR продолжается от блока к блоку, поэтому память
+не зависит от размера потока. Результат - тот же конверт, что и у
+encrypt_data(raw=True): заголовок + nonce + тело.
+"""
+
+import os
+from typing import Callable, Optional
+
+from crypto_backends import zeroize
+from envelope import (Envelope, HEADER_LENGTH, NONCE_LENGTH, VERSION_LEGACY, VERSION_1,
+                      pack_header, parse as parse_envelope)
+
+BLOCK_SIZE = 16
+
+# Размер блока чтения по умолчанию (кратен размеру блока шифра)
+STREAM_CHUNK_SIZE = 1 << 20
+
+# progress(обработано байт, всего байт или None, если размер неизвестен)
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def _read_full(source, view: memoryview) -> int:
+    """Чтение до заполнения view или конца потока, возвращает число байт"""
+    filled = 0
+    while filled < len(view):
+        if hasattr(source, 'readinto'):
+            count = source.readinto(view[filled:])
+        else:
+            chunk = source.read(len(view) - filled)
+            count = len(chunk) if chunk else 0
+            view[filled:filled + count] = chunk or b''
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def _remaining(source) -> Optional[int]:
+    """Сколько байт осталось в потоке (None, если поток не поддерживает seek)"""
+    try:
+        if not source.seekable():
+            return None
+        position = source.tell()
+        end = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class _StreamCipher:
+    """Общая часть: буферы, продолжение счётчика, прогресс"""
+
+    def __init__(self, crypto, key, chunk_size: int = STREAM_CHUNK_SIZE,
+                 progress: Optional[ProgressCallback] = None):
+        self.crypto = crypto
+        self.key = key
+        self.chunk_size = max(BLOCK_SIZE, chunk_size // BLOCK_SIZE * BLOCK_SIZE)
+        self.progress = progress
+        self.processed = 0
+
+    def _pump(self, source, destination, key: bytes, nonce: bytes, standard: bool,
+              total: Optional[int], pending: bytes = b'') -> int:
+        """
+        Шифрование/расшифрование тела потока блоками chunk_size
+        pending - уже прочитанное начало тела
+        """
+        data = bytearray(self.chunk_size)
+        out = bytearray(self.chunk_size)
+        data_view, out_view = memoryview(data), memoryview(out)
+        block = 0
+        try:
+            while True:
+                data_view[:len(pending)] = pending
+                count = len(pending) + _read_full(source, data_view[len(pending):])
+                pending = b''
+                if not count:
+                    break
+
+                self.crypto.parallel_ctr.ctr_into(self.crypto.kuznechik, key, nonce, data_view[:count],
+                                                  out_view[:count], block, standard)
+                destination.write(out_view[:count])
+                block += self.chunk_size // BLOCK_SIZE
+                self.processed += count
+                if self.progress:
+                    self.progress(self.processed, total)
+                if count < self.chunk_size:
+                    break
+        finally:
+            data_view.release()
+            out_view.release()
+            zeroize(data)
+            zeroize(out)
+        return self.processed
+
+
+class StreamEncryptor(_StreamCipher):
+    """
+    Шифрование двоичного потока
+    Всегда пишется формат с заголовком: счётчик исходного формата
+    повторяется через 256 блоков и для больших данных непригоден
+    """
+
+    def run(self, source, destination, total: Optional[int] = None) -> int:
+        """
+        Шифрование source в destination
+
+        Args:
+            total: Размер открытого текста для прогресса (по умолчанию - остаток source)
+
+        Returns:
+            Число зашифрованных байт открытого текста
+        """
+        key = self.crypto._write_key(self.key)
+        version = max(self.crypto.envelope_version, VERSION_1)
+        nonce = self.crypto.generate_nonce()
+        destination.write(pack_header(self.crypto.key_id(key), version) + nonce)
+        return self._pump(source, destination, key, nonce, True,
+                          _remaining(source) if total is None else total)
+
+
+class StreamDecryptor(_StreamCipher):
+    """Расшифрование двоичного потока любой версии формата"""
+
+    def run(self, source, destination, total: Optional[int] = None) -> int:
+        """
+        Расшифрование source в destination
+
+        Args:
+            total: Размер шифртекста для прогресса, вместе с заголовком (по умолчанию - остаток source)
+
+        Returns:
+            Число расшифрованных байт
+
+        Raises:
+            ValueError: Поток короче nonce или зашифрован другим ключом
+        """
+        if total is None:
+            total = _remaining(source)
+        prefix = bytearray(HEADER_LENGTH + NONCE_LENGTH)
+        prefix_length = _read_full(source, memoryview(prefix))
+        envelope: Envelope = parse_envelope(prefix[:prefix_length])
+
+        # В исходном формате после nonce уже прочитано начало тела
+        pending = bytes(envelope.body)
+        header_length = prefix_length - len(pending)
+        if total is not None:
+            total -= header_length
+
+        key = self.crypto._read_key(self.key, envelope)
+        return self._pump(source, destination, key, envelope.nonce,
+                          envelope.version != VERSION_LEGACY, total, pending)
@@ -0,0 +1,308 @@
+"""
+Целостность записей хранилища
+Шифртексты CTR не аутентифицированы, поэтому у строки PasswordEntry может
+быть имитовставка mac_tag - CMAC Кузнечик по id и всем шифртекстам строки.
+Проверка хранилища (scrub) идет пакетами с сохраненной точкой продолжения:
+каждый запуск обрабатывает ограниченное число строк и не держит блокировку
+БД дольше одной короткой транзакции на пакет.
+"""
+
+import base64
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from crypto_gost import EncryptionKey, GOSTCrypto, KeyRing, get_crypto
+from models import (Database, KeyRotation, MasterEncryptionKey, MasterPassword, VaultScrub,
+                    CIPHERTEXT_COLUMNS)
+
+ENTRY_COLUMNS = CIPHERTEXT_COLUMNS['password_entries']
+
+# Колонка record_enc: запись целиком (остальные колонки тогда пустые)
+_RECORD_INDEX = ENTRY_COLUMNS.index('record_enc')
+
+_SELECT_ENTRIES = f"SELECT id, {', '.join(ENTRY_COLUMNS)}, mac_tag FROM password_entries"
+
+
+def _timestamp(moment: Optional[datetime] = None) -> str:
+    """Отметка времени в формате, в котором SQLAlchemy хранит DateTime в SQLite"""
+    return (moment or datetime.utcnow()).isoformat(sep=' ', timespec='microseconds')
+
+
+def retag_entries(connection, crypto: GOSTCrypto, key: EncryptionKey, ids: Sequence[int]) -> int:
+    """
+    Пересчет имитовставок строк ids по текущим значениям (внутри транзакции вызывающего)
+    Строки без имитовставки не трогаются
+
+    Returns:
+        Количество обновленных строк
+    """
+    if not ids:
+        return 0
+    params = {f'id{i}': row_id for i, row_id in enumerate(ids)}
+    rows = connection.execute(
+        text(f"{_SELECT_ENTRIES} WHERE mac_tag IS NOT NULL AND id IN ({', '.join(':' + name for name in params)})"),
+        params
+    ).fetchall()
+    if not rows:
+        return 0
+
+    tags = crypto.entry_tags(key, [(row[0], row[1:-1]) for row in rows])
+    connection.execute(
+        text("UPDATE password_entries SET mac_tag = :tag WHERE id = :id"),
+        [{'id': row[0], 'tag': tag} for row, tag in zip(rows, tags)]
+    )
+    return len(rows)
+
+
+def _verify_batch(key: EncryptionKey, rows: Sequence[Tuple],
+                  tag_missing: bool) -> Tuple[List[int], List[int], List[Tuple[int, bytes]]]:
+    """
+    Проверка пакета строк (выполняется в рабочем процессе)
+    Строка повреждена, если не совпала имитовставка или шифртекст не расшифровывается
+
+    Args:
+        rows: Кортежи (id, шифртексты ENTRY_COLUMNS..., mac_tag)
+        tag_missing: Вычислить имитовставки для целых строк без нее
+
+    Returns:
+        (id поврежденных строк, id строк без имитовставки, новые имитовставки (id, tag))
+    """
+    crypto = get_crypto()
+    corrupt = set()
+
+    tagged = [row for row in rows if row[-1]]
+    valid = crypto.verify_entry_tags(key, [(row[0], row[1:-1], row[-1]) for row in tagged])
+    corrupt.update(row[0] for row, ok in zip(tagged, valid) if not ok)
+
+    record_rows = [row for row in rows if row[1 + _RECORD_INDEX]]
+    records = crypto.decrypt_records(key, [row[1 + _RECORD_INDEX] for row in record_rows], strict=False)
+    corrupt.update(row[0] for row, record in zip(record_rows, records) if record is None)
+
+    field_rows = [row for row in rows if not row[1 + _RECORD_INDEX]]
+    width = len(ENTRY_COLUMNS)
+    decrypted = crypto.decrypt_many(key, [value or '' for row in field_rows for value in row[1:-1]], strict=False)
+    for i, row in enumerate(field_rows):
+        if None in decrypted[i * width:(i + 1) * width]:
+            corrupt.add(row[0])
+
+    untagged = [row for row in rows if not row[-1]]
+    new_tags: List[Tuple[int, bytes]] = []
+    if tag_missing:
+        intact = [row for row in untagged if row[0] not in corrupt]
+        tags = crypto.entry_tags(key, [(row[0], row[1:-1]) for row in intact])
+        new_tags = [(row[0], tag) for row, tag in zip(intact, tags)]
+
+    return sorted(corrupt), [row[0] for row in untagged], new_tags
+
+
+class VaultScrubber:
+    """
+    Проверка целостности всех записей хранилища
+
+    Пакеты читаются наперед и проверяются пулом процессов, а результаты
+    записываются по порядку id вместе с точкой продолжения в vault_scrubs.
+    Незавершенная проверка продолжается следующим запуском.
+    """
+
+    def __init__(self, database: Database, crypto: GOSTCrypto, key: EncryptionKey,
+                 batch_size: int = 1000, workers: int = 1, tag_missing: bool = False):
+        self.db = database
+        self.crypto = crypto
+        self.key = key
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.tag_missing = tag_missing
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _submit(self, rows: Sequence[Tuple]) -> Future:
+        """Проверка пакета в пуле процессов (при workers=1 - сразу в текущем потоке)"""
+        if self.workers < 2:
+            future = Future()
+            future.set_result(_verify_batch(self.key, rows, self.tag_missing))
+            return future
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool.submit(_verify_batch, self.key, rows, self.tag_missing)
+
+    def _begin(self) -> int:
+        """Незавершенная проверка или новая"""
+        db_session = self.db.get_session()
+        try:
+            scrub = db_session.query(VaultScrub).filter_by(status='running').order_by(VaultScrub.id).first()
+            if scrub is None:
+                scrub = VaultScrub(status='running', cursor=0, rows_checked=0, rows_corrupt=0, rows_untagged=0)
+                db_session.add(scrub)
+                db_session.commit()
+            return scrub.id
+        finally:
+            db_session.close()
+
+    def run(self, max_rows: Optional[int] = None, max_seconds: Optional[float] = None,
+            pause: float = 0.0) -> Dict:
+        """
+        Проверка с точки продолжения
+
+        Args:
+            max_rows: Остановиться после стольких строк (проверка продолжится следующим запуском)
+            max_seconds: Остановиться через столько секунд
+            pause: Пауза между пакетами, с (уступить БД приложению)
+
+        Returns:
+            Состояние проверки (см. progress)
+        """
+        scrub_id = self._begin()
+        started = time.monotonic()
+        with self.db.engine.connect() as connection:
+            cursor = connection.execute(text("SELECT cursor FROM vault_scrubs WHERE id = :id"),
+                                        {'id': scrub_id}).scalar() or 0
+
+        select = text(f"{_SELECT_ENTRIES} WHERE id > :cursor ORDER BY id LIMIT :limit")
+        pending = deque()
+        exhausted = False
+        checked = 0
+        try:
+            while True:
+                out_of_budget = ((max_rows is not None and checked >= max_rows) or
+                                 (max_seconds is not None and time.monotonic() - started >= max_seconds))
+
+                # Чтение наперед: пока пул занят, следующие пакеты уже проверяются
+                while not exhausted and not out_of_budget and len(pending) < self.workers:
+                    limit = self.batch_size
+                    if max_rows is not None:
+                        limit = min(limit, max_rows - checked - sum(len(rows) for rows, _ in pending))
+                        if limit <= 0:
+                            break
+                    with self.db.engine.connect() as connection:
+                        rows = connection.execute(select, {'cursor': cursor, 'limit': limit}).fetchall()
+                    if not rows:
+                        exhausted = True
+                        break
+                    rows = [tuple(row) for row in rows]
+                    cursor = rows[-1][0]
+                    pending.append((rows, self._submit(rows)))
+
+                if not pending:
+                    break
+
+                rows, future = pending.popleft()
+                self._write_batch(scrub_id, rows, *future.result())
+                checked += len(rows)
+                if pause and pending:
+                    time.sleep(pause)
+
+            if exhausted:
+                self._complete(scrub_id)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+        result = self.progress(scrub_id)
+        elapsed = time.monotonic() - started
+        result['rows_this_run'] = checked
+        result['rows_per_second'] = round(checked / elapsed, 1) if elapsed else 0.0
+        return result
+
+    def _write_batch(self, scrub_id: int, rows: Sequence[Tuple], corrupt: List[int], untagged: List[int],
+                     new_tags: List[Tuple[int, bytes]]) -> None:
+        """Запись результатов пакета и точки продолжения одной транзакцией"""
+        old_by_id = {row[0]: row[1:-1] for row in rows}
+        with self.db.engine.begin() as connection:
+            if new_tags:
+                # Строка, измененная после чтения, остается без имитовставки до следующей проверки
+                unchanged = ' AND '.join(f"{column} IS :c{i}" for i, column in enumerate(ENTRY_COLUMNS))
+                params = []
+                for row_id, tag in new_tags:
+                    param = {'id': row_id, 'tag': tag}
+                    param.update({f'c{i}': value for i, value in enumerate(old_by_id[row_id])})
+                    params.append(param)
+                connection.execute(
+                    text(f"UPDATE password_entries SET mac_tag = :tag "
+                         f"WHERE id = :id AND mac_tag IS NULL AND {unchanged}"),
+                    params
+                )
+
+            previous = connection.execute(text("SELECT corrupt_ids FROM vault_scrubs WHERE id = :id"),
+                                          {'id': scrub_id}).scalar()
+            corrupt_ids = ','.join(filter(None, [previous] + [str(row_id) for row_id in corrupt])) or None
+            connection.execute(
+                text("UPDATE vault_scrubs SET cursor = :cursor, rows_checked = rows_checked + :checked, "
+                     "rows_corrupt = rows_corrupt + :corrupt, rows_untagged = rows_untagged + :untagged, "
+                     "corrupt_ids = :corrupt_ids, updated_at = :now WHERE id = :id"),
+                {'cursor': rows[-1][0], 'checked': len(rows), 'corrupt': len(corrupt),
+                 'untagged': len(untagged) - len(new_tags), 'corrupt_ids': corrupt_ids,
+                 'now': _timestamp(), 'id': scrub_id}
+            )
+
+    def _complete(self, scrub_id: int) -> None:
+        with self.db.engine.begin() as connection:
+            connection.execute(
+                text("UPDATE vault_scrubs SET status = 'completed', completed_at = :now, updated_at = :now "
+                     "WHERE id = :id"),
+                {'now': _timestamp(), 'id': scrub_id}
+            )
+
+    def progress(self, scrub_id: Optional[int] = None) -> Optional[Dict]:
+        """Состояние проверки scrub_id (по умолчанию - последней)"""
+        db_session = self.db.get_session()
+        try:
+            if scrub_id:
+                scrub = db_session.get(VaultScrub, scrub_id)
+            else:
+                scrub = db_session.query(VaultScrub).order_by(VaultScrub.id.desc()).first()
+            if scrub is None:
+                return None
+            return {
+                'id': scrub.id,
+                'status': scrub.status,
+                'cursor': scrub.cursor,
+                'rows_checked': scrub.rows_checked,
+                'rows_corrupt': scrub.rows_corrupt,
+                'rows_untagged': scrub.rows_untagged,
+                'corrupt_ids': [int(row_id) for row_id in scrub.corrupt_ids.split(',')] if scrub.corrupt_ids else [],
+                'started_at': scrub.started_at.isoformat() if scrub.started_at else None,
+                'completed_at': scrub.completed_at.isoformat() if scrub.completed_at else None
+            }
+        finally:
+            db_session.close()
+
+
+def unlock_vault(database: Database, crypto: GOSTCrypto, master_password: str) -> EncryptionKey:
+    """
+    Ключ хранилища по мастер-паролю (для служебных скриптов)
+    Во время ротации MEK - KeyRing: новый ключ и текущий
+
+    Raises:
+        ValueError: Хранилище не инициализировано или неверный мастер-пароль
+    """
+    db_session = database.get_session()
+    try:
+        master = db_session.query(MasterPassword).first()
+        if master is None:
+            raise ValueError("Хранилище не инициализировано")
+        if not crypto.verify_master_password(master_password, master.password_hash):
+            raise ValueError("Неверный мастер-пароль")
+
+        mek_record = db_session.query(MasterEncryptionKey).first()
+        if mek_record is None:
+            # Хранилище без MEK: ключ получается из мастер-пароля
+            return crypto.derive_key_pbkdf2_gost(master_password, base64.b64decode(master.salt))
+
+        salt = base64.b64decode(mek_record.kdf_salt)
+        key = crypto.decrypt_mek(base64.b64decode(mek_record.encrypted_key), master_password, salt,
+                                 mek_record.kdf_iterations, mek_record.kdf_algorithm)
+        rotation = db_session.query(KeyRotation).filter_by(status='running').first()
+        if rotation is not None:
+            new_key = crypto.decrypt_mek(base64.b64decode(rotation.encrypted_key), master_password, salt,
+                                         mek_record.kdf_iterations, mek_record.kdf_algorithm)
+            return KeyRing(new_key, key)
+        return key
+    finally:
+        db_session.close()
@@ -0,0 +1,68 @@
+"""
+Компактная сериализация чувствительных полей записи
+Все поля записи шифруются одним потоком CTR с одним nonce
+Формат: версия (1 байт), затем для каждого поля длина (varint) и UTF-8 байты
+"""
+
+from typing import Dict
+
+RECORD_VERSION = 1
+
+# Порядок полей фиксирован форматом: изменение набора полей требует новой RECORD_VERSION
+RECORD_FIELDS = ('site_name', 'url', 'username', 'password', 'notes', 'totp_secret', 'custom_fields')
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    """Беззнаковое число в формате LEB128"""
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, offset: int):
+    """Чтение LEB128, возвращает (значение, новое смещение)"""
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("Запись обрезана")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def pack_record(fields: Dict[str, str]) -> bytearray:
+    """
+    Сериализация полей записи (отсутствующие поля - пустые строки)
+    Возвращает bytearray, чтобы после шифрования его можно было обнулить
+    """
+    buffer = bytearray([RECORD_VERSION])
+    for name in RECORD_FIELDS:
+        value = (fields.get(name) or '').encode('utf-8')
+        _write_varint(buffer, len(value))
+        buffer += value
+    return buffer
+
+
+def unpack_record(data) -> Dict[str, str]:
+    """Разбор сериализованной записи (bytes, bytearray или memoryview, без копирования)"""
+    data = memoryview(data).cast('B')
+    if not data or data[0] != RECORD_VERSION:
+        raise ValueError("Неизвестная версия формата записи")
+
+    fields = {}
+    offset = 1
+    for name in RECORD_FIELDS:
+        length, offset = _read_varint(data, offset)
+        if offset + length > len(data):
+            raise ValueError("Запись обрезана")
+        fields[name] = str(data[offset:offset + length], 'utf-8')
+        offset += length
+
+    if offset != len(data):
+        raise ValueError("Лишние данные в записи")
+    return fields
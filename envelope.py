@@ -0,0 +1,77 @@
+"""
+Самоописываемый формат шифртекста (конверт)
+Заголовок: MAGIC (3 байта), версия формата, алгоритм, идентификатор ключа (4 байта)
+Значения без заголовка - исходный формат: 8 байт nonce + тело CTR
+"""
+
+import struct
+from typing import NamedTuple, Optional
+
+MAGIC = b'GVE'
+
+# Версии формата
+VERSION_LEGACY = 0  # nonce + тело, счётчик в раскладке gostcipher (без заголовка)
+VERSION_1 = 1  # заголовок + nonce + тело, счётчик по ГОСТ Р 34.13-2015
+CURRENT_VERSION = VERSION_1
+VERSIONS = (VERSION_LEGACY, VERSION_1)
+
+# Алгоритмы
+ALGORITHM_KUZNECHIK_CTR = 1
+ALGORITHMS = (ALGORITHM_KUZNECHIK_CTR,)
+
+NONCE_LENGTH = 8
+
+_HEADER = struct.Struct('>3sBBI')
+HEADER_LENGTH = _HEADER.size
+# Заголовок в base64 занимает ровно 12 символов
+HEADER_BASE64_LENGTH = 4 * -(-HEADER_LENGTH // 3)
+
+
+class Envelope(NamedTuple):
+    """Разобранный шифртекст (key_id - None для исходного формата)"""
+    version: int
+    algorithm: int
+    key_id: Optional[int]
+    nonce: bytes
+    body: memoryview
+
+
+def pack_header(key_id: int, version: int = CURRENT_VERSION,
+                algorithm: int = ALGORITHM_KUZNECHIK_CTR) -> bytes:
+    """Заголовок конверта"""
+    return _HEADER.pack(MAGIC, version, algorithm, key_id)
+
+
+def _is_header(magic: bytes, version: int, algorithm: int) -> bool:
+    """Известна ли комбинация MAGIC, версии и алгоритма"""
+    return magic == MAGIC and version in VERSIONS and version != VERSION_LEGACY and algorithm in ALGORITHMS
+
+
+def peek_version(prefix) -> int:
+    """Версия формата по первым HEADER_LENGTH байтам (без разбора тела)"""
+    if len(prefix) >= HEADER_LENGTH:
+        magic, version, algorithm, _ = _HEADER.unpack_from(prefix)
+        if _is_header(magic, version, algorithm):
+            return version
+    return VERSION_LEGACY
+
+
+def parse(data) -> Envelope:
+    """
+    Разбор шифртекста (bytes, bytearray или memoryview) без копирования тела
+
+    Значение считается конвертом, только если MAGIC, версия и алгоритм
+    известны; иначе это исходный формат. Случайный nonce старого значения
+    совпадает с такой комбинацией с вероятностью около 2^-40.
+    """
+    view = memoryview(data)
+    if len(view) >= HEADER_LENGTH + NONCE_LENGTH:
+        magic, version, algorithm, key_id = _HEADER.unpack_from(view)
+        if _is_header(magic, version, algorithm):
+            nonce_end = HEADER_LENGTH + NONCE_LENGTH
+            return Envelope(version, algorithm, key_id, bytes(view[HEADER_LENGTH:nonce_end]), view[nonce_end:])
+
+    if len(view) < NONCE_LENGTH:
+        raise ValueError("данные короче nonce")
+    return Envelope(VERSION_LEGACY, ALGORITHM_KUZNECHIK_CTR, None,
+                    bytes(view[:NONCE_LENGTH]), view[NONCE_LENGTH:])
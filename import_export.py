@@ -13,6 +13,7 @@ from pykeepass import PyKeePass
 from pykeepass.exceptions import CredentialsError
 
 from crypto_gost import get_crypto
+from lifecycle import ProcessSingleton
 
 
 class ImportExportManager:
@@ -20,9 +21,74 @@ class ImportExportManager:
     Менеджер импорта и экспорта паролей
     """
     
+    # Шифруемые поля записи (в БД хранятся как <поле>_enc)
+    ENCRYPTED_FIELDS = ('site_name', 'url', 'username', 'password', 'notes', 'totp_secret')
+    
     def __init__(self):
         self.crypto = get_crypto()
     
+    def _encrypt_fields(self, rows: List[Dict], encryption_key: bytes) -> List[Dict]:
+        """
+        Шифрование полей всех записей одним пакетным вызовом
+        
+        Args:
+            rows: Список словарей с открытыми значениями полей
+            encryption_key: Ключ шифрования
+        
+        Returns:
+            Список словарей вида {'<поле>_enc': ...} в том же порядке
+        """
+        width = len(self.ENCRYPTED_FIELDS)
+        plaintexts = [row.get(field) or '' for row in rows for field in self.ENCRYPTED_FIELDS]
+        encrypted = self.crypto.encrypt_many(encryption_key, plaintexts)
+        
+        return [
+            {f'{field}_enc': encrypted[i * width + j] for j, field in enumerate(self.ENCRYPTED_FIELDS)}
+            for i in range(len(rows))
+        ]
+    
+    def _decrypt_fields(self, entries: List[Dict], encryption_key: bytes) -> List[Optional[Dict]]:
+        """
+        Расшифрование полей всех записей одним пакетным вызовом
+        
+        Args:
+            entries: Список записей с полями <поле>_enc или record_enc
+            encryption_key: Ключ для расшифровки
+        
+        Returns:
+            Список словарей с открытыми значениями; None для записей,
+            которые не удалось расшифровать
+        """
+        width = len(self.ENCRYPTED_FIELDS)
+        field_entries = [entry for entry in entries if not entry.get('record_enc')]
+        encrypted = [entry.get(f'{field}_enc') or '' for entry in field_entries for field in self.ENCRYPTED_FIELDS]
+        decrypted = iter(self.crypto.decrypt_many(encryption_key, encrypted, strict=False))
+        
+        # Записи, хранящиеся целиком в record_enc, расшифровываются отдельным пакетом
+        records = iter(self.crypto.decrypt_records(
+            encryption_key, [entry['record_enc'] for entry in entries if entry.get('record_enc')], strict=False
+        ))
+        
+        result = []
+        for entry in entries:
+            if entry.get('record_enc'):
+                record = next(records)
+                result.append({field: record[field] for field in self.ENCRYPTED_FIELDS} if record else None)
+                continue
+            values = [next(decrypted) for _ in range(width)]
+            if any(value is None for value in values):
+                result.append(None)
+            else:
+                result.append(dict(zip(self.ENCRYPTED_FIELDS, values)))
+        return result
+    
+    @staticmethod
+    def _as_base64(value) -> str:
+        """Шифртекст в виде base64-строки (значения из БД могут быть сырыми байтами)"""
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return base64.b64encode(value).decode('utf-8')
+        return value or ''
+    
     # ==================== ИМПОРТ ====================
     
     def import_from_csv(self, csv_content: str, encryption_key: bytes) -> List[Dict]:
@@ -39,27 +105,17 @@ class ImportExportManager:
         Returns:
             Список словарей с зашифрованными данными
         """
-        entries = []
-        
         try:
             csv_file = StringIO(csv_content)
-            reader = csv.DictReader(csv_file)
+            rows = list(csv.DictReader(csv_file))
             
-            for row in reader:
-                # Шифруем данные
-                entry = {
-                    'site_name_enc': self.crypto.encrypt_data(encryption_key, row.get('site_name', '')),
-                    'url_enc': self.crypto.encrypt_data(encryption_key, row.get('url', '')),
-                    'username_enc': self.crypto.encrypt_data(encryption_key, row.get('username', '')),
-                    'password_enc': self.crypto.encrypt_data(encryption_key, row.get('password', '')),
-                    'notes_enc': self.crypto.encrypt_data(encryption_key, row.get('notes', '')),
-                    'totp_secret_enc': self.crypto.encrypt_data(encryption_key, row.get('totp_secret', '')),
-                    'favorite': row.get('favorite', '').lower() == 'true',
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                }
-                
-                entries.append(entry)
+            # Шифруем данные
+            entries = self._encrypt_fields(rows, encryption_key)
+            
+            for entry, row in zip(entries, rows):
+                entry['favorite'] = (row.get('favorite') or '').lower() == 'true'
+                entry['created_at'] = datetime.utcnow()
+                entry['updated_at'] = datetime.utcnow()
             
             return entries
             
@@ -78,40 +134,41 @@ class ImportExportManager:
         Returns:
             Список словарей с зашифрованными данными
         """
-        entries = []
-        
         try:
             # Открываем KeePass базу
             kdbx_file = BytesIO(kdbx_content)
             kp = PyKeePass(kdbx_file, password=kdbx_password)
             
-            # Получаем все записи
-            for entry in kp.entries:
-                # Пропускаем записи без пароля
-                if not entry.password:
-                    continue
-                
-                # Шифруем данные
-                encrypted_entry = {
-                    'site_name_enc': self.crypto.encrypt_data(encryption_key, entry.title or ''),
-                    'url_enc': self.crypto.encrypt_data(encryption_key, entry.url or ''),
-                    'username_enc': self.crypto.encrypt_data(encryption_key, entry.username or ''),
-                    'password_enc': self.crypto.encrypt_data(encryption_key, entry.password or ''),
-                    'notes_enc': self.crypto.encrypt_data(encryption_key, entry.notes or ''),
-                    'totp_secret_enc': '',  # KeePass может хранить TOTP в custom fields
-                    'favorite': False,
-                    'created_at': entry.ctime or datetime.utcnow(),
-                    'updated_at': entry.mtime or datetime.utcnow()
+            # Пропускаем записи без пароля
+            kp_entries = [entry for entry in kp.entries if entry.password]
+            
+            rows = []
+            for entry in kp_entries:
+                row = {
+                    'site_name': entry.title,
+                    'url': entry.url,
+                    'username': entry.username,
+                    'password': entry.password,
+                    'notes': entry.notes,
+                    'totp_secret': ''  # KeePass может хранить TOTP в custom fields
                 }
                 
                 # Проверяем custom fields на TOTP
                 if hasattr(entry, 'custom_properties'):
                     for key, value in entry.custom_properties.items():
                         if key.lower() in ['totp', 'otp', 'twofa']:
-                            encrypted_entry['totp_secret_enc'] = self.crypto.encrypt_data(encryption_key, value)
+                            row['totp_secret'] = value
                             break
                 
-                entries.append(encrypted_entry)
+                rows.append(row)
+            
+            # Шифруем данные
+            entries = self._encrypt_fields(rows, encryption_key)
+            
+            for encrypted_entry, entry in zip(entries, kp_entries):
+                encrypted_entry['favorite'] = False
+                encrypted_entry['created_at'] = entry.ctime or datetime.utcnow()
+                encrypted_entry['updated_at'] = entry.mtime or datetime.utcnow()
             
             return entries
             
@@ -131,25 +188,15 @@ class ImportExportManager:
         Returns:
             Список словарей с зашифрованными данными
         """
-        entries = []
-        
         try:
             data = json.loads(json_content)
             
-            for item in data:
-                entry = {
-                    'site_name_enc': self.crypto.encrypt_data(encryption_key, item.get('site_name', '')),
-                    'url_enc': self.crypto.encrypt_data(encryption_key, item.get('url', '')),
-                    'username_enc': self.crypto.encrypt_data(encryption_key, item.get('username', '')),
-                    'password_enc': self.crypto.encrypt_data(encryption_key, item.get('password', '')),
-                    'notes_enc': self.crypto.encrypt_data(encryption_key, item.get('notes', '')),
-                    'totp_secret_enc': self.crypto.encrypt_data(encryption_key, item.get('totp_secret', '')),
-                    'favorite': item.get('favorite', False),
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                }
-                
-                entries.append(entry)
+            entries = self._encrypt_fields(data, encryption_key)
+            
+            for entry, item in zip(entries, data):
+                entry['favorite'] = item.get('favorite', False)
+                entry['created_at'] = datetime.utcnow()
+                entry['updated_at'] = datetime.utcnow()
             
             return entries
             
@@ -177,21 +224,12 @@ class ImportExportManager:
         
         writer.writeheader()
         
-        for entry in entries:
-            try:
-                row = {
-                    'site_name': self.crypto.decrypt_data(encryption_key, entry.get('site_name_enc', '')),
-                    'url': self.crypto.decrypt_data(encryption_key, entry.get('url_enc', '')),
-                    'username': self.crypto.decrypt_data(encryption_key, entry.get('username_enc', '')),
-                    'password': self.crypto.decrypt_data(encryption_key, entry.get('password_enc', '')),
-                    'notes': self.crypto.decrypt_data(encryption_key, entry.get('notes_enc', '')),
-                    'totp_secret': self.crypto.decrypt_data(encryption_key, entry.get('totp_secret_enc', '')),
-                    'favorite': entry.get('favorite', False)
-                }
-                writer.writerow(row)
-            except Exception as e:
-                print(f"Ошибка экспорта записи: {e}")
+        for entry, row in zip(entries, self._decrypt_fields(entries, encryption_key)):
+            if row is None:
+                print("Ошибка экспорта записи: не удалось расшифровать")
                 continue
+            row['favorite'] = entry.get('favorite', False)
+            writer.writerow(row)
         
         return output.getvalue()
     
@@ -209,26 +247,17 @@ class ImportExportManager:
         """
         export_data = []
         
-        for entry in entries:
-            try:
-                item = {
-                    'site_name': self.crypto.decrypt_data(encryption_key, entry.get('site_name_enc', '')),
-                    'url': self.crypto.decrypt_data(encryption_key, entry.get('url_enc', '')),
-                    'username': self.crypto.decrypt_data(encryption_key, entry.get('username_enc', '')),
-                    'password': self.crypto.decrypt_data(encryption_key, entry.get('password_enc', '')),
-                    'notes': self.crypto.decrypt_data(encryption_key, entry.get('notes_enc', '')),
-                    'totp_secret': self.crypto.decrypt_data(encryption_key, entry.get('totp_secret_enc', ''))
-                }
-                
-                if include_metadata:
-                    item['favorite'] = entry.get('favorite', False)
-                    item['created_at'] = entry.get('created_at').isoformat() if entry.get('created_at') else None
-                    item['updated_at'] = entry.get('updated_at').isoformat() if entry.get('updated_at') else None
-                
-                export_data.append(item)
-            except Exception as e:
-                print(f"Ошибка экспорта записи: {e}")
+        for entry, item in zip(entries, self._decrypt_fields(entries, encryption_key)):
+            if item is None:
+                print("Ошибка экспорта записи: не удалось расшифровать")
                 continue
+            
+            if include_metadata:
+                item['favorite'] = entry.get('favorite', False)
+                item['created_at'] = entry.get('created_at').isoformat() if entry.get('created_at') else None
+                item['updated_at'] = entry.get('updated_at').isoformat() if entry.get('updated_at') else None
+            
+            export_data.append(item)
         
         return json.dumps(export_data, indent=2, ensure_ascii=False)
     
@@ -258,18 +287,17 @@ class ImportExportManager:
             'entries': []
         }
         
-        # Экспортируем записи (они уже зашифрованы, просто копируем)
+        # Экспортируем записи (они уже зашифрованы, просто копируем;
+        # сырые байты из БД в режиме binary переводятся в base64)
         for entry in entries:
             export_entry = {
-                'site_name_enc': entry.get('site_name_enc', ''),
-                'url_enc': entry.get('url_enc', ''),
-                'username_enc': entry.get('username_enc', ''),
-                'password_enc': entry.get('password_enc', ''),
-                'notes_enc': entry.get('notes_enc', ''),
-                'totp_secret_enc': entry.get('totp_secret_enc', ''),
-                'favorite': entry.get('favorite', False),
-                'created_at': entry.get('created_at').isoformat() if entry.get('created_at') else None
+                f'{field}_enc': self._as_base64(entry.get(f'{field}_enc', ''))
+                for field in self.ENCRYPTED_FIELDS
             }
+            if entry.get('record_enc'):
+                export_entry['record_enc'] = self._as_base64(entry['record_enc'])
+            export_entry['favorite'] = entry.get('favorite', False)
+            export_entry['created_at'] = entry.get('created_at').isoformat() if entry.get('created_at') else None
             export_data['entries'].append(export_entry)
         
         # Шифруем весь JSON
@@ -287,12 +315,9 @@ class ImportExportManager:
         return json.dumps(result, indent=2)
 
 
-# Singleton instance
-_manager_instance = None
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_manager_instance = ProcessSingleton(ImportExportManager)
 
 def get_import_export_manager() -> ImportExportManager:
     """Получение singleton экземпляра менеджера"""
-    global _manager_instance
-    if _manager_instance is None:
-        _manager_instance = ImportExportManager()
-    return _manager_instance
+    return _manager_instance.get()
@@ -0,0 +1,198 @@
+"""
+Пул потоков для KDF (Argon2id, PBKDF2) с допуском по памяти
+Одновременно выполняется столько операций Argon2, сколько помещается
+в бюджет памяти; остальные ждут в очереди ограниченное время.
+argon2-cffi и hashlib.pbkdf2_hmac отпускают GIL, поэтому потоки
+выполняются параллельно и не блокируют остальные запросы.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from argon2 import extract_parameters
+from argon2.exceptions import InvalidHash
+
+from crypto_gost import GOSTCrypto
+from lifecycle import ProcessSingleton
+
+
+class KdfPoolBusy(Exception):
+    """Операция KDF не допущена: очередь переполнена или истекло время ожидания"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Сервер перегружен, повторите попытку позже")
+        self.retry_after = retry_after
+
+
+class KdfPool:
+    """
+    Ограниченный пул KDF
+
+    Допуск выполняется в потоке запроса до постановки в пул: операция
+    резервирует свою память (memory_cost Argon2, КиБ) и ждет, пока резерв
+    не поместится в бюджет. Новые операции не обгоняют ожидающие.
+    """
+
+    def __init__(self, memory_budget: int = 262144, workers: Optional[int] = None,
+                 queue_timeout: float = 5.0, max_queue: int = 64):
+        self.memory_budget = memory_budget
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='kdf')
+        self._cond = threading.Condition()
+
+        self.memory_in_use = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waits: deque = deque(maxlen=1000)
+        self._memory_op_seconds = 0.5  # скользящая оценка длительности Argon2 для Retry-After
+
+    def _retry_after(self, memory: int) -> int:
+        """Оценка времени до освобождения места в очереди, с"""
+        concurrency = max(1, self.memory_budget // max(memory, 1))
+        return max(1, math.ceil(self._memory_op_seconds * (self.waiting + 1) / concurrency))
+
+    def _admit(self, memory: int, timeout: float) -> int:
+        """Резервирование памяти (блокирует до timeout секунд)"""
+        memory = min(memory, self.memory_budget)
+        started = time.monotonic()
+
+        with self._cond:
+            fits = lambda: self.memory_in_use + memory <= self.memory_budget
+            if memory and (self.waiting or not fits()):
+                if timeout <= 0 or self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise KdfPoolBusy(self._retry_after(memory))
+                self.waiting += 1
+                try:
+                    admitted = self._cond.wait_for(fits, timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected += 1
+                    raise KdfPoolBusy(self._retry_after(memory))
+
+            self.memory_in_use += memory
+            self.in_flight += 1
+            self.admitted += 1
+            self._waits.append(time.monotonic() - started)
+        return memory
+
+    def _release(self, memory: int, duration: Optional[float]) -> None:
+        with self._cond:
+            self.memory_in_use -= memory
+            self.in_flight -= 1
+            if memory and duration is not None:
+                self._memory_op_seconds = 0.8 * self._memory_op_seconds + 0.2 * duration
+            self._cond.notify_all()
+
+    def submit(self, memory: int, func: Callable, *args, timeout: Optional[float] = None) -> Future:
+        """
+        Постановка операции в пул
+
+        Args:
+            memory: Память операции, КиБ (0 - без ограничения по памяти)
+            timeout: Время ожидания допуска, с (по умолчанию queue_timeout; 0 - не ждать)
+
+        Raises:
+            KdfPoolBusy: Операция не допущена
+        """
+        reserved = self._admit(memory, self.queue_timeout if timeout is None else timeout)
+
+        def task():
+            started = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                self._release(reserved, time.monotonic() - started)
+
+        try:
+            return self._executor.submit(task)
+        except Exception:
+            self._release(reserved, None)
+            raise
+
+    @staticmethod
+    def _hash_memory(crypto: GOSTCrypto, hash_str: str) -> int:
+        """memory_cost хэша Argon2 (параметры записаны в самом хэше)"""
+        try:
+            return extract_parameters(hash_str).memory_cost
+        except InvalidHash:
+            return crypto.ph.memory_cost
+
+    def verify(self, crypto: GOSTCrypto, password: str, hash_str: str, timeout: Optional[float] = None) -> bool:
+        """Проверка мастер-пароля в пуле"""
+        return self.submit(self._hash_memory(crypto, hash_str), crypto.verify_master_password,
+                           password, hash_str, timeout=timeout).result()
+
+    def hash(self, crypto: GOSTCrypto, password: str, timeout: Optional[float] = None) -> str:
+        """Хэширование мастер-пароля в пуле"""
+        return self.submit(crypto.ph.memory_cost, crypto.hash_master_password, password, timeout=timeout).result()
+
+    def derive_kek(self, crypto: GOSTCrypto, password: str, salt: bytes, iterations: Optional[int] = None,
+                   algorithm: Optional[str] = None, timeout: Optional[float] = None) -> bytes:
+        """Деривация ключа обёртки MEK в пуле (резерв памяти - как у операции Argon2)"""
+        return self.submit(crypto.ph.memory_cost, crypto.derive_kek, password, salt, iterations, algorithm,
+                           timeout=timeout).result()
+
+    def verify_and_derive(self, crypto: GOSTCrypto, password: str, hash_str: str, salt: bytes,
+                          iterations: Optional[int] = None,
+                          algorithm: Optional[str] = None) -> Tuple[bool, Optional[bytes]]:
+        """
+        Проверка мастер-пароля и деривация ключа PBKDF2 одной операцией пула
+        (деривация только после успешной проверки, под тем же резервом памяти)
+
+        Returns:
+            (пароль верен, ключ; None, если пароль неверен)
+        """
+        def task():
+            if not crypto.verify_master_password(password, hash_str):
+                return False, None
+            return True, crypto.derive_kek(password, salt, iterations, algorithm)
+
+        return self.submit(self._hash_memory(crypto, hash_str), task).result()
+
+    def stats(self) -> Dict:
+        """Глубина очереди, занятая память и время ожидания допуска"""
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                'workers': self.workers,
+                'memory_budget_kib': self.memory_budget,
+                'memory_in_use_kib': self.memory_in_use,
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'wait_ms_avg': round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                'wait_ms_p95': round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0,
+                'wait_ms_max': round(waits[-1] * 1000, 2) if waits else 0.0
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def _create_kdf_pool() -> KdfPool:
+    return KdfPool(
+        memory_budget=int(os.getenv('KDF_MEMORY_BUDGET_MB', 256)) * 1024,
+        workers=int(os.getenv('KDF_WORKERS', 0)) or None,
+        queue_timeout=float(os.getenv('KDF_QUEUE_TIMEOUT', 5)),
+        max_queue=int(os.getenv('KDF_MAX_QUEUE', 64))
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_kdf_pool_instance = ProcessSingleton(_create_kdf_pool)
+
+def get_kdf_pool() -> KdfPool:
+    """Получение singleton экземпляра пула KDF"""
+    return _kdf_pool_instance.get()
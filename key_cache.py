@@ -0,0 +1,136 @@
+"""
+Кэш развернутых ключей Кузнечика
+Развертывание ключа - самая дорогая часть шифрования короткого поля,
+а в рамках сессии все поля шифруются одним и тем же ключом (MEK)
+"""
+
+import hashlib
+import hmac
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class _CacheEntry:
+    """Контекст ключа и счетчик его текущих пользователей"""
+
+    __slots__ = ('context', 'users', 'evicted')
+
+    def __init__(self, context):
+        self.context = context
+        self.users = 0
+        self.evicted = False
+
+
+class KeyScheduleCache:
+    """
+    Ограниченный LRU-кэш контекстов шифра для процесса
+
+    Ключом служит HMAC-отпечаток ключа шифрования на случайном секрете
+    процесса, поэтому сами ключи в словаре не хранятся. Вытесненные
+    контексты обнуляются (clear()), как только их перестают использовать.
+    """
+
+    def __init__(self, max_size: int = 32):
+        if max_size < 1:
+            raise ValueError("Размер кэша ключей должен быть не меньше 1")
+        self.max_size = max_size
+        self._secret = secrets.token_bytes(32)
+        self._entries: "OrderedDict[bytes, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fingerprint(self, key: bytes) -> bytes:
+        """Отпечаток ключа (не раскрывает сам ключ)"""
+        return hmac.new(self._secret, key, hashlib.sha256).digest()
+
+    @contextmanager
+    def acquire(self, key: bytes, factory: Callable[[bytes], object]):
+        """
+        Получение контекста для ключа (создается через factory при промахе)
+        Контекст не будет обнулен, пока используется внутри блока with
+        """
+        fingerprint = self.fingerprint(key)
+
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            # Развертывание ключа выполняется вне блокировки
+            context = factory(key)
+            with self._lock:
+                entry = self._entries.get(fingerprint)
+                if entry is None:
+                    entry = _CacheEntry(context)
+                    self._entries[fingerprint] = entry
+                    self._evict_overflow()
+                else:
+                    # Другой поток успел добавить такой же контекст
+                    context.clear()
+                    self._entries.move_to_end(fingerprint)
+                entry.users += 1
+        else:
+            with self._lock:
+                entry.users += 1
+
+        try:
+            yield entry.context
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.evicted and entry.users == 0:
+                    entry.context.clear()
+
+    def _evict_overflow(self) -> None:
+        """Вытеснение самых старых контекстов (вызывается под блокировкой)"""
+        while len(self._entries) > self.max_size:
+            _, entry = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._retire(entry)
+
+    @staticmethod
+    def _retire(entry: _CacheEntry) -> None:
+        """Обнуление контекста сразу или после освобождения последним пользователем"""
+        entry.evicted = True
+        if entry.users == 0:
+            entry.context.clear()
+
+    def evict(self, key: bytes) -> bool:
+        """Удаление и обнуление контекста ключа (например, при выходе)"""
+        fingerprint = self.fingerprint(key)
+        with self._lock:
+            entry = self._entries.pop(fingerprint, None)
+            if entry is None:
+                return False
+            self.evictions += 1
+            self._retire(entry)
+        return True
+
+    def clear(self) -> None:
+        """Удаление и обнуление всех контекстов"""
+        with self._lock:
+            while self._entries:
+                _, entry = self._entries.popitem(last=False)
+                self._retire(entry)
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,420 @@
+"""
+Онлайн-ротация главного ключа шифрования (MEK)
+Строки PasswordEntry и EntryHistory перешифровываются новым ключом
+короткими пакетами; точка продолжения сохраняется в той же транзакции,
+что и пакет, поэтому после сбоя работа продолжается с последнего пакета.
+Пока ротация идет, чтение принимает оба ключа (KeyRing).
+"""
+
+import base64
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from crypto_gost import GOSTCrypto, KeyRing, get_crypto
+from entry_integrity import retag_entries
+from envelope import VERSION_LEGACY
+from lifecycle import ProcessSingleton
+from models import Database, KeyRotation, MasterEncryptionKey, CIPHERTEXT_COLUMNS, get_database
+
+# Таблицы в порядке обработки
+ROTATION_TABLES = ('password_entries', 'entry_history')
+
+# Ротация без отметки дольше этого срока считается прерванной и может быть продолжена
+LEASE_SECONDS = 60
+
+# Срок кэша идентификатора нового MEK в процессе, с (ротацию, начатую другим рабочим
+# процессом, этот процесс видит не позже чем через столько секунд)
+LATEST_KEY_TTL = 1.0
+
+
+def _timestamp(moment: Optional[datetime] = None) -> str:
+    """Отметка времени в формате, в котором SQLAlchemy хранит DateTime в SQLite"""
+    return (moment or datetime.utcnow()).isoformat(sep=' ', timespec='microseconds')
+
+
+def _reencrypt_batch(keys: KeyRing, rows: Sequence[Tuple], raw: bool) -> Tuple[List[Tuple[int, list]], List[int]]:
+    """
+    Перешифрование пакета строк (выполняется в рабочем процессе)
+
+    Args:
+        keys: Новый (current) и старый (previous) ключ
+        rows: Кортежи (id, значение_1, ...)
+        raw: Формат хранения - сырые байты
+
+    Returns:
+        (список (id, новые значения; None - значение не расшифровано),
+         id строк, в которых не расшифровано хотя бы одно значение)
+    """
+    if not rows:
+        return [], []
+
+    crypto = get_crypto()
+    width = len(rows[0]) - 1
+    values = [value for row in rows for value in row[1:]]
+    reencrypted = crypto.reencrypt_many(keys, values, raw=raw, strict=False)
+
+    results, failed = [], []
+    for i, row in enumerate(rows):
+        new_values = reencrypted[i * width:(i + 1) * width]
+        results.append((row[0], new_values))
+        if any(value is None for value in new_values):
+            failed.append(row[0])
+    return results, failed
+
+
+class KeyRotationJob:
+    """
+    Перешифрование хранилища новым MEK в фоновом потоке
+
+    Пакеты читаются наперед и перешифровываются пулом процессов,
+    а записываются строго по порядку id, каждый своей транзакцией.
+    Значения обновляются условным UPDATE, поэтому параллельная запись
+    пользователя (уже новым ключом) не перетирается. Значение, которое
+    не удалось расшифровать, остается как есть, остальные значения строки
+    переводятся на новый ключ; при таких строках прежний MEK сохраняется
+    в записи ротации (зашифрованным новым MEK).
+    """
+
+    def __init__(self, database: Database, crypto: GOSTCrypto, rotation_id: int, keys: KeyRing,
+                 batch_size: int = 500, workers: int = 1):
+        self.db = database
+        self.crypto = crypto
+        self.rotation_id = rotation_id
+        self.keys = keys
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started = None
+        self.rows_at_start = 0
+        self.rows_done = 0
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        """Запуск в фоновом потоке"""
+        self._thread = threading.Thread(target=self.run, name='mek-rotation', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """Остановка после текущего пакета (точка продолжения сохраняется)"""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _submit(self, rows: Sequence[Tuple]) -> Future:
+        """Перешифрование пакета в пуле процессов (при workers=1 - сразу в текущем потоке)"""
+        if self.workers < 2:
+            future = Future()
+            future.set_result(_reencrypt_batch(self.keys, rows, self.db.binary_storage))
+            return future
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool.submit(_reencrypt_batch, self.keys, rows, self.db.binary_storage)
+
+    def run(self) -> None:
+        """Перешифрование всех таблиц с точки продолжения"""
+        self.started = time.monotonic()
+        try:
+            with self.db.engine.connect() as connection:
+                state = connection.execute(
+                    text("SELECT table_name, cursor, rows_done FROM key_rotations WHERE id = :id"),
+                    {'id': self.rotation_id}
+                ).fetchone()
+            table_name, cursor, self.rows_done = state[0], state[1] or 0, state[2] or 0
+            self.rows_at_start = self.rows_done
+
+            tables = ROTATION_TABLES
+            if table_name in ROTATION_TABLES:
+                tables = ROTATION_TABLES[ROTATION_TABLES.index(table_name):]
+
+            for table in tables:
+                if not self._rotate_table(table, cursor if table == table_name else 0):
+                    return
+            self._complete()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def _rotate_table(self, table: str, cursor: int) -> bool:
+        """
+        Перешифрование таблицы начиная с id > cursor
+
+        Returns:
+            False, если работа остановлена
+        """
+        columns = CIPHERTEXT_COLUMNS[table]
+        select = text(f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > :cursor ORDER BY id LIMIT :limit")
+        read_cursor = cursor
+        exhausted = False
+        pending = deque()
+
+        while True:
+            # Чтение наперед: пока пул занят, следующие пакеты уже перешифровываются
+            while not exhausted and len(pending) < self.workers:
+                with self.db.engine.connect() as connection:
+                    rows = connection.execute(select, {'cursor': read_cursor, 'limit': self.batch_size}).fetchall()
+                if not rows:
+                    exhausted = True
+                    break
+                rows = [tuple(row) for row in rows]
+                read_cursor = rows[-1][0]
+                pending.append((rows, self._submit(rows)))
+
+            if not pending:
+                return True
+            if self._stop.is_set():
+                return False
+
+            rows, future = pending.popleft()
+            results, failed = future.result()
+            self._write_batch(table, columns, rows, results, failed)
+
+    def _write_batch(self, table: str, columns: Sequence[str], rows: Sequence[Tuple],
+                     results: List[Tuple[int, list]], failed: List[int]) -> None:
+        """Запись пакета и точки продолжения одной транзакцией"""
+        old_by_id = {row[0]: row[1:] for row in rows}
+        failed_ids = set(failed)
+        params: Dict[str, list] = {column: [] for column in columns}
+        for row_id, new_values in results:
+            for column, old_value, new_value in zip(columns, old_by_id[row_id], new_values):
+                if old_value and new_value is not None:
+                    params[column].append({'id': row_id, 'old': old_value, 'new': new_value})
+
+        with self.db.engine.begin() as connection:
+            for column, column_params in params.items():
+                if column_params:
+                    connection.execute(
+                        text(f"UPDATE {table} SET {column} = :new WHERE id = :id AND {column} = :old"),
+                        column_params
+                    )
+            tagged = [row_id for row_id, _ in results if row_id not in failed_ids]
+            if table == 'password_entries' and tagged:
+                # Имитовставки пересчитываются новым ключом (кроме строк с нерасшифрованными значениями)
+                retag_entries(connection, self.crypto, self.keys, tagged)
+            connection.execute(
+                text("UPDATE key_rotations SET table_name = :table, cursor = :cursor, "
+                     "rows_done = rows_done + :done, rows_failed = rows_failed + :failed, "
+                     "updated_at = :now WHERE id = :id"),
+                {'table': table, 'cursor': rows[-1][0], 'done': len(rows), 'failed': len(failed),
+                 'now': _timestamp(), 'id': self.rotation_id}
+            )
+        self.rows_done += len(rows)
+
+    def _complete(self) -> None:
+        """
+        Замена MEK новым ключом и закрытие ротации
+        Если часть значений не перешифрована, прежний MEK не теряется: он
+        сохраняется в retired_key, зашифрованный новым MEK. Сохраненные
+        ранее прежние ключи переводятся на новый MEK той же транзакцией.
+        """
+        db_session = self.db.get_session()
+        try:
+            rotation = db_session.get(KeyRotation, self.rotation_id)
+            retired = db_session.query(KeyRotation).filter(KeyRotation.retired_key.isnot(None),
+                                                           KeyRotation.id != rotation.id).all()
+            if retired:
+                reencrypted = self.crypto.reencrypt_many(self.keys, [item.retired_key for item in retired])
+                for item, value in zip(retired, reencrypted):
+                    item.retired_key = value
+            if rotation.rows_failed:
+                rotation.retired_key = self.crypto.encrypt_data(
+                    self.keys.current, base64.b64encode(self.keys.previous).decode('ascii'))
+
+            mek_record = db_session.query(MasterEncryptionKey).first()
+            mek_record.encrypted_key = rotation.encrypted_key
+            mek_record.updated_at = datetime.utcnow()
+            rotation.status = 'completed'
+            rotation.completed_at = datetime.utcnow()
+            rotation.updated_at = datetime.utcnow()
+            db_session.commit()
+        finally:
+            db_session.close()
+
+    def stats(self) -> Dict:
+        """Скорость текущего запуска"""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        processed = self.rows_done - self.rows_at_start
+        return {
+            'running': self.running,
+            'elapsed_seconds': round(elapsed, 1),
+            'rows_per_second': round(processed / elapsed, 1) if elapsed else 0.0,
+            'error': self.error
+        }
+
+
+class KeyRotationManager:
+    """Запуск, продолжение и состояние ротации MEK в процессе"""
+
+    def __init__(self, database: Database, crypto: GOSTCrypto, batch_size: int = 500, workers: int = 1):
+        self.db = database
+        self.crypto = crypto
+        self.batch_size = batch_size
+        self.workers = workers
+        self.job: Optional[KeyRotationJob] = None
+        self._lock = threading.Lock()
+        self._latest_key: Tuple[float, Optional[int]] = (float('-inf'), None)
+
+    def active(self, db_session) -> Optional[KeyRotation]:
+        """Незавершенная ротация"""
+        return db_session.query(KeyRotation).filter_by(status='running').first()
+
+    def latest_key_id(self) -> Optional[int]:
+        """
+        Идентификатор самого нового MEK (None, если ротаций не было)
+        Проверяется на каждом запросе, поэтому кэшируется на LATEST_KEY_TTL;
+        begin() в этом процессе обновляет кэш сразу
+        """
+        checked, key_id = self._latest_key
+        now = time.monotonic()
+        if now - checked < LATEST_KEY_TTL:
+            return key_id
+        with self.db.engine.connect() as connection:
+            key_id = connection.execute(
+                text("SELECT key_id FROM key_rotations ORDER BY id DESC LIMIT 1")
+            ).scalar()
+        self._latest_key = (now, key_id)
+        return key_id
+
+    def retired_key(self, rotation: KeyRotation, current_key: bytes) -> Optional[bytes]:
+        """Прежний MEK, сохраненный ротацией с нерасшифрованными значениями"""
+        if not rotation.retired_key:
+            return None
+        return base64.b64decode(self.crypto.decrypt_data(current_key, rotation.retired_key))
+
+    def unwrap_new_key(self, rotation: KeyRotation, kek: bytes) -> bytes:
+        """Расшифрование нового MEK ключом обёртки текущего"""
+        return self.crypto.unwrap_mek(base64.b64decode(rotation.encrypted_key), kek)
+
+    def begin(self, db_session, kek: bytes, current_key: bytes) -> Tuple[KeyRotation, KeyRing]:
+        """
+        Создание новой ротации и запуск перешифрования
+        kek - ключ обёртки текущего MEK (им же обертывается новый)
+
+        Returns:
+            (запись ротации, ключи: новый для записи и старый для чтения)
+        """
+        if self.crypto.envelope_version == VERSION_LEGACY:
+            raise ValueError("Ротация MEK требует формата шифртекста с идентификатором ключа")
+        if self.active(db_session):
+            raise ValueError("Ротация MEK уже выполняется")
+
+        new_key = self.crypto.generate_mek()
+        encrypted_key = self.crypto.wrap_mek(new_key, kek)
+
+        rows_total = sum(
+            db_session.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() for table in ROTATION_TABLES
+        )
+        rotation = KeyRotation(
+            encrypted_key=base64.b64encode(encrypted_key).decode('utf-8'),
+            key_id=self.crypto.key_id(new_key),
+            table_name=ROTATION_TABLES[0],
+            cursor=0,
+            rows_done=0,
+            rows_total=rows_total,
+            rows_failed=0
+        )
+        db_session.add(rotation)
+        db_session.commit()
+        self._latest_key = (time.monotonic(), rotation.key_id)
+
+        keys = KeyRing(new_key, current_key)
+        self._start_job(rotation.id, keys)
+        return rotation, keys
+
+    def resume(self, rotation_id: int, keys: KeyRing) -> bool:
+        """
+        Продолжение прерванной ротации с точки продолжения
+        Ротацию, которую недавно обновлял другой процесс, не трогаем
+        """
+        with self._lock:
+            if self.job is not None and self.job.running:
+                return self.job.rotation_id == rotation_id
+
+            stale = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+            with self.db.engine.begin() as connection:
+                claimed = connection.execute(
+                    text("UPDATE key_rotations SET updated_at = :now "
+                         "WHERE id = :id AND status = 'running' AND (updated_at IS NULL OR updated_at < :stale)"),
+                    {'now': _timestamp(), 'id': rotation_id, 'stale': _timestamp(stale)}
+                ).rowcount
+            if not claimed:
+                return False
+
+            self.job = KeyRotationJob(self.db, self.crypto, rotation_id, keys, self.batch_size, self.workers)
+            self.job.start()
+            return True
+
+    def _start_job(self, rotation_id: int, keys: KeyRing) -> None:
+        with self._lock:
+            self.job = KeyRotationJob(self.db, self.crypto, rotation_id, keys, self.batch_size, self.workers)
+            self.job.start()
+
+    def progress(self, db_session) -> Optional[Dict]:
+        """Прогресс последней ротации и скорость в текущем процессе"""
+        rotation = db_session.query(KeyRotation).order_by(KeyRotation.id.desc()).first()
+        if rotation is None:
+            return None
+
+        result = {
+            'id': rotation.id,
+            'status': rotation.status,
+            'table': rotation.table_name,
+            'cursor': rotation.cursor,
+            'rows_done': rotation.rows_done,
+            'rows_total': rotation.rows_total,
+            'rows_failed': rotation.rows_failed,
+            'previous_key_retained': rotation.retired_key is not None,
+            'percent': round(100.0 * rotation.rows_done / rotation.rows_total, 1) if rotation.rows_total else 100.0,
+            'started_at': rotation.started_at.isoformat() if rotation.started_at else None,
+            'completed_at': rotation.completed_at.isoformat() if rotation.completed_at else None
+        }
+
+        if self.job is not None and self.job.rotation_id == rotation.id:
+            result.update(self.job.stats())
+            rate = result['rows_per_second']
+            remaining = max(0, rotation.rows_total - rotation.rows_done)
+            result['eta_seconds'] = round(remaining / rate, 1) if rate and rotation.status == 'running' else None
+        return result
+
+    def shutdown(self) -> None:
+        """Остановка фоновой ротации (продолжится при следующем запуске)"""
+        if self.job is not None:
+            self.job.stop()
+
+
+def _create_key_rotation_manager() -> KeyRotationManager:
+    return KeyRotationManager(
+        get_database(),
+        get_crypto(),
+        batch_size=int(os.getenv('MEK_ROTATION_BATCH', 500)),
+        workers=int(os.getenv('MEK_ROTATION_WORKERS', 0)) or os.cpu_count() or 1
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_rotation_instance = ProcessSingleton(_create_key_rotation_manager)
+
+def get_key_rotation_manager() -> KeyRotationManager:
+    """Получение singleton экземпляра менеджера ротации MEK"""
+    return _rotation_instance.get()
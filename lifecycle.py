@@ -0,0 +1,139 @@
+"""
+Жизненный цикл объектов процесса
+Тяжелые объекты (движок БД, криптомодуль, пулы потоков и процессов)
+создаются лениво при первом обращении, под блокировкой, один раз на процесс.
+После fork дочерний процесс создает их заново: соединения SQLite, потоки
+пулов и блокировки родителя в нем непригодны. Неизменяемые таблицы
+(таблицы шифров, словари zxcvbn) загружаются до fork вызовом preload(),
+и рабочие процессы делят их страницы в режиме copy-on-write.
+"""
+
+import gc
+import logging
+import os
+import threading
+from typing import Callable, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_singletons: List['ProcessSingleton'] = []
+_child_callbacks: List[Callable[[], None]] = []
+
+
+def after_fork(callback: Callable[[], None]) -> Callable[[], None]:
+    """
+    Вызов callback в дочернем процессе сразу после fork
+    (например, для замены модульных блокировок, которые мог держать другой поток)
+    """
+    _child_callbacks.append(callback)
+    return callback
+
+
+def _run_child_callbacks() -> None:
+    for singleton in _singletons:
+        singleton._forget_after_fork()
+    for callback in _child_callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Ошибка обработчика после fork")
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_run_child_callbacks)
+
+
+class ProcessSingleton(Generic[T]):
+    """
+    Объект, создаваемый лениво один раз на процесс
+
+    Создание - под блокировкой (двойная проверка), поэтому параллельные
+    первые запросы получают один экземпляр. После fork экземпляр родителя
+    отбрасывается (с вызовом on_fork, если задан) и создается заново.
+    """
+
+    def __init__(self, factory: Callable[..., T], on_fork: Optional[Callable[[T], None]] = None):
+        self.factory = factory
+        self.on_fork = on_fork
+        self._instance: Optional[T] = None
+        self._lock = threading.Lock()
+        _singletons.append(self)
+
+    def get(self, *args, **kwargs) -> T:
+        """Экземпляр процесса (аргументы передаются factory при создании)"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._instance = self.factory(*args, **kwargs)
+        return instance
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    def reset(self) -> None:
+        """Сброс экземпляра (следующий get создаст новый)"""
+        with self._lock:
+            self._instance = None
+
+    def _forget_after_fork(self) -> None:
+        # Блокировку мог держать поток родителя, которого в дочернем процессе нет
+        self._lock = threading.Lock()
+        instance, self._instance = self._instance, None
+        if instance is not None and self.on_fork is not None:
+            try:
+                self.on_fork(instance)
+            except Exception:
+                logger.exception("Ошибка освобождения %r после fork", instance)
+
+
+class SingletonProxy:
+    """
+    Доступ к объекту процесса через атрибуты
+    Позволяет держать в модуле глобальное имя (db, crypto), не создавая
+    объект при импорте и не унося объект родителя в рабочий процесс
+    """
+
+    __slots__ = ('_getter',)
+
+    def __init__(self, getter: Callable[[], object]):
+        object.__setattr__(self, '_getter', getter)
+
+    def __getattr__(self, name: str):
+        return getattr(self._getter(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._getter(), name, value)
+
+    def __repr__(self) -> str:
+        return f"<SingletonProxy({self._getter.__name__})>"
+
+
+def preload(wordlist_path: Optional[str] = None) -> None:
+    """
+    Загрузка неизменяемых таблиц до fork (мастер-процесс сервера)
+
+    Таблицы Кузнечика и Стрибога строятся при импорте модулей,
+    реализации шифров проверяются и выбираются один раз, словари zxcvbn
+    загружаются импортом password_strength. Объекты с состоянием
+    (БД, ключи, пулы) не создаются. После загрузки gc.freeze() убирает
+    загруженное из сборки мусора, чтобы она не копировала общие страницы.
+    """
+    import crypto_backends
+    import password_generator
+    import password_strength  # noqa: F401 - словари zxcvbn строятся при импорте
+
+    crypto_backends.resolve_backend('kuznechik', os.getenv('KUZNECHIK_BACKEND'))
+    crypto_backends.resolve_backend('streebog', os.getenv('STREEBOG_BACKEND'))
+
+    wordlist_path = wordlist_path or os.getenv('PASSPHRASE_WORDLIST', 'wordlist.txt')
+    if wordlist_path and os.path.exists(wordlist_path):
+        password_generator.load_wordlist(wordlist_path)
+
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
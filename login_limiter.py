@@ -0,0 +1,186 @@
+"""
+Ограничение попыток входа по IP (скользящее окно в памяти)
+Проверка не обращается к БД: у каждого IP - кольцевой буфер времени
+последних max_attempts неудачных попыток, проверка и запись - O(1)
+под одной блокировкой. Попытки пишутся в login_attempts отложенно
+(WriteBehindWriter) - только для расследований. При запуске процесса
+буферы восстанавливаются из попыток за последнее окно, а записи старше
+срока хранения удаляются фоновой очисткой.
+Счетчики свои в каждом рабочем процессе.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from audit_log import WriteBehindWriter
+from lifecycle import ProcessSingleton
+from models import Database, LoginAttempt, get_database
+
+logger = logging.getLogger(__name__)
+
+# Строк за одно удаление при очистке (короткие транзакции не держат запись надолго)
+PRUNE_BATCH = 5000
+
+# Интервал фоновой очистки, с
+PRUNE_INTERVAL = 3600
+
+
+class LoginRateLimiter:
+    """
+    Скользящее окно неудачных попыток входа по IP
+
+    check() резервирует попытку до проверки пароля, поэтому параллельные
+    запросы с одного IP не проходят все разом, пока идет Argon2;
+    успешный вход резерв снимает, как и release() для попытки без вердикта
+    (перегрузка пула KDF, ошибка сервера). Число отслеживаемых IP ограничено:
+    при переполнении вытесняется IP, к которому дольше всего не обращались.
+    """
+
+    def __init__(self, database: Database, max_attempts: int = 5, window: float = 30,
+                 retention_days: int = 30, max_tracked: int = 100000,
+                 writer: Optional[WriteBehindWriter] = None):
+        self.db = database
+        self.max_attempts = max(1, max_attempts)
+        self.window = window
+        self.retention_days = retention_days
+        self.max_tracked = max_tracked
+        self.writer = writer or WriteBehindWriter(database, LoginAttempt.__table__,
+                                                  name='login-attempts', flush_interval=1.0)
+        self._failures: 'OrderedDict[str, deque]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._next_prune = 0.0
+        self.rejected = 0
+        self.evicted = 0
+        self.pruned = 0
+
+    def _recent(self, ip_address: str, now: float) -> deque:
+        """Буфер IP без попыток старше окна (вызывается под блокировкой)"""
+        failures = self._failures.get(ip_address)
+        if failures is None:
+            failures = self._failures[ip_address] = deque(maxlen=self.max_attempts)
+            if len(self._failures) > self.max_tracked:
+                self._failures.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._failures.move_to_end(ip_address)
+        cutoff = now - self.window
+        while failures and failures[0] <= cutoff:
+            failures.popleft()
+        return failures
+
+    def check(self, ip_address: str) -> Tuple[bool, int]:
+        """
+        Проверка ограничения с резервированием попытки
+        Возвращает: (allowed, remaining_attempts) - оставшиеся попытки до этой
+        """
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(ip_address, now)
+            remaining = self.max_attempts - len(failures)
+            if remaining <= 0:
+                self.rejected += 1
+                return False, remaining
+            failures.append(now)
+        self._maybe_prune()
+        return True, remaining
+
+    def release(self, ip_address: str) -> None:
+        """Снятие резерва check() без записи попытки"""
+        with self._lock:
+            failures = self._failures.get(ip_address)
+            if failures:
+                failures.pop()
+
+    def record(self, ip_address: str, success: bool) -> None:
+        """Итог попытки, разрешенной check(); успешный вход снимает резерв"""
+        if success:
+            self.release(ip_address)
+        self.writer.put({'ip_address': ip_address, 'timestamp': datetime.utcnow(), 'success': success})
+
+    def rehydrate(self) -> int:
+        """Восстановление окна из неудачных попыток в БД; возвращает число попыток"""
+        now, utc_now = time.monotonic(), datetime.utcnow()
+        query = select(LoginAttempt.ip_address, LoginAttempt.timestamp).where(
+            LoginAttempt.timestamp > utc_now - timedelta(seconds=self.window),
+            LoginAttempt.success == False
+        ).order_by(LoginAttempt.timestamp)
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+
+        with self._lock:
+            for ip_address, timestamp in rows:
+                failures = self._recent(ip_address, now)
+                failures.append(now - (utc_now - timestamp).total_seconds())
+        return len(rows)
+
+    def prune(self) -> int:
+        """Удаление попыток старше срока хранения; возвращает число строк"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        old_ids = select(LoginAttempt.id).where(LoginAttempt.timestamp < cutoff).limit(PRUNE_BATCH)
+        removed = 0
+        while True:
+            with self.db.engine.begin() as connection:
+                count = connection.execute(delete(LoginAttempt).where(LoginAttempt.id.in_(old_ids))).rowcount
+            removed += count
+            if count < PRUNE_BATCH:
+                break
+        self.pruned += removed
+        return removed
+
+    def _maybe_prune(self) -> None:
+        """Запуск очистки в фоновом потоке не чаще PRUNE_INTERVAL"""
+        if self.retention_days <= 0 or time.monotonic() < self._next_prune:
+            return
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+        def run():
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error("Ошибка очистки журнала попыток входа: %s", e)
+            finally:
+                self._prune_lock.release()
+
+        threading.Thread(target=run, name='login-attempts-prune', daemon=True).start()
+
+    def stats(self) -> Dict:
+        """Отслеживаемые IP, отказы и очередь записи"""
+        with self._lock:
+            tracked = len(self._failures)
+        return {
+            'tracked_ips': tracked,
+            'rejected': self.rejected,
+            'evicted': self.evicted,
+            'pruned': self.pruned,
+            'persist': self.writer.stats()
+        }
+
+
+def _create_login_limiter() -> LoginRateLimiter:
+    limiter = LoginRateLimiter(
+        get_database(),
+        max_attempts=int(os.getenv('MAX_LOGIN_ATTEMPTS', 5)),
+        window=int(os.getenv('LOCKOUT_DURATION', 30)),
+        retention_days=int(os.getenv('LOGIN_ATTEMPTS_RETENTION_DAYS', 30)),
+        max_tracked=int(os.getenv('LOGIN_LIMITER_MAX_IPS', 100000))
+    )
+    limiter.rehydrate()
+    return limiter
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_limiter_instance = ProcessSingleton(_create_login_limiter)
+
+def get_login_limiter() -> LoginRateLimiter:
+    """Получение singleton экземпляра ограничителя попыток входа"""
+    return _limiter_instance.get()
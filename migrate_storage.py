@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Перевод шифртекстов в базе данных между форматами хранения
+base64 (Text) <-> binary (LargeBinary, сырые nonce + ciphertext)
+Миграция идет короткими транзакциями, приложение можно не останавливать
+"""
+
+import argparse
+import time
+
+from models import Database, CIPHERTEXT_STORAGE_MODES
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Миграция формата хранения шифртекстов')
+    parser.add_argument('--db', default='password_manager.db', help='Путь к базе данных')
+    parser.add_argument('--to', choices=CIPHERTEXT_STORAGE_MODES, default='binary',
+                        help='Целевой формат хранения (по умолчанию: binary)')
+    parser.add_argument('--batch', type=int, default=500, help='Строк в одной транзакции')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  🔐 Миграция формата хранения шифртекстов")
+    print("=" * 60)
+    print()
+
+    db = Database(args.db, ciphertext_storage=args.to)
+    started = time.monotonic()
+
+    def progress(table, converted):
+        print(f"   ✓ {table}: преобразовано строк {converted}")
+
+    converted = db.migrate_ciphertext_storage(batch_size=args.batch, progress=progress)
+
+    print(f"✅ Готово: {converted} строк за {time.monotonic() - started:.1f} с")
+    print(f"Не забудьте установить CIPHERTEXT_STORAGE={args.to} для приложения")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,55 @@
 """
 
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean
+import threading
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, Text, DateTime, Boolean, LargeBinary, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.types import TypeDecorator
+import base64
 import os
+import sqlite3
+from lifecycle import ProcessSingleton
 
 Base = declarative_base()
 
+# Формат хранения шифртекстов: 'base64' (Text) или 'binary' (LargeBinary)
+CIPHERTEXT_STORAGE_MODES = ('base64', 'binary')
+
+
+def _storage_mode(dialect) -> str:
+    """Формат хранения БД: задается на диалекте движка каждого Database"""
+    return getattr(dialect, 'ciphertext_storage', 'base64')
+
+
+class Ciphertext(TypeDecorator):
+    """
+    Колонка шифртекста nonce + ciphertext
+    В режиме 'base64' хранится строкой, в режиме 'binary' - сырыми байтами.
+    Значение приводится к формату хранения при записи; при чтении
+    возвращается как есть (str или bytes), decrypt_data принимает оба.
+    Формат берется из диалекта движка, поэтому базы с разными форматами
+    в одном процессе не влияют друг на друга
+    """
+    impl = Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if _storage_mode(dialect) == 'binary':
+            return dialect.type_descriptor(LargeBinary())
+        return dialect.type_descriptor(Text())
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if _storage_mode(dialect) == 'binary':
+            if isinstance(value, str):
+                return base64.b64decode(value)
+            return bytes(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return base64.b64encode(value).decode('utf-8')
+        return value
+
 
 class MasterPassword(Base):
     """
@@ -39,6 +81,7 @@ class MasterEncryptionKey(Base):
     encrypted_key = Column(String(512), nullable=False)  # Base64 encoded зашифрованный MEK
     kdf_salt = Column(String(255), nullable=False)  # Соль для KDF
     kdf_iterations = Column(Integer, nullable=False, default=100000)  # Итерации PBKDF2
+    kdf_algorithm = Column(String(32))  # KDF ключа обёртки (NULL - исходный PBKDF2-HMAC-SHA512)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -46,21 +89,74 @@ class MasterEncryptionKey(Base):
         return f"<MasterEncryptionKey(id={self.id})>"
 
 
+class KeyRotation(Base):
+    """
+    Ротация MEK: новый ключ и точка продолжения перешифрования
+    Новый MEK зашифрован тем же ключом из мастер-пароля, что и текущий
+    """
+    __tablename__ = 'key_rotations'
+    
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, default='running')  # running, completed
+    encrypted_key = Column(String(512), nullable=False)  # Base64 encoded зашифрованный новый MEK
+    key_id = Column(Integer, nullable=False)  # Идентификатор нового MEK в заголовках шифртекстов
+    table_name = Column(String(64))  # Обрабатываемая таблица
+    cursor = Column(Integer, default=0)  # Последний перешифрованный id в таблице
+    rows_done = Column(Integer, default=0)
+    rows_total = Column(Integer, default=0)
+    rows_failed = Column(Integer, default=0)
+    retired_key = Column(Text)  # Прежний MEK, зашифрованный текущим, если часть значений не перешифрована
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Отметка последнего пакета
+    completed_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<KeyRotation(id={self.id}, status={self.status}, table={self.table_name}, cursor={self.cursor})>"
+
+
+class VaultScrub(Base):
+    """
+    Проверка целостности хранилища: точка продолжения и найденные повреждения
+    Каждый запуск продолжает незавершенную проверку с cursor
+    """
+    __tablename__ = 'vault_scrubs'
+    
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, default='running')  # running, completed
+    cursor = Column(Integer, default=0)  # Последний проверенный id записи
+    rows_checked = Column(Integer, default=0)
+    rows_corrupt = Column(Integer, default=0)
+    rows_untagged = Column(Integer, default=0)  # Записи без имитовставки
+    corrupt_ids = Column(Text)  # id поврежденных записей через запятую
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Отметка последнего пакета
+    completed_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<VaultScrub(id={self.id}, status={self.status}, cursor={self.cursor})>"
+
+
 class PasswordEntry(Base):
     """
     Таблица для хранения записей паролей
     Все чувствительные данные хранятся в зашифрованном виде
     """
     __tablename__ = 'password_entries'
+    __table_args__ = (
+        Index('ix_password_entries_category_id', 'category_id'),
+        Index('ix_password_entries_favorite', 'favorite'),
+    )
     
     id = Column(Integer, primary_key=True)
-    site_name_enc = Column(Text, nullable=False)  # Зашифрованное название сайта
-    url_enc = Column(Text)  # Зашифрованный URL
-    username_enc = Column(Text, nullable=False)  # Зашифрованный логин
-    password_enc = Column(Text, nullable=False)  # Зашифрованный пароль
-    notes_enc = Column(Text)  # Зашифрованные заметки
-    totp_secret_enc = Column(Text)  # Зашифрованный TOTP секрет
-    custom_fields_enc = Column(Text)  # Зашифрованные кастомные поля (JSON)
+    site_name_enc = Column(Ciphertext, nullable=False)  # Зашифрованное название сайта
+    url_enc = Column(Ciphertext)  # Зашифрованный URL
+    username_enc = Column(Ciphertext, nullable=False)  # Зашифрованный логин
+    password_enc = Column(Ciphertext, nullable=False)  # Зашифрованный пароль
+    notes_enc = Column(Ciphertext)  # Зашифрованные заметки
+    totp_secret_enc = Column(Ciphertext)  # Зашифрованный TOTP секрет
+    custom_fields_enc = Column(Ciphertext)  # Зашифрованные кастомные поля (JSON)
+    record_enc = Column(Ciphertext)  # Все поля одной зашифрованной записью (режим RECORD_ENCRYPTION)
+    mac_tag = Column(LargeBinary)  # Имитовставка CMAC по шифртекстам строки (режим ENTRY_MAC)
     
     # Метаданные (не шифруются)
     category_id = Column(Integer)  # Ссылка на категорию
@@ -80,6 +176,9 @@ class AuditLog(Base):
     Хранит только метаданные, без секретов
     """
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        Index('ix_audit_logs_timestamp', 'timestamp'),  # Журнал выводится по времени
+    )
     
     id = Column(Integer, primary_key=True)
     action = Column(String(50), nullable=False)  # create, read, update, delete, login, etc.
@@ -100,6 +199,9 @@ class LoginAttempt(Base):
     Защита от brute-force атак
     """
     __tablename__ = 'login_attempts'
+    __table_args__ = (
+        Index('ix_login_attempts_ip_timestamp', 'ip_address', 'timestamp'),  # Проверка блокировки по IP
+    )
     
     id = Column(Integer, primary_key=True)
     ip_address = Column(String(45), nullable=False)
@@ -181,6 +283,10 @@ class EntryTag(Base):
     Связь многие-ко-многим между записями и тегами
     """
     __tablename__ = 'entry_tags'
+    __table_args__ = (
+        Index('ix_entry_tags_entry_id', 'entry_id'),
+        Index('ix_entry_tags_tag_id', 'tag_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     entry_id = Column(Integer, nullable=False)
@@ -196,13 +302,16 @@ class EntryHistory(Base):
     История изменений записей
     """
     __tablename__ = 'entry_history'
+    __table_args__ = (
+        Index('ix_entry_history_entry_changed', 'entry_id', 'changed_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     entry_id = Column(Integer, nullable=False)
     action = Column(String(50), nullable=False)  # created, updated, password_changed, etc.
     field_name = Column(String(100))  # Какое поле изменено
-    old_value_enc = Column(Text)  # Старое значение (зашифровано)
-    new_value_enc = Column(Text)  # Новое значение (зашифровано)
+    old_value_enc = Column(Ciphertext)  # Старое значение (зашифровано)
+    new_value_enc = Column(Ciphertext)  # Новое значение (зашифровано)
     changed_at = Column(DateTime, default=datetime.utcnow)
     ip_address = Column(String(45))
     
@@ -241,47 +350,353 @@ class PasswordHealth(Base):
         return f"<PasswordHealth(entry_id={self.entry_id}, is_breached={self.is_breached})>"
 
 
+# Профили соединений SQLite (PRAGMA на каждое новое соединение)
+# wal     - WAL: читатели не блокируют писателя, fsync только при checkpoint
+# durable - WAL с fsync на каждый commit (synchronous=FULL)
+# legacy  - журнал отката, как до профилей (сетевые ФС без общей памяти для WAL)
+SQLITE_PROFILES = {
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16384,  # КиБ (16 MiB)
+        'mmap_size': 256 << 20,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,  # мс
+        'wal_autocheckpoint': 1000,  # страниц
+        'journal_size_limit': 64 << 20,  # размер WAL после checkpoint
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16384,
+        'mmap_size': 256 << 20,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+        'wal_autocheckpoint': 1000,
+        'journal_size_limit': 64 << 20,
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+}
+
+# Порядок применения: journal_mode первым, остальные зависят от режима журнала
+_PRAGMA_ORDER = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store',
+                 'busy_timeout', 'wal_autocheckpoint', 'journal_size_limit')
+
+
+def sqlite_pragmas(profile: str = None, overrides: dict = None) -> dict:
+    """
+    PRAGMA профиля с переопределениями
+    Переменные окружения SQLITE_<PRAGMA> (например SQLITE_CACHE_SIZE) переопределяют профиль
+    """
+    profile = profile or os.getenv('SQLITE_PROFILE', 'wal')
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Неизвестный профиль SQLite: {profile}")
+    
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in _PRAGMA_ORDER:
+        value = os.getenv(f'SQLITE_{name.upper()}')
+        if value:
+            pragmas[name] = value
+    pragmas.update(overrides or {})
+    
+    unknown = set(pragmas) - set(_PRAGMA_ORDER)
+    if unknown:
+        raise ValueError(f"Неизвестные PRAGMA: {', '.join(sorted(unknown))}")
+    for name, value in pragmas.items():
+        # Значение подставляется в текст PRAGMA: только числа и ключевые слова
+        if not str(value).lstrip('-').isalnum():
+            raise ValueError(f"Недопустимое значение PRAGMA {name}: {value}")
+    return {name: pragmas[name] for name in _PRAGMA_ORDER if name in pragmas}
+
+
+# Колонки с шифртекстами по таблицам (для миграции формата хранения)
+CIPHERTEXT_COLUMNS = {
+    'password_entries': ('site_name_enc', 'url_enc', 'username_enc', 'password_enc',
+                         'notes_enc', 'totp_secret_enc', 'custom_fields_enc', 'record_enc'),
+    'entry_history': ('old_value_enc', 'new_value_enc'),
+}
+
+
+def _sync_tables(connection):
+    """
+    Создание отсутствующих таблиц и новых nullable-колонок в существующих
+    (create_all создает только отсутствующие таблицы)
+    """
+    Base.metadata.create_all(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {row[1] for row in connection.execute(text(f"PRAGMA table_info({table.name})"))}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                ))
+
+
+def _create_indexes(connection):
+    """Индексы горячих запросов (блокировка IP, журнал аудита, история и теги записей)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    # Статистика для планировщика по новым индексам
+    connection.exec_driver_sql("ANALYZE")
+
+
+# Миграции схемы: (версия, описание, функция(connection)); новые - только в конец
+SCHEMA_MIGRATIONS = (
+    (1, 'Таблицы и колонки', _sync_tables),
+    (2, 'Индексы горячих запросов', _create_indexes),
+    (3, 'Прежний MEK ротации с ошибками', _sync_tables),
+)
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
 class Database:
     """
     Класс для управления базой данных
     """
     
-    def __init__(self, db_path: str = None):
+    # Проверка размера WAL - раз в столько возвратов соединения в пул
+    CHECKPOINT_EVERY = 100
+    
+    def __init__(self, db_path: str = None, ciphertext_storage: str = None,
+                 sqlite_profile: str = None, pragmas: dict = None):
         if db_path is None:
             db_path = os.getenv('DATABASE_PATH', 'password_manager.db')
+        if ciphertext_storage is None:
+            ciphertext_storage = os.getenv('CIPHERTEXT_STORAGE', 'base64')
+        if ciphertext_storage not in CIPHERTEXT_STORAGE_MODES:
+            raise ValueError(f"Неизвестный формат хранения шифртекстов: {ciphertext_storage}")
         
         self.db_path = db_path
+        self.ciphertext_storage = ciphertext_storage
+        self.pragmas = sqlite_pragmas(sqlite_profile, pragmas)
+        # WAL сверх этого размера сворачивается checkpoint(TRUNCATE), даже если
+        # автоматический checkpoint не успевает за постоянными читателями
+        self.wal_limit = int(os.getenv('SQLITE_WAL_LIMIT_MB', 64)) << 20
+        self.checkpoints = 0
+        self._checkins = 0
+        self._checkpoint_lock = threading.Lock()
+        
         self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
-        Base.metadata.create_all(self.engine)
+        # Диалект свой у каждого движка: Ciphertext читает формат отсюда
+        self.engine.dialect.ciphertext_storage = ciphertext_storage
+        event.listen(self.engine, 'connect', self._on_connect)
+        if self.pragmas.get('journal_mode', '').upper() == 'WAL':
+            event.listen(self.engine, 'checkin', self._on_checkin)
+        self.schema_version = self.migrate()
         self.Session = sessionmaker(bind=self.engine)
     
+    def migrate(self) -> int:
+        """
+        Применение недостающих миграций схемы (версия - PRAGMA user_version)
+        
+        Актуальная схема проверяется одним PRAGMA, без create_all. Каждая
+        миграция выполняется своей транзакцией BEGIN IMMEDIATE с повторной
+        проверкой версии, поэтому рабочие процессы, стартующие одновременно,
+        не применяют ее дважды, а остальные запросы ждут не дольше одной миграции.
+        
+        Returns:
+            Версия схемы
+        """
+        with self.engine.connect() as connection:
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+            connection.commit()
+            
+            for target, description, apply in SCHEMA_MIGRATIONS:
+                if target <= version:
+                    continue
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                try:
+                    version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+                    if version < target:
+                        apply(connection)
+                        connection.exec_driver_sql(f"PRAGMA user_version = {target}")
+                        version = target
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+        return version
+    
+    def _on_connect(self, dbapi_connection, connection_record):
+        """Применение PRAGMA профиля к новому соединению"""
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+    
+    def _on_checkin(self, dbapi_connection, connection_record):
+        """
+        Ограничение размера WAL: соединение вернулось в пул вне транзакции,
+        изредка проверяем размер файла и при превышении сворачиваем WAL
+        """
+        if dbapi_connection is None:
+            return
+        self._checkins += 1
+        if self._checkins % self.CHECKPOINT_EVERY or self.wal_size() <= self.wal_limit:
+            return
+        if not self._checkpoint_lock.acquire(blocking=False):
+            return
+        try:
+            dbapi_connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            self.checkpoints += 1
+        except sqlite3.Error:
+            pass  # Занято читателями - повторим при следующей проверке
+        finally:
+            self._checkpoint_lock.release()
+    
+    def wal_size(self) -> int:
+        """Размер файла WAL в байтах (0, если его нет)"""
+        try:
+            return os.path.getsize(f'{self.db_path}-wal')
+        except OSError:
+            return 0
+    
+    def checkpoint(self, mode: str = 'PASSIVE') -> tuple:
+        """
+        Перенос WAL в основной файл БД
+        
+        Args:
+            mode: PASSIVE, FULL, RESTART или TRUNCATE
+        
+        Returns:
+            (занято, страниц в WAL, перенесено страниц)
+        """
+        if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise ValueError(f"Неизвестный режим checkpoint: {mode}")
+        with self.engine.connect() as connection:
+            result = tuple(connection.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").fetchone())
+        self.checkpoints += 1
+        return result
+    
+    def stats(self) -> dict:
+        """Профиль соединений и состояние WAL"""
+        with self.engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+        return {
+            'journal_mode': journal_mode,
+            'pragmas': self.pragmas,
+            'wal_bytes': self.wal_size(),
+            'wal_limit_bytes': self.wal_limit,
+            'checkpoints': self.checkpoints,
+            'pool_size': self.engine.pool.size() if hasattr(self.engine.pool, 'size') else None
+        }
+    
+    def after_fork(self):
+        """
+        Отказ от соединений, унаследованных от родительского процесса
+        Соединения не закрываются: ими продолжает пользоваться родитель
+        """
+        self.engine.dispose(close=False)
+    
     def get_session(self):
         """Получение новой сессии БД"""
         return self.Session()
     
-    def init_db(self):
-        """Инициализация базы данных"""
-        Base.metadata.create_all(self.engine)
-    
     def drop_all(self):
-        """Удаление всех таблиц (для тестирования)"""
+        """Удаление всех таблиц (для тестирования); следующий migrate() создаст схему заново"""
         Base.metadata.drop_all(self.engine)
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql("PRAGMA user_version = 0")
+        self.schema_version = 0
+    
+    @property
+    def binary_storage(self) -> bool:
+        """Хранятся ли шифртексты сырыми байтами"""
+        return self.ciphertext_storage == 'binary'
+    
+    def migrate_ciphertext_storage(self, batch_size: int = 500, progress=None) -> int:
+        """
+        Перевод уже сохраненных шифртекстов в текущий формат хранения
+        
+        Работает короткими транзакциями по batch_size строк, поэтому
+        приложение может продолжать работу: чтение понимает оба формата.
+        SQLite хранит BLOB и в колонках, объявленных как TEXT, так что
+        пересоздавать таблицы не нужно. Каждое значение обновляется условным
+        UPDATE (WHERE колонка = прочитанное значение), поэтому изменение записи
+        пользователем между чтением и записью пакета не перетирается.
+        
+        progress(table, converted) получает число строк, преобразованных в таблице
+        
+        Returns:
+            Количество преобразованных строк во всех таблицах
+        """
+        # typeof() в SQLite: 'text' - base64, 'blob' - сырые байты
+        source_type = 'text' if self.binary_storage else 'blob'
+        converted = 0
+        
+        for table, columns in CIPHERTEXT_COLUMNS.items():
+            condition = ' OR '.join(f"typeof({column}) = '{source_type}'" for column in columns)
+            select = text(f"SELECT id, {', '.join(columns)} FROM {table} "
+                          f"WHERE id > :last_id AND ({condition}) ORDER BY id LIMIT :limit")
+            updates = {column: text(f"UPDATE {table} SET {column} = :new WHERE id = :id AND {column} = :old")
+                       for column in columns}
+            last_id = 0
+            table_converted = 0
+            
+            while True:
+                with self.engine.begin() as connection:
+                    rows = connection.execute(select, {'last_id': last_id, 'limit': batch_size}).fetchall()
+                    if not rows:
+                        break
+                    
+                    params = {column: [] for column in columns}
+                    for row in rows:
+                        for column, value in zip(columns, row[1:]):
+                            if self.binary_storage and isinstance(value, str):
+                                new_value = base64.b64decode(value)
+                            elif not self.binary_storage and isinstance(value, bytes):
+                                new_value = base64.b64encode(value).decode('utf-8')
+                            else:
+                                continue
+                            params[column].append({'id': row[0], 'old': value, 'new': new_value})
+                    
+                    for column, column_params in params.items():
+                        if column_params:
+                            connection.execute(updates[column], column_params)
+                
+                last_id = rows[-1][0]
+                converted += len(rows)
+                table_converted += len(rows)
+                if progress:
+                    progress(table, table_converted)
+        
+        return converted
     
     def backup_db(self, backup_path: str):
-        """Создание резервной копии БД"""
-        import shutil
+        """
+        Создание резервной копии БД
+        Через backup API SQLite: копия согласована и включает еще не перенесенный WAL
+        """
         if os.path.exists(self.db_path):
-            shutil.copy2(self.db_path, backup_path)
+            copy_database(self.db_path, backup_path)
             return True
         return False
 
 
-# Singleton instance
-_db_instance = None
+def copy_database(source_path: str, target_path: str) -> None:
+    """Согласованная копия файла БД SQLite (в любом режиме журнала, без остановки записи)"""
+    source = sqlite3.connect(source_path)
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_db_instance = ProcessSingleton(Database, on_fork=Database.after_fork)
 
 def get_database(db_path: str = None) -> Database:
     """Получение singleton экземпляра БД"""
-    global _db_instance
-    if _db_instance is None:
-        _db_instance = Database(db_path)
-    return _db_instance
+    return _db_instance.get(db_path)
@@ -0,0 +1,84 @@
+"""
+Параллельная гамма CTR для больших сообщений
+Пространство счётчика делится на диапазоны блоков, гамма каждого
+диапазона вычисляется в отдельном потоке и складывается с данными
+прямо в свой участок заранее выделенного выходного буфера.
+Потоки дают выигрыш только для реализаций, отпускающих GIL
+(табличная на NumPy, OpenSSL через ctypes).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from crypto_backends import BLOCK_SIZE, KuznechikBackend
+
+
+class ParallelCTR:
+    """
+    Многопоточный CTR
+
+    Сообщения короче threshold байт шифруются в вызывающем потоке.
+    Пул потоков создается при первом большом сообщении и живет до shutdown().
+    """
+
+    def __init__(self, workers: Optional[int] = None, threshold: int = 1 << 20,
+                 chunk_size: int = 256 << 10):
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        # Диапазон - целое число блоков, иначе счётчик соседнего диапазона сместится
+        self.chunk_size = max(BLOCK_SIZE, chunk_size // BLOCK_SIZE * BLOCK_SIZE)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ctr')
+            return self._pool
+
+    def applies(self, backend: KuznechikBackend, length: int) -> bool:
+        """Пойдет ли сообщение длиной length параллельным путем"""
+        return self.workers > 1 and length >= self.threshold and backend.releases_gil
+
+    def ranges(self, length: int) -> List[Tuple[int, int]]:
+        """Диапазоны (начало, конец) в байтах; начало кратно размеру блока"""
+        return [(start, min(start + self.chunk_size, length)) for start in range(0, length, self.chunk_size)]
+
+    def ctr_into(self, backend: KuznechikBackend, key: bytes, nonce: bytes, data, out,
+                 start_block: int = 0, standard: bool = False) -> None:
+        """
+        CTR для фрагмента сообщения с блока start_block в буфер out той же длины
+        (диапазоны - в пуле потоков)
+        """
+        if not self.applies(backend, len(data)):
+            backend.ctr_into(key, nonce, data, out, start_block, standard)
+            return
+
+        source, target = memoryview(data).cast('B'), memoryview(out).cast('B')
+        pool = self._get_pool()
+        futures = [
+            pool.submit(backend.ctr_into, key, nonce, source[start:end], target[start:end],
+                        start_block + start // BLOCK_SIZE, standard)
+            for start, end in self.ranges(len(data))
+        ]
+        for future in futures:
+            future.result()
+
+    def ctr(self, backend: KuznechikBackend, key: bytes, nonce: bytes, data: bytes,
+            standard: bool = False) -> bytes:
+        """Шифрование/расшифрование в режиме CTR"""
+        if not self.applies(backend, len(data)):
+            return backend.ctr(key, nonce, data, standard)
+
+        out = bytearray(len(data))
+        self.ctr_into(backend, key, nonce, data, out, 0, standard)
+        return bytes(out)
+
+    def shutdown(self) -> None:
+        """Остановка пула потоков"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
@@ -0,0 +1,144 @@
+"""
+Параллельное расшифрование хранилища пулом процессов
+Строки делятся на части, каждая часть расшифровывается пакетно
+в отдельном процессе, результаты собираются в порядке id
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from crypto_gost import get_crypto
+from lifecycle import ProcessSingleton
+
+
+# Поля, расшифровываемые для списка записей (totp_secret - только в составе записи)
+ENTRY_FIELDS = ('site_name', 'url', 'username', 'password', 'notes')
+
+
+def _decrypt_chunk(key: bytes, rows: Sequence[Tuple]) -> Tuple[List[Tuple[int, Dict[str, str]]], List[Dict]]:
+    """
+    Расшифрование части строк (выполняется в рабочем процессе)
+
+    Args:
+        key: Ключ шифрования
+        rows: Кортежи (id, record_enc, site_name_enc, url_enc, username_enc, password_enc, notes_enc);
+              если record_enc заполнен, поля берутся из него
+
+    Returns:
+        (список (id, словарь полей), список ошибок по записям)
+    """
+    crypto = get_crypto()
+    width = len(ENTRY_FIELDS)
+
+    record_rows = [row for row in rows if row[1]]
+    field_rows = [row for row in rows if not row[1]]
+
+    records = crypto.decrypt_records(key, [row[1] for row in record_rows], strict=False)
+    encrypted = [value for row in field_rows for value in row[2:]]
+    decrypted = crypto.decrypt_many(key, encrypted, strict=False)
+
+    values_by_id = {}
+    for row, record in zip(record_rows, records):
+        values_by_id[row[0]] = record
+    for i, row in enumerate(field_rows):
+        values = decrypted[i * width:(i + 1) * width]
+        values_by_id[row[0]] = None if None in values else dict(zip(ENTRY_FIELDS, values))
+
+    results, errors = [], []
+    for row in rows:
+        values = values_by_id[row[0]]
+        if values is None:
+            errors.append({'entry_id': row[0], 'error': 'Ошибка расшифрования записи'})
+        else:
+            results.append((row[0], values))
+
+    return results, errors
+
+
+class ParallelDecryptor:
+    """
+    Расшифровка строк хранилища с опциональным пулом процессов
+
+    Пул создается при первом использовании и живет до shutdown().
+    Наборы меньше threshold строк расшифровываются в текущем процессе.
+    """
+
+    def __init__(self, enabled: bool = False, workers: Optional[int] = None,
+                 threshold: int = 5000, chunk_size: int = 1000):
+        self.enabled = enabled
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.chunk_size = max(1, chunk_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Постоянный пул процессов (spawn: fork многопоточного сервера небезопасен)"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def decrypt_rows(self, key: bytes, rows: Sequence[Tuple]) -> Tuple[List[Tuple[int, Dict[str, str]]], List[Dict]]:
+        """
+        Расшифрование строк (id, record_enc, поле_1_enc, ...)
+
+        Returns:
+            (список (id, словарь полей) по возрастанию id, список ошибок)
+            Ошибка части содержит chunk, диапазон id и текст исключения
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+
+        if not self.enabled or len(rows) < self.threshold or self.workers < 2:
+            return _decrypt_chunk(key, rows)
+
+        pool = self._get_pool()
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        futures = [pool.submit(_decrypt_chunk, key, chunk) for chunk in chunks]
+
+        results, errors = [], []
+        for index, (chunk, future) in enumerate(zip(chunks, futures)):
+            try:
+                chunk_results, chunk_errors = future.result()
+            except Exception as e:
+                errors.append({
+                    'chunk': index,
+                    'first_id': chunk[0][0],
+                    'last_id': chunk[-1][0],
+                    'error': str(e)
+                })
+                continue
+            results.extend(chunk_results)
+            errors.extend(chunk_errors)
+
+        return results, errors
+
+    def shutdown(self) -> None:
+        """Остановка пула процессов"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+def _create_parallel_decryptor() -> ParallelDecryptor:
+    return ParallelDecryptor(
+        enabled=os.getenv('PARALLEL_DECRYPT', 'false').lower() == 'true',
+        workers=int(os.getenv('PARALLEL_DECRYPT_WORKERS', 0)) or None,
+        threshold=int(os.getenv('PARALLEL_DECRYPT_THRESHOLD', 5000)),
+        chunk_size=int(os.getenv('PARALLEL_DECRYPT_CHUNK', 1000))
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_decryptor_instance = ProcessSingleton(_create_parallel_decryptor)
+
+def get_parallel_decryptor() -> ParallelDecryptor:
+    """Получение singleton экземпляра параллельного расшифровщика"""
+    return _decryptor_instance.get()
@@ -0,0 +1,241 @@
+"""
+Генератор паролей и парольных фраз
+Пароль выбирается равномерно среди всех строк заданной длины, содержащих
+каждый выбранный класс символов: случайное число меньше их количества
+переводится в пароль (нумерация без повторных попыток), поэтому время
+генерации постоянно, а энтропия равна log2 числа допустимых паролей.
+Случайность для пакета берется одним вызовом CSPRNG.
+"""
+
+import math
+import mmap
+import os
+import secrets
+import threading
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from lifecycle import ProcessSingleton, after_fork
+
+LOWERCASE = "abcdefghijklmnopqrstuvwxyz"
+UPPERCASE = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+DIGITS = "0123456789"
+SYMBOLS = "!@#$%^&*()_+-=[]{}|;:,.<>?"
+
+MIN_LENGTH = 15  # Минимум по требованиям
+MAX_LENGTH = 256
+MAX_COUNT = 1000
+MIN_WORDS = 4
+MAX_WORDS = 32
+
+# Запас случайных бит на одно значение: смещение остатка от деления
+# не больше 2^-64 (NIST SP 800-90A, приложение A.5.3)
+_EXTRA_BITS = 64
+
+
+def uniform_below(bound: int, count: int) -> List[int]:
+    """count независимых равномерных чисел из [0, bound) из одного блока CSPRNG"""
+    size = (bound.bit_length() + _EXTRA_BITS + 7) // 8
+    pool = secrets.token_bytes(size * count)
+    return [int.from_bytes(pool[i * size:(i + 1) * size], 'big') % bound for i in range(count)]
+
+
+class _ClassCounter:
+    """
+    Подсчет и нумерация строк над объединением классов символов,
+    в которых встречается каждый класс
+    """
+
+    def __init__(self, classes: Tuple[str, ...]):
+        self.classes = classes
+        self.sizes = [len(charset) for charset in classes]
+        self.alphabet = sum(self.sizes)
+        self.all_classes = (1 << len(classes)) - 1
+        self._completions: Dict[Tuple[int, int], int] = {}
+
+    def completions(self, length: int, missing: int) -> int:
+        """Число строк длины length, содержащих все классы из маски missing (включения-исключения)"""
+        cached = self._completions.get((length, missing))
+        if cached is None:
+            cached = 0
+            subset = missing
+            while True:
+                excluded = sum(size for i, size in enumerate(self.sizes) if subset >> i & 1)
+                sign = -1 if bin(subset).count('1') % 2 else 1
+                cached += sign * (self.alphabet - excluded) ** length
+                if not subset:
+                    break
+                subset = (subset - 1) & missing
+            self._completions[(length, missing)] = cached
+        return cached
+
+    def total(self, length: int) -> int:
+        return self.completions(length, self.all_classes)
+
+    def unrank(self, rank: int, length: int) -> str:
+        """Строка с номером rank (0 <= rank < total(length)) в порядке классов и символов"""
+        chars = []
+        missing = self.all_classes
+        for position in range(length):
+            remaining = length - position - 1
+            for index, charset in enumerate(self.classes):
+                rest = missing & ~(1 << index)
+                per_char = self.completions(remaining, rest)
+                block = len(charset) * per_char
+                if rank < block:
+                    chars.append(charset[rank // per_char])
+                    rank %= per_char
+                    missing = rest
+                    break
+                rank -= block
+        return ''.join(chars)
+
+
+@lru_cache(maxsize=16)
+def _class_counter(classes: Tuple[str, ...]) -> _ClassCounter:
+    return _ClassCounter(classes)
+
+
+class Wordlist:
+    """
+    Словарь парольных фраз в файле, отображенном в память
+    В памяти процесса только смещения слов; формат - по одному уникальному
+    слову в строке или список EFF ("11111<TAB>слово")
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"Словарь пуст: {path}")
+
+        self._starts = array('Q')
+        self._ends = array('Q')
+        start, size = 0, len(self._map)
+        while start < size:
+            end = self._map.find(b'\n', start)
+            if end < 0:
+                end = size
+            line = self._map[start:end]
+            tab = line.rfind(b'\t')
+            word = line[tab + 1:]
+            stripped = word.strip()
+            if stripped:
+                offset = start + tab + 1 + word.find(stripped)
+                self._starts.append(offset)
+                self._ends.append(offset + len(stripped))
+            start = end + 1
+
+        if len(self._starts) < 2:
+            raise ValueError(f"В словаре меньше двух слов: {path}")
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __getitem__(self, index: int) -> str:
+        return self._map[self._starts[index]:self._ends[index]].decode('utf-8')
+
+
+_wordlists: Dict[str, Wordlist] = {}
+_wordlists_lock = threading.Lock()
+
+
+@after_fork
+def _reset_wordlists_lock() -> None:
+    global _wordlists_lock
+    _wordlists_lock = threading.Lock()
+
+
+def load_wordlist(path: str) -> Wordlist:
+    """Словарь по пути (загружается один раз на процесс)"""
+    path = os.path.abspath(path)
+    with _wordlists_lock:
+        wordlist = _wordlists.get(path)
+        if wordlist is None:
+            if not os.path.exists(path):
+                raise ValueError(f"Словарь для парольных фраз не найден: {path}")
+            wordlist = _wordlists[path] = Wordlist(path)
+        return wordlist
+
+
+class PasswordGenerator:
+    """Пакетная генерация паролей и парольных фраз с оценкой энтропии"""
+
+    def __init__(self, wordlist_path: Optional[str] = None):
+        self.wordlist_path = wordlist_path
+
+    @staticmethod
+    def _check_count(count: int) -> None:
+        if not 1 <= count <= MAX_COUNT:
+            raise ValueError(f"Количество должно быть от 1 до {MAX_COUNT}")
+
+    def passwords(self, length: int = 20, count: int = 1,
+                  use_uppercase: bool = True,
+                  use_lowercase: bool = True,
+                  use_digits: bool = True,
+                  use_symbols: bool = True) -> Tuple[List[str], float]:
+        """
+        Пакет паролей; каждый содержит все выбранные классы символов
+
+        Returns:
+            (пароли, энтропия одного пароля в битах)
+        """
+        self._check_count(count)
+        length = max(length, MIN_LENGTH)
+        if length > MAX_LENGTH:
+            raise ValueError(f"Длина пароля не больше {MAX_LENGTH}")
+
+        selected = [(use_lowercase, LOWERCASE), (use_uppercase, UPPERCASE),
+                    (use_digits, DIGITS), (use_symbols, SYMBOLS)]
+        classes = tuple(charset for enabled, charset in selected if enabled)
+        if not classes:
+            # Без выбранных классов - строчные буквы и цифры без обязательного состава
+            classes = (LOWERCASE + DIGITS,)
+
+        counter = _class_counter(classes)
+        total = counter.total(length)
+        passwords = [counter.unrank(rank, length) for rank in uniform_below(total, count)]
+        return passwords, math.log2(total)
+
+    def passphrases(self, words: int = 6, count: int = 1, separator: str = '-',
+                    capitalize: bool = False) -> Tuple[List[str], float]:
+        """
+        Пакет парольных фраз из словаря (PASSPHRASE_WORDLIST)
+
+        Returns:
+            (фразы, энтропия одной фразы в битах)
+        """
+        self._check_count(count)
+        if not MIN_WORDS <= words <= MAX_WORDS:
+            raise ValueError(f"Число слов должно быть от {MIN_WORDS} до {MAX_WORDS}")
+        if not self.wordlist_path:
+            raise ValueError("Словарь для парольных фраз не настроен (PASSPHRASE_WORDLIST)")
+
+        wordlist = load_wordlist(self.wordlist_path)
+        size = len(wordlist)
+        phrases = []
+        for rank in uniform_below(size ** words, count):
+            chosen = []
+            for _ in range(words):
+                rank, index = divmod(rank, size)
+                word = wordlist[index]
+                chosen.append(word.capitalize() if capitalize else word)
+            phrases.append(separator.join(chosen))
+        return phrases, words * math.log2(size)
+
+
+def _create_password_generator() -> PasswordGenerator:
+    return PasswordGenerator(
+        wordlist_path=os.getenv('PASSPHRASE_WORDLIST', 'wordlist.txt')
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_generator_instance = ProcessSingleton(_create_password_generator)
+
+def get_password_generator() -> PasswordGenerator:
+    """Получение singleton экземпляра генератора паролей"""
+    return _generator_instance.get()
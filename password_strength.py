@@ -5,6 +5,7 @@
 
 from zxcvbn import zxcvbn
 from typing import Dict, Tuple
+from lifecycle import ProcessSingleton
 
 
 class PasswordStrengthAnalyzer:
@@ -151,12 +152,9 @@ class PasswordStrengthAnalyzer:
         return labels.get(level, 'Неизвестно')
 
 
-# Singleton instance
-_analyzer_instance = None
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_analyzer_instance = ProcessSingleton(PasswordStrengthAnalyzer)
 
 def get_password_analyzer() -> PasswordStrengthAnalyzer:
     """Получение singleton экземпляра анализатора"""
-    global _analyzer_instance
-    if _analyzer_instance is None:
-        _analyzer_instance = PasswordStrengthAnalyzer()
-    return _analyzer_instance
+    return _analyzer_instance.get()
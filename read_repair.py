@@ -0,0 +1,150 @@
+"""
+Фоновое обновление формата шифртекстов при чтении (read-repair)
+Строка, прочитанная в старом формате, ставится в очередь и перезаписывается
+в текущем формате отдельным потоком, без остановки приложения
+"""
+
+import os
+import queue
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from crypto_gost import GOSTCrypto, get_crypto
+from entry_integrity import retag_entries
+from lifecycle import ProcessSingleton
+from models import Database, CIPHERTEXT_COLUMNS, get_database
+
+
+class ReadRepairer:
+    """
+    Очередь строк для перезаписи в текущем формате шифртекста
+
+    Каждое значение обновляется условным UPDATE (WHERE колонка = старое значение),
+    поэтому параллельная запись пользователя никогда не перетирается.
+    Переполненная очередь не блокирует запросы: задача отбрасывается
+    и будет поставлена снова при следующем чтении.
+    """
+
+    def __init__(self, database: Database, crypto: GOSTCrypto, enabled: bool = True, queue_size: int = 1000):
+        self.db = database
+        self.crypto = crypto
+        self.enabled = enabled
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.repaired = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def is_stale(self, table: str, row) -> bool:
+        """Есть ли у строки (ORM-объекта) шифртексты в старом формате"""
+        return any(self.crypto.needs_upgrade(getattr(row, column)) for column in CIPHERTEXT_COLUMNS[table])
+
+    def submit(self, table: str, row_id: int, key: bytes) -> bool:
+        """Постановка строки в очередь (повторные постановки той же строки игнорируются)"""
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            if (table, row_id) in self._pending:
+                return True
+            try:
+                self._queue.put_nowait((table, row_id, key))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._pending.add((table, row_id))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='read-repair', daemon=True)
+                self._thread.start()
+        return True
+
+    def repair_row(self, table: str, row_id: int, key: bytes) -> int:
+        """
+        Перезапись устаревших шифртекстов строки
+
+        Returns:
+            Количество обновленных значений
+        """
+        columns = CIPHERTEXT_COLUMNS[table]
+        select = text(f"SELECT {', '.join(columns)} FROM {table} WHERE id = :id")
+
+        with self.db.engine.begin() as connection:
+            row = connection.execute(select, {'id': row_id}).fetchone()
+            if row is None:
+                return 0
+
+            stale = [(column, value) for column, value in zip(columns, row) if self.crypto.needs_upgrade(value)]
+            if not stale:
+                return 0
+
+            upgraded = self.crypto.reencrypt_many(key, [value for _, value in stale], raw=self.db.binary_storage)
+
+            updated = 0
+            for (column, old_value), new_value in zip(stale, upgraded):
+                result = connection.execute(
+                    text(f"UPDATE {table} SET {column} = :new WHERE id = :id AND {column} = :old"),
+                    {'new': new_value, 'old': old_value, 'id': row_id}
+                )
+                updated += result.rowcount
+            if updated and table == 'password_entries':
+                # Имитовставка вычислена по старым шифртекстам
+                retag_entries(connection, self.crypto, key, [row_id])
+            return updated
+
+    def _run(self) -> None:
+        """Цикл рабочего потока"""
+        while True:
+            try:
+                table, row_id, key = self._queue.get(timeout=5)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            try:
+                if self.repair_row(table, row_id, key):
+                    self.repaired += 1
+            except Exception:
+                self.failed += 1
+            finally:
+                with self._lock:
+                    self._pending.discard((table, row_id))
+                self._queue.task_done()
+
+    def join(self) -> None:
+        """Ожидание обработки всех поставленных строк"""
+        self._queue.join()
+
+    def stats(self) -> Dict:
+        """Счетчики очереди"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queued': len(self._pending),
+                'repaired': self.repaired,
+                'dropped': self.dropped,
+                'failed': self.failed
+            }
+
+
+def _create_read_repairer() -> ReadRepairer:
+    return ReadRepairer(
+        get_database(),
+        get_crypto(),
+        enabled=os.getenv('READ_REPAIR', 'true').lower() == 'true',
+        queue_size=int(os.getenv('READ_REPAIR_QUEUE', 1000))
+    )
+
+
+# Singleton instance (свой в каждом процессе, см. lifecycle)
+_repairer_instance = ProcessSingleton(_create_read_repairer)
+
+def get_read_repairer() -> ReadRepairer:
+    """Получение singleton экземпляра read-repair"""
+    return _repairer_instance.get()
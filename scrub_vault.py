@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Проверка целостности хранилища (имитовставки и расшифрование всех записей)
+Проверка идет пакетами с сохраненной точкой продолжения: ограниченный
+запуск (--max-rows, --max-seconds) продолжается следующим, например ночью
+по cron. Приложение можно не останавливать.
+"""
+
+import argparse
+import getpass
+import sys
+
+from crypto_gost import GOSTCrypto
+from entry_integrity import VaultScrubber, unlock_vault
+from models import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка целостности записей хранилища')
+    parser.add_argument('--db', default='password_manager.db', help='Путь к базе данных')
+    parser.add_argument('--batch', type=int, default=1000, help='Строк в одном пакете')
+    parser.add_argument('--workers', type=int, default=1, help='Процессов для проверки пакетов')
+    parser.add_argument('--max-rows', type=int, help='Проверить не больше стольких строк за запуск')
+    parser.add_argument('--max-seconds', type=float, help='Ограничение времени запуска, с')
+    parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пакетами, с')
+    parser.add_argument('--tag-missing', action='store_true',
+                        help='Вычислить имитовставки для целых записей без нее')
+    parser.add_argument('--password-file', help='Файл с мастер-паролем (по умолчанию - запрос)')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  🔐 Проверка целостности хранилища")
+    print("=" * 60)
+    print()
+
+    if args.password_file:
+        with open(args.password_file, encoding='utf-8') as f:
+            master_password = f.read().rstrip('\n')
+    else:
+        master_password = getpass.getpass('Мастер-пароль: ')
+
+    db = Database(args.db)
+    crypto = GOSTCrypto()
+    try:
+        key = unlock_vault(db, crypto, master_password)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+
+    scrubber = VaultScrubber(db, crypto, key, batch_size=args.batch, workers=args.workers,
+                             tag_missing=args.tag_missing)
+    result = scrubber.run(max_rows=args.max_rows, max_seconds=args.max_seconds, pause=args.pause)
+
+    print(f"   ✓ Проверено за запуск: {result['rows_this_run']} строк ({result['rows_per_second']} строк/с)")
+    print(f"   ✓ Всего проверено: {result['rows_checked']}, без имитовставки: {result['rows_untagged']}")
+    if result['status'] == 'completed':
+        print("✅ Проверка завершена")
+    else:
+        print(f"⏸  Проверка продолжится с id > {result['cursor']}")
+
+    if result['corrupt_ids']:
+        print(f"❌ Повреждены записи: {', '.join(str(row_id) for row_id in result['corrupt_ids'])}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Табличная реализация хэш-функции Стрибог (ГОСТ Р 34.11-2012)
+Преобразования L, P и S объединены в восемь 64-битных таблиц LPS,
+блоки разных сообщений сжимаются одновременно как массивы NumPy.
+Результат совпадает с gostcrypto.gosthash.
+Здесь же PBKDF2-HMAC-Стрибог-512 (Р 50.1.111-2016).
+"""
+
+import struct
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from kuznechik_engine import _PI
+
+BLOCK_SIZE = 64  # 512 бит
+DIGEST_SIZES = (32, 64)
+
+# Матрица линейного преобразования l (ГОСТ Р 34.11-2012, п. 5.3)
+_A = (
+    0x8e20faa72ba0b470, 0x47107ddd9b505a38, 0xad08b0e0c3282d1c, 0xd8045870ef14980e,
+    0x6c022c38f90a4c07, 0x3601161cf205268d, 0x1b8e0b0e798c13c8, 0x83478b07b2468764,
+    0xa011d380818e8f40, 0x5086e740ce47c920, 0x2843fd2067adea10, 0x14aff010bdd87508,
+    0x0ad97808d06cb404, 0x05e23c0468365a02, 0x8c711e02341b2d01, 0x46b60f011a83988e,
+    0x90dab52a387ae76f, 0x486dd4151c3dfdb9, 0x24b86a840e90f0d2, 0x125c354207487869,
+    0x092e94218d243cba, 0x8a174a9ec8121e5d, 0x4585254f64090fa0, 0xaccc9ca9328a8950,
+    0x9d4df05d5f661451, 0xc0a878a0a1330aa6, 0x60543c50de970553, 0x302a1e286fc58ca7,
+    0x18150f14b9ec46dd, 0x0c84890ad27623e0, 0x0642ca05693b9f70, 0x0321658cba93c138,
+    0x86275df09ce8aaa8, 0x439da0784e745554, 0xafc0503c273aa42a, 0xd960281e9d1d5215,
+    0xe230140fc0802984, 0x71180a8960409a42, 0xb60c05ca30204d21, 0x5b068c651810a89e,
+    0x456c34887a3805b9, 0xac361a443d1c8cd2, 0x561b0d22900e4669, 0x2b838811480723ba,
+    0x9bcf4486248d9f5d, 0xc3e9224312c8c1a0, 0xeffa11af0964ee50, 0xf97d86d98a327728,
+    0xe4fa2054a80b329c, 0x727d102a548b194e, 0x39b008152acb8227, 0x9258048415eb419d,
+    0x492c024284fbaec0, 0xaa16012142f35760, 0x550b8e9e21f7a530, 0xa48b474f9ef5dc18,
+    0x70a6a56e2440598e, 0x3853dc371220a247, 0x1ca76e95091051ad, 0x0edd37c48a08a6d8,
+    0x07e095624504536c, 0x8d70c431ac02a736, 0xc83862965601dd1b, 0x641c314b2b8ee083,
+)
+
+_C = tuple(bytes.fromhex(c) for c in (
+    '0745a6f2596580dd234d74cc3674760515d360a4082a42a20169679291e07c4b'
+    'fcc485758db84e7116d0452e43766a2f1f7c65c0812fcbebe9daca1eda5b08b1',
+    'b79bb121700479e656cdcbd71ba2dd55caa70adbc261b55c5899d6126b17b59a'
+    '3101b5160f5ed561982b230a72eafef3d7b5700f469de34f1a2f9da98ab5a36f',
+    'b20aba0af5961e9931db7a8643f4b6c209db6260373ac9c1b19e3590e40fe2d3'
+    '7b7b29b11475eaf28b1f9c525f5ef10635843d6a28fc390ac72fce2bacdc74f5',
+    '2ed1e384bcbe0c22f137e893a1ea5334be0352933313b7d875d603ed822cd7a9'
+    '3f355e68ad1c729d7d3c5c337e858e48dde4715da0e148f9d26615e8b3df1fef',
+    '57fe6c7cfd581760f563eaa97ea2567a161a2723b700ffdfa3f53a254717cdbf'
+    'bdff0f80d7359e354a1086161f1c157f6323a96c0c413f9a994747adac6bea4b',
+    '6e7d64467a4068fa354f903672c571bfb6c6bec2661ff20ab4b79a1cb7a6facf'
+    'c68ef09ab49a7f186ca44251f9c4662dc039307a3bc3a46fd9d33a1daeae4fae',
+    '93d4143a4d568688f34a3ca24c45173504054a2883694706372c822dc5ab9209'
+    'c9937a19333e47d3c987bfe6c7c69e39540924bffe86ac51ecc5aaee160ec7f4',
+    '1ee702bfd40d7fa4d9a8515935c2ac362fc4a5d12b8dd16990069b92cb2b89f4'
+    '9ac4db4d3b44b4891ede369c71f8b74e41416e0c02aae703a7c9934d425b1f9b',
+    'db5a238351446172602a1fcb92dc380e549c07a69a8a2b7bb1ceb2db0b440a80'
+    '84090de0b755d93c244289251b3a7d3ade5f16ecd89a4c949b223116545a8f37',
+    'ed9c4598fbc7b474c3b63b15d1fa9836f452763b306c1e7a4b3369af0267e79f'
+    '0361331b8ae1ff1fdb788aff1ce74189f3f3e4b248e52a38526f0580a6debeab',
+    '1b2df381cda4ca6b5dd86fc04a59a2de986e477d1dcdbaefcab948eaef711d8a'
+    '79668414218001206107abebbb6bfad894fe5a63cdc60230fb89c8efd09ecd7b',
+    '20d71bf14a92bc48991bb2d9d517f4fa5228e188aaa41de786cc91189def805d'
+    '9b9f2130d41220f8771ddfbc323ca4cd7ab14904b08013d2ba3116f167e78e37',
+))
+
+_WORD = np.dtype('<u8')
+
+
+def _build_lps_table() -> np.ndarray:
+    """
+    Таблицы LPS: T[i][b] - вклад байта b в позиции i каждой 64-битной строки
+    Выходное слово j = XOR по i от T[i][байт 8i+j]
+    """
+    pi = np.frombuffer(_PI, dtype=np.uint8)
+    a = np.array(_A, dtype=_WORD)
+    table = np.zeros((8, 256), dtype=_WORD)
+    for i in range(8):
+        for k in range(8):
+            bit_set = ((pi >> k) & 1).astype(bool)
+            table[i, bit_set] ^= a[(7 - i) * 8 + (7 - k)]
+    return table
+
+
+_LPS_TABLE = _build_lps_table()
+_ROWS = np.arange(8)[:, None]
+_ROUND_CONSTANTS = np.frombuffer(b''.join(_C), dtype=_WORD).reshape(12, 1, 8)
+_IV = {
+    64: np.zeros(8, dtype=_WORD),
+    32: np.frombuffer(b'\x01' * BLOCK_SIZE, dtype=_WORD)
+}
+
+
+def _lps(state: np.ndarray) -> np.ndarray:
+    """Преобразование LPS для массива состояний (B, 8) слов"""
+    data = state.view(np.uint8).reshape(-1, 8, 8)
+    return np.bitwise_xor.reduce(_LPS_TABLE[_ROWS, data], axis=1)
+
+
+def _compress(h: np.ndarray, n: np.ndarray, m: np.ndarray) -> np.ndarray:
+    """Функция сжатия g_N(h, m) для массивов (B, 8)"""
+    key = _lps(h ^ n)
+    state = key ^ m
+    for constants in _ROUND_CONSTANTS:
+        state = _lps(state)
+        key = _lps(key ^ constants)
+        state ^= key
+    return state ^ h ^ m
+
+
+def _add_512(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Сложение 512-битных чисел (младшее слово первое) по модулю 2^512"""
+    result = np.empty_like(a)
+    carry = np.zeros(len(a), dtype=_WORD)
+    for word in range(8):
+        partial = a[:, word] + b[:, word]
+        overflow = partial < a[:, word]
+        total = partial + carry
+        overflow |= total < partial
+        result[:, word] = total
+        carry = overflow.astype(_WORD)
+    return result
+
+
+def _hash_group(messages: Sequence[bytes], digest_size: int) -> List[bytes]:
+    """Хэширование сообщений с одинаковым числом полных блоков"""
+    count = len(messages)
+    full_blocks = len(messages[0]) // BLOCK_SIZE
+
+    h = np.repeat(_IV[digest_size][None, :], count, axis=0)
+    n = np.zeros((count, 8), dtype=_WORD)
+    sigma = np.zeros((count, 8), dtype=_WORD)
+
+    if full_blocks:
+        body = np.frombuffer(
+            b''.join(message[:full_blocks * BLOCK_SIZE] for message in messages), dtype=_WORD
+        ).reshape(count, full_blocks, 8)
+        for i in range(full_blocks):
+            block = body[:, i]
+            h = _compress(h, n, block)
+            n[:, 0] += 512
+            sigma = _add_512(sigma, block)
+
+    # Дополнение последнего блока: остаток || 0x01 || 0...0
+    tail = np.zeros((count, BLOCK_SIZE), dtype=np.uint8)
+    tail_bits = np.zeros(count, dtype=_WORD)
+    for row, message in enumerate(messages):
+        rest = message[full_blocks * BLOCK_SIZE:]
+        tail[row, :len(rest)] = np.frombuffer(rest, dtype=np.uint8)
+        tail[row, len(rest)] = 0x01
+        tail_bits[row] = len(rest) * 8
+    tail = tail.view(_WORD)
+
+    h = _compress(h, n, tail)
+    n[:, 0] += tail_bits
+    sigma = _add_512(sigma, tail)
+
+    zero = np.zeros((count, 8), dtype=_WORD)
+    h = _compress(h, zero, n)
+    h = _compress(h, zero, sigma)
+
+    digests = h.view(np.uint8).reshape(count, BLOCK_SIZE)[:, BLOCK_SIZE - digest_size:]
+    return [row.tobytes() for row in digests]
+
+
+def streebog_many(messages: Sequence[bytes], digest_size: int = 64) -> List[bytes]:
+    """
+    Хэширование списка сообщений за один вызов
+    Сообщения группируются по числу полных блоков и сжимаются пакетами
+    """
+    if digest_size not in DIGEST_SIZES:
+        raise ValueError("Размер хэша Стрибог должен быть 32 или 64 байта")
+
+    groups: Dict[int, List[int]] = {}
+    for index, message in enumerate(messages):
+        groups.setdefault(len(message) // BLOCK_SIZE, []).append(index)
+
+    digests: List[bytes] = [b''] * len(messages)
+    for indexes in groups.values():
+        group_digests = _hash_group([bytes(messages[i]) for i in indexes], digest_size)
+        for index, digest in zip(indexes, group_digests):
+            digests[index] = digest
+    return digests
+
+
+def streebog512(data: bytes) -> bytes:
+    """Стрибог-512"""
+    return _hash_group([bytes(data)], 64)[0]
+
+
+def streebog256(data: bytes) -> bytes:
+    """Стрибог-256"""
+    return _hash_group([bytes(data)], 32)[0]
+
+
+
+# ==================== PBKDF2-HMAC-Стрибог-512 (Р 50.1.111-2016) ====================
+# Цепочка итераций PBKDF2 последовательна - пакетной обработки нет, поэтому
+# состояние хранится 512-битным целым Python, а LPS развернута вручную:
+# на одном блоке это быстрее вызовов NumPy
+
+_MASK_512 = (1 << 512) - 1
+_EMPTY_TAIL = 0x01  # дополнение пустого остатка: 0x01 || 0^504 (младший байт первый)
+_TWO_BLOCKS = 1024  # длина (K xor pad) || блок в битах
+_T0, _T1, _T2, _T3, _T4, _T5, _T6, _T7 = (list(map(int, row)) for row in _LPS_TABLE)
+_ROUND_INTS = tuple(int.from_bytes(c, 'little') for c in _C)
+_pack_words = struct.Struct('<8Q').pack
+
+
+def _lps_int(value: int) -> int:
+    """LPS над 512-битным целым (слово j - байты 8j..8j+7, младший байт первый)"""
+    b = value.to_bytes(BLOCK_SIZE, 'little')
+    T0, T1, T2, T3, T4, T5, T6, T7 = _T0, _T1, _T2, _T3, _T4, _T5, _T6, _T7
+    return int.from_bytes(_pack_words(
+        T0[b[0]] ^ T1[b[8]] ^ T2[b[16]] ^ T3[b[24]] ^ T4[b[32]] ^ T5[b[40]] ^ T6[b[48]] ^ T7[b[56]],
+        T0[b[1]] ^ T1[b[9]] ^ T2[b[17]] ^ T3[b[25]] ^ T4[b[33]] ^ T5[b[41]] ^ T6[b[49]] ^ T7[b[57]],
+        T0[b[2]] ^ T1[b[10]] ^ T2[b[18]] ^ T3[b[26]] ^ T4[b[34]] ^ T5[b[42]] ^ T6[b[50]] ^ T7[b[58]],
+        T0[b[3]] ^ T1[b[11]] ^ T2[b[19]] ^ T3[b[27]] ^ T4[b[35]] ^ T5[b[43]] ^ T6[b[51]] ^ T7[b[59]],
+        T0[b[4]] ^ T1[b[12]] ^ T2[b[20]] ^ T3[b[28]] ^ T4[b[36]] ^ T5[b[44]] ^ T6[b[52]] ^ T7[b[60]],
+        T0[b[5]] ^ T1[b[13]] ^ T2[b[21]] ^ T3[b[29]] ^ T4[b[37]] ^ T5[b[45]] ^ T6[b[53]] ^ T7[b[61]],
+        T0[b[6]] ^ T1[b[14]] ^ T2[b[22]] ^ T3[b[30]] ^ T4[b[38]] ^ T5[b[46]] ^ T6[b[54]] ^ T7[b[62]],
+        T0[b[7]] ^ T1[b[15]] ^ T2[b[23]] ^ T3[b[31]] ^ T4[b[39]] ^ T5[b[47]] ^ T6[b[55]] ^ T7[b[63]]
+    ), 'little')
+
+
+def _round_keys_int(h: int, n: int) -> List[int]:
+    """Раундовые ключи K1..K13 функции сжатия g_N(h, ·)"""
+    keys = [_lps_int(h ^ n)]
+    for constants in _ROUND_INTS:
+        keys.append(_lps_int(keys[-1] ^ constants))
+    return keys
+
+
+def _compress_int(h: int, n: int, m: int) -> int:
+    """Функция сжатия g_N(h, m) над целыми"""
+    key = _lps_int(h ^ n)
+    state = key ^ m
+    for constants in _ROUND_INTS:
+        key = _lps_int(key ^ constants)
+        state = _lps_int(state) ^ key
+    return state ^ h ^ m
+
+
+class _HmacState:
+    """
+    Состояние Стрибог-512 после блока K xor pad (HMAC, Р 50.1.113-2016)
+
+    Сообщения в цикле PBKDF2 - ровно один блок, поэтому его сжатие идет
+    с постоянными h и N: раундовые ключи вычисляются один раз на пароль.
+    """
+
+    def __init__(self, pad_block: bytes):
+        block = int.from_bytes(pad_block, 'little')
+        self.h = _compress_int(0, 0, block)  # IV Стрибог-512 - нули
+        self.round_keys = _round_keys_int(self.h, 512)
+        # Контрольная сумма без блока сообщения: pad_block + дополнение
+        self.sigma = block + _EMPTY_TAIL
+
+    def digest(self, message: int) -> int:
+        """Стрибог-512(pad_block || message) для одного блока message"""
+        keys = self.round_keys
+        state = keys[0] ^ message
+        for key in keys[1:]:
+            state = _lps_int(state) ^ key
+        h = state ^ self.h ^ message
+
+        h = _compress_int(h, _TWO_BLOCKS, _EMPTY_TAIL)
+        h = _compress_int(h, 0, _TWO_BLOCKS)
+        return _compress_int(h, 0, (self.sigma + message) & _MASK_512)
+
+
+def pbkdf2_hmac_streebog512(password: bytes, salt: bytes, iterations: int, dklen: int = 64) -> bytes:
+    """
+    PBKDF2 с HMAC-Стрибог-512 (Р 50.1.111-2016)
+    Состояния HMAC для ipad и opad вычисляются один раз на пароль,
+    каждая итерация - два хэша одного блока с готовым префиксом
+    """
+    if iterations < 1:
+        raise ValueError("Число итераций PBKDF2 должно быть положительным")
+    if len(password) > BLOCK_SIZE:
+        password = streebog512(password)
+    key = bytes(password).ljust(BLOCK_SIZE, b'\x00')
+    inner_pad = bytes(byte ^ 0x36 for byte in key)
+    outer_pad = bytes(byte ^ 0x5C for byte in key)
+    inner = _HmacState(inner_pad)
+    outer = _HmacState(outer_pad)
+
+    blocks = []
+    for index in range(1, -(-dklen // BLOCK_SIZE) + 1):
+        u = streebog512(outer_pad + streebog512(inner_pad + bytes(salt) + index.to_bytes(4, 'big')))
+        u = t = int.from_bytes(u, 'little')
+        for _ in range(iterations - 1):
+            u = outer.digest(inner.digest(u))
+            t ^= u
+        blocks.append(t.to_bytes(BLOCK_SIZE, 'little'))
+    return b''.join(blocks)[:dklen]
@@ -2,8 +2,37 @@
 Unit-тесты для криптографического модуля
 """
 
+import io
+import itertools
+import math
+import os
+import base64
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
 import pytest
-from crypto_gost import GOSTCrypto
+from gostcrypto import gostcipher
+from crypto_gost import GOSTCrypto, KeyRing
+from kuznechik_engine import KuznechikEngine
+from key_cache import KeyScheduleCache
+from parallel_decrypt import ParallelDecryptor
+from parallel_ctr import ParallelCTR
+from envelope import MAGIC, VERSION_LEGACY, CURRENT_VERSION
+import models
+from models import Database, PasswordEntry, MasterEncryptionKey, KeyRotation, copy_database, SCHEMA_VERSION
+from read_repair import ReadRepairer
+from kdf_pool import KdfPool, KdfPoolBusy
+from key_rotation import KeyRotationJob, KeyRotationManager
+from bench_crypto import compare_results, measure
+import crypto_backends
+from password_generator import PasswordGenerator, _ClassCounter
+from entry_integrity import ENTRY_COLUMNS, VaultScrubber
+from lifecycle import ProcessSingleton
+from audit_log import AuditWriter
+from login_limiter import LoginRateLimiter
+from api_rate_limit import ApiRateLimiter, parse_rules
+from calibrate_kdf import calibrate_argon2, calibrate_pbkdf2, write_env, MIN_ARGON2_MEMORY
 
 
 class TestGOSTCrypto:
@@ -51,6 +80,27 @@ class TestGOSTCrypto:
         
         assert len(hash1) == 32  # 256 бит = 32 байта
     
+    def test_streebog_test_vectors(self):
+        """Контрольные примеры ГОСТ Р 34.11-2012 (сообщение M1)"""
+        message = b"012345678901234567890123456789012345678901234567890123456789012"
+        
+        assert self.crypto.streebog_512(message).hex() == (
+            '1b54d01a4af5b9d5cc3d86d68d285462b19abc2475222f35c085122be4ba1ffa'
+            '00ad30f8767b3a82384c6574f024c311e2a481332b08ef7f41797891c1646f48'
+        )
+        assert self.crypto.streebog_256(message).hex() == (
+            '9d151eefd8590b89daa6ba6cb74af9275dd051026bb149a452fd84e5e57b5500'
+        )
+    
+    @pytest.mark.parametrize('digest_size', [32, 64])
+    def test_streebog_many(self, digest_size):
+        """Пакетное хэширование совпадает с эталонной реализацией"""
+        reference = GOSTCrypto(streebog_backend='gostcrypto')
+        messages = [os.urandom(length) for length in (0, 1, 63, 64, 65, 130, 40, 40)]
+        
+        assert self.crypto.streebog_many(messages, digest_size) == \
+            reference.streebog_many(messages, digest_size)
+    
     def test_derive_key_pbkdf2_gost(self):
         """Тест деривации ключа"""
         password = "test_password"
@@ -101,6 +151,30 @@ class TestGOSTCrypto:
         decrypted = self.crypto.decrypt_data(key, encrypted)
         assert decrypted == plaintext
     
+    def test_encrypt_decrypt_raw_bytes(self):
+        """Сырые байты nonce + ciphertext принимаются без base64"""
+        key = self.crypto.generate_mek()
+        plaintext = "Секретные данные 🔐"
+        
+        raw = self.crypto.encrypt_data(key, plaintext, raw=True)
+        assert isinstance(raw, bytes)
+        assert self.crypto.decrypt_data(key, raw) == plaintext
+        assert self.crypto.decrypt_data(key, memoryview(bytearray(raw))) == plaintext
+        assert self.crypto.decrypt_many(key, [raw, base64.b64encode(raw).decode()]) == [plaintext] * 2
+    
+    def test_encrypt_decrypt_record(self):
+        """Все поля записи шифруются одним шифртекстом"""
+        key = self.crypto.generate_mek()
+        fields = {'site_name': "Сайт", 'username': "user", 'password': "p@ss", 'notes': "n" * 300}
+        
+        encrypted = self.crypto.encrypt_record(key, fields)
+        record = self.crypto.decrypt_record(key, encrypted)
+        
+        assert record['site_name'] == "Сайт"
+        assert record['notes'] == "n" * 300
+        assert record['url'] == ""
+        assert self.crypto.decrypt_records(key, [encrypted, "!!!"], strict=False) == [record, None]
+    
     def test_encrypt_empty_string(self):
         """Тест шифрования пустой строки"""
         key = self.crypto.generate_salt()
@@ -122,6 +196,30 @@ class TestGOSTCrypto:
         with pytest.raises(Exception):
             self.crypto.decrypt_data(key2, encrypted)
     
+    def test_encrypt_decrypt_many(self):
+        """Тест пакетного шифрования и расшифрования"""
+        key = self.crypto.generate_mek()
+        plaintexts = ["site", "", "Секрет 🔐", "x" * 1000]
+        
+        encrypted = self.crypto.encrypt_many(key, plaintexts)
+        assert len(encrypted) == len(plaintexts)
+        assert encrypted[1] == ""
+        
+        # Совместимость с одиночным API в обе стороны
+        assert [self.crypto.decrypt_data(key, item) for item in encrypted] == plaintexts
+        single = [self.crypto.encrypt_data(key, item) for item in plaintexts]
+        assert self.crypto.decrypt_many(key, single) == plaintexts
+    
+    def test_decrypt_many_not_strict(self):
+        """Поврежденные элементы не прерывают пакетное расшифрование"""
+        key = self.crypto.generate_mek()
+        encrypted = self.crypto.encrypt_many(key, ["a", "b"])
+        items = [encrypted[0], "!!!не base64!!!", encrypted[1]]
+        
+        assert self.crypto.decrypt_many(key, items, strict=False) == ["a", None, "b"]
+        with pytest.raises(ValueError):
+            self.crypto.decrypt_many(key, items)
+    
     def test_generate_secure_password(self):
         """Тест генерации безопасного пароля"""
         password = self.crypto.generate_secure_password(20)
@@ -176,6 +274,73 @@ class TestGOSTCrypto:
         decrypted_mek = self.crypto.decrypt_mek(encrypted_mek, master_password, salt)
         assert decrypted_mek == mek
     
+    def test_buffers_into_caller_outputs(self):
+        """encrypt_into/decrypt_into пишут в буферы вызывающего, совместимы с decrypt_data"""
+        key = self.crypto.generate_mek()
+        plaintext = bytearray("секрет".encode('utf-8'))
+        
+        encrypted = bytearray(self.crypto.encrypted_size(len(plaintext)) + 3)
+        size = self.crypto.encrypt_into(key, memoryview(plaintext), encrypted)
+        assert size == len(encrypted) - 3
+        assert self.crypto.decrypt_data(key, memoryview(encrypted)[:size]) == "секрет"
+        
+        assert self.crypto.plaintext_size(encrypted[:size]) == len(plaintext)
+        out = bytearray(len(plaintext))
+        assert self.crypto.decrypt_into(key, memoryview(encrypted)[:size], out) == len(plaintext)
+        assert out == plaintext
+        
+        self.crypto.zeroize(out)
+        assert out == bytes(len(plaintext))
+        with pytest.raises(ValueError):
+            self.crypto.decrypt_into(key, encrypted[:size], bytearray(2))
+        assert self.crypto.encrypt_into(key, b"", bytearray()) == 0
+    
+    def test_kdf_parameters_from_env(self, monkeypatch):
+        """Параметры KDF задаются окружением, старые хэши проверяются и требуют обновления"""
+        old_hash = self.crypto.hash_master_password("pw")
+        
+        monkeypatch.setenv('ARGON2_TIME_COST', '1')
+        monkeypatch.setenv('ARGON2_MEMORY_COST', '8192')
+        monkeypatch.setenv('PBKDF2_ITERATIONS', '2000')
+        crypto = GOSTCrypto()
+        
+        assert crypto.kdf_parameters()['argon2_time_cost'] == 1
+        assert crypto.verify_master_password("pw", old_hash)
+        assert crypto.needs_rehash(old_hash)
+        assert not crypto.needs_rehash(crypto.hash_master_password("pw"))
+        
+        mek = crypto.generate_mek()
+        salt = crypto.generate_salt()
+        encrypted = crypto.encrypt_mek(mek, "pw", salt, crypto.pbkdf2_iterations)
+        assert crypto.decrypt_mek(encrypted, "pw", salt, 2000) == mek
+        assert crypto.decrypt_mek(encrypted, "pw", salt) != mek
+    
+    def test_pbkdf2_streebog_test_vectors(self):
+        """PBKDF2-HMAC-Стрибог-512: контрольные примеры Р 50.1.111-2016"""
+        streebog = self.crypto.streebog
+        assert streebog.pbkdf2(b'password', b'salt', 1).hex() == (
+            '64770af7f748c3b1c9ac831dbcfd85c26111b30a8a657ddc3056b80ca73e040d'
+            '2854fd36811f6d825cc4ab66ec0a68a490a9e5cf5156b3a2b7eecddbf9a16b47'
+        )
+        assert streebog.pbkdf2(b'password', b'salt', 4096).hex() == (
+            'e52deb9a2d2aaff4e2ac9d47a41f34c20376591c67807f0477e32549dc341bc7'
+            '867c09841b6d58e29d0347c996301d55df0d34e47cf68f4e3c2cdaf1d9ab86c3'
+        )
+    
+    def test_mek_kdf_algorithm_per_record(self):
+        """MEK, обернутый любым KDF, расшифровывается с алгоритмом из записи"""
+        mek = self.crypto.generate_mek()
+        salt = self.crypto.generate_salt()
+        
+        legacy = self.crypto.encrypt_mek(mek, "pw", salt, 1000)
+        streebog = self.crypto.encrypt_mek(mek, "pw", salt, 10, GOSTCrypto.KDF_PBKDF2_STREEBOG)
+        
+        assert self.crypto.decrypt_mek(legacy, "pw", salt, 1000, None) == mek
+        assert self.crypto.decrypt_mek(streebog, "pw", salt, 10, GOSTCrypto.KDF_PBKDF2_STREEBOG) == mek
+        assert self.crypto.decrypt_mek(streebog, "pw", salt, 10) != mek
+        with pytest.raises(ValueError):
+            self.crypto.derive_kek("pw", salt, 10, 'scrypt')
+    
     def test_mek_with_wrong_password(self):
         """Тест расшифрования MEK с неправильным паролем"""
         mek = self.crypto.generate_mek()
@@ -190,5 +355,1012 @@ class TestGOSTCrypto:
         assert decrypted_mek != mek
 
 
+
+class TestKuznechikEngine:
+    """Тесты табличной реализации Кузнечика"""
+    
+    def test_block_test_vector(self):
+        """Контрольный пример ГОСТ Р 34.12-2015 (А.1)"""
+        key = bytes.fromhex('8899aabbccddeeff0011223344556677fedcba98765432100123456789abcdef')
+        plaintext = bytes.fromhex('1122334455667700ffeeddccbbaa9988')
+        
+        engine = KuznechikEngine(key)
+        assert engine.encrypt_block(plaintext).hex() == '7f679d90bebc24305a468d42b9d4edcd'
+    
+    @pytest.mark.parametrize('length', [1, 15, 16, 17, 100, 4096 + 33])
+    def test_ctr_matches_gostcipher(self, length):
+        """CTR побитно совпадает с gostcrypto.gostcipher"""
+        key = os.urandom(32)
+        nonce = os.urandom(8)
+        data = os.urandom(length)
+        
+        reference = gostcipher.new('kuznechik', bytearray(key), gostcipher.MODE_CTR,
+                                   init_vect=bytearray(nonce)).encrypt(bytearray(data))
+        assert KuznechikEngine(key).ctr_xor(nonce, data) == bytes(reference)
+    
+    def test_standard_counter(self):
+        """Счётчик ГОСТ Р 34.13-2015: nonce || номер блока (64 бита), с переносом разрядов"""
+        key = os.urandom(32)
+        nonce = os.urandom(8)
+        data = os.urandom(4096 + 33)
+        
+        engine = KuznechikEngine(key)
+        gamma = b''.join(engine.encrypt_block(nonce + i.to_bytes(8, 'big')) for i in range(len(data) // 16 + 1))
+        expected = bytes(a ^ b for a, b in zip(data, gamma))
+        
+        assert engine.ctr_xor(nonce, data, standard=True) == expected
+        assert engine.ctr_xor_many([nonce], [data], standard=True) == [expected]
+    
+    def test_backends_interoperable(self):
+        """Данные, зашифрованные одной реализацией, расшифровываются другой"""
+        table = GOSTCrypto(kuznechik_backend='table')
+        reference = GOSTCrypto(kuznechik_backend='gostcrypto')
+        key = table.generate_mek()
+        
+        encrypted = table.encrypt_data(key, "Секретные данные 🔐")
+        assert reference.decrypt_data(key, encrypted) == "Секретные данные 🔐"
+        
+        encrypted = reference.encrypt_data(key, "Другие данные")
+        assert table.decrypt_data(key, encrypted) == "Другие данные"
+    
+    def test_invalid_key_length(self):
+        """Ключ неверной длины отклоняется"""
+        with pytest.raises(ValueError):
+            KuznechikEngine(b'short')
+
+
+
+class TestCryptoBackends:
+    """Тесты реестра реализаций"""
+    
+    @pytest.mark.parametrize('name', crypto_backends.available_backends('kuznechik'))
+    def test_kuznechik_backends_pass_kat(self, name):
+        """Каждая доступная реализация Кузнечика проходит контрольные примеры и сверку с эталоном"""
+        reference = crypto_backends.GostcryptoKuznechik(KeyScheduleCache())
+        backend = crypto_backends.create_kuznechik_backend(name, KeyScheduleCache())
+        assert crypto_backends.verify_kuznechik(backend, reference)
+    
+    @pytest.mark.parametrize('name', crypto_backends.available_backends('streebog'))
+    def test_streebog_backends_pass_kat(self, name):
+        """Каждая доступная реализация Стрибога проходит контрольные примеры и сверку с эталоном"""
+        backend = crypto_backends.create_streebog_backend(name)
+        assert crypto_backends.verify_streebog(backend, crypto_backends.GostcryptoStreebog())
+    
+    def test_broken_backend_rejected(self):
+        """Реализация с неверным результатом не проходит проверку"""
+        class Broken(crypto_backends.GostcryptoKuznechik):
+            def ctr(self, key, nonce, data, standard=False):
+                return bytes(len(data))
+        
+        assert not crypto_backends.verify_kuznechik(Broken(KeyScheduleCache()))
+    
+    def test_selection_and_override(self, monkeypatch):
+        """Автовыбор берет проверенную реализацию, переменная окружения ее переопределяет"""
+        assert crypto_backends.resolve_backend('kuznechik') in crypto_backends.available_backends('kuznechik')
+        
+        monkeypatch.setenv('KUZNECHIK_BACKEND', 'gostcrypto')
+        assert GOSTCrypto().kuznechik_backend == 'gostcrypto'
+        
+        monkeypatch.setenv('KUZNECHIK_BACKEND', 'unknown')
+        with pytest.raises(ValueError):
+            GOSTCrypto()
+
+
+class TestKeyScheduleCache:
+    """Тесты кэша развернутых ключей"""
+    
+    def test_hits_and_misses(self):
+        """Повторное обращение к ключу попадает в кэш"""
+        cache = KeyScheduleCache(max_size=2)
+        key = os.urandom(32)
+        
+        with cache.acquire(key, KuznechikEngine) as first:
+            pass
+        with cache.acquire(key, KuznechikEngine) as second:
+            pass
+        
+        assert first is second
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+    
+    def test_lru_eviction_zeroizes(self):
+        """Вытесненный контекст обнуляется"""
+        cache = KeyScheduleCache(max_size=1)
+        
+        with cache.acquire(os.urandom(32), KuznechikEngine) as old_engine:
+            pass
+        with cache.acquire(os.urandom(32), KuznechikEngine):
+            pass
+        
+        assert cache.stats()['evictions'] == 1
+        assert not old_engine._round_keys.any()
+    
+    def test_evict_waits_for_users(self):
+        """Контекст, который еще используется, обнуляется только после освобождения"""
+        cache = KeyScheduleCache()
+        key = os.urandom(32)
+        
+        with cache.acquire(key, KuznechikEngine) as engine:
+            assert cache.evict(key) is True
+            assert engine._round_keys.any()
+        
+        assert not engine._round_keys.any()
+        assert cache.evict(key) is False
+
+
+
+class TestEnvelope:
+    """Тесты версионированного формата шифртекста"""
+    
+    def setup_method(self):
+        self.crypto = GOSTCrypto()
+        self.legacy = GOSTCrypto()
+        self.legacy.envelope_version = VERSION_LEGACY
+        self.key = self.crypto.generate_mek()
+    
+    def test_header(self):
+        """Новые шифртексты несут заголовок с версией и идентификатором ключа"""
+        encrypted = self.crypto.encrypt_data(self.key, "данные", raw=True)
+        
+        assert encrypted.startswith(MAGIC)
+        assert self.crypto.ciphertext_version(encrypted) == CURRENT_VERSION
+        assert self.crypto.ciphertext_version(base64.b64encode(encrypted).decode()) == CURRENT_VERSION
+        assert not self.crypto.needs_upgrade(encrypted)
+    
+    def test_legacy_values_readable_and_upgradable(self):
+        """Значения исходного формата читаются и перешифровываются в текущий"""
+        old = self.legacy.encrypt_many(self.key, ["a" * 5000, "", "b"])
+        
+        assert self.crypto.ciphertext_version(old[0]) == VERSION_LEGACY
+        assert self.crypto.needs_upgrade(old[0]) and not self.crypto.needs_upgrade(old[1])
+        assert self.crypto.decrypt_many(self.key, old) == ["a" * 5000, "", "b"]
+        
+        upgraded = self.crypto.reencrypt_many(self.key, old)
+        assert not any(self.crypto.needs_upgrade(value) for value in upgraded)
+        assert self.crypto.decrypt_many(self.key, upgraded) == ["a" * 5000, "", "b"]
+    
+    def test_wrong_key_detected(self):
+        """Идентификатор ключа в заголовке отличает чужой ключ от повреждения"""
+        encrypted = self.crypto.encrypt_data(self.key, "данные")
+        
+        with pytest.raises(ValueError, match="другим ключом"):
+            self.crypto.decrypt_data(self.crypto.generate_mek(), encrypted)
+    
+    def test_read_repair_rewrites_row(self, tmp_path):
+        """Read-repair переписывает строку в текущий формат, не трогая updated_at"""
+        database = Database(str(tmp_path / 'vault.db'))
+        db_session = database.get_session()
+        site, user, password = self.legacy.encrypt_many(self.key, ["site", "user", "pass"])
+        entry = PasswordEntry(site_name_enc=site, username_enc=user, password_enc=password)
+        db_session.add(entry)
+        db_session.commit()
+        updated_at = entry.updated_at
+        
+        repairer = ReadRepairer(database, self.crypto)
+        assert repairer.is_stale('password_entries', entry)
+        assert repairer.submit('password_entries', entry.id, self.key)
+        repairer.join()
+        
+        db_session.expire_all()
+        assert not repairer.is_stale('password_entries', entry)
+        assert self.crypto.decrypt_data(self.key, entry.password_enc) == "pass"
+        assert entry.updated_at == updated_at
+        assert repairer.stats()['repaired'] == 1
+        db_session.close()
+
+
+class TestKeyRotation:
+    """Тесты ротации MEK"""
+    
+    def setup_method(self):
+        self.crypto = GOSTCrypto()
+        self.old_key = self.crypto.generate_mek()
+        self.new_key = self.crypto.generate_mek()
+    
+    def _vault(self, tmp_path, count):
+        database = Database(str(tmp_path / 'vault.db'))
+        db_session = database.get_session()
+        salt = self.crypto.generate_salt()
+        db_session.add(MasterEncryptionKey(
+            encrypted_key=base64.b64encode(self.crypto.encrypt_mek(self.old_key, "password", salt)).decode(),
+            kdf_salt=base64.b64encode(salt).decode()
+        ))
+        self.kek = self.crypto.derive_kek("password", salt)
+        for i in range(count):
+            site, user, password = self.crypto.encrypt_many(self.old_key, [f"site{i}", "user", f"pass{i}"])
+            db_session.add(PasswordEntry(site_name_enc=site, username_enc=user, password_enc=password))
+        db_session.commit()
+        return database, db_session
+    
+    def test_keyring_reads_both_keys(self):
+        """KeyRing читает значения обоих ключей, а пишет новым"""
+        keys = KeyRing(self.new_key, self.old_key)
+        items = [self.crypto.encrypt_data(self.old_key, "old"), self.crypto.encrypt_data(keys, "new")]
+        
+        assert self.crypto.decrypt_many(keys, items) == ["old", "new"]
+        assert self.crypto.decrypt_data(self.new_key, items[1]) == "new"
+        with pytest.raises(ValueError):
+            self.crypto.decrypt_data(self.old_key, items[1])
+    
+    def test_rotation_completes(self, tmp_path):
+        """Ротация перешифровывает все строки и заменяет MEK"""
+        database, db_session = self._vault(tmp_path, 5)
+        manager = KeyRotationManager(database, self.crypto, batch_size=2, workers=1)
+        
+        rotation, keys = manager.begin(db_session, self.kek, self.old_key)
+        manager.job.join()
+        
+        db_session.expire_all()
+        progress = manager.progress(db_session)
+        assert progress['status'] == 'completed' and progress['rows_done'] == 5
+        
+        mek_record = db_session.query(MasterEncryptionKey).first()
+        mek = self.crypto.decrypt_mek(base64.b64decode(mek_record.encrypted_key), "password",
+                                      base64.b64decode(mek_record.kdf_salt))
+        assert mek == keys.current
+        passwords = [entry.password_enc for entry in db_session.query(PasswordEntry).order_by(PasswordEntry.id)]
+        assert self.crypto.decrypt_many(mek, passwords) == [f"pass{i}" for i in range(5)]
+        db_session.close()
+    
+    def test_rotation_resumes_from_checkpoint(self, tmp_path):
+        """После сбоя перешифрование продолжается с сохраненного курсора"""
+        database, db_session = self._vault(tmp_path, 6)
+        rotation = KeyRotation(encrypted_key="", key_id=self.crypto.key_id(self.new_key),
+                               table_name='password_entries', cursor=2, rows_done=2, rows_total=6, rows_failed=0)
+        db_session.add(rotation)
+        db_session.commit()
+        
+        KeyRotationJob(database, self.crypto, rotation.id, KeyRing(self.new_key, self.old_key), batch_size=3).run()
+        
+        db_session.expire_all()
+        entries = db_session.query(PasswordEntry).order_by(PasswordEntry.id).all()
+        # Строки до курсора не трогаются повторно
+        assert self.crypto.decrypt_data(self.old_key, entries[1].password_enc) == "pass1"
+        assert [self.crypto.decrypt_data(self.new_key, entry.password_enc) for entry in entries[2:]] == \
+            ["pass2", "pass3", "pass4", "pass5"]
+        assert rotation.rows_done == 6 and rotation.status == 'completed'
+        db_session.close()
+    
+    def test_corrupt_value_keeps_row_and_previous_key(self, tmp_path):
+        """Поврежденное значение не мешает перевести остальные поля строки; прежний MEK сохраняется"""
+        database, db_session = self._vault(tmp_path, 3)
+        entry = db_session.get(PasswordEntry, 2)
+        corrupt = self.crypto.encrypt_data(self.crypto.generate_mek(), "lost")
+        entry.password_enc = corrupt
+        db_session.commit()
+        manager = KeyRotationManager(database, self.crypto, batch_size=2, workers=1)
+        
+        rotation, keys = manager.begin(db_session, self.kek, self.old_key)
+        manager.job.join()
+        
+        db_session.expire_all()
+        entry = db_session.get(PasswordEntry, 2)
+        assert self.crypto.decrypt_many(keys.current, [entry.site_name_enc, entry.username_enc]) == ["site1", "user"]
+        assert entry.password_enc == corrupt
+        assert rotation.rows_failed == 1 and rotation.status == 'completed'
+        assert manager.retired_key(rotation, keys.current) == self.old_key
+        assert manager.progress(db_session)['previous_key_retained']
+        db_session.close()
+    
+    def test_latest_key_id_cached_until_begin(self, tmp_path):
+        """Идентификатор нового MEK кэшируется, begin() в процессе обновляет его сразу"""
+        database, db_session = self._vault(tmp_path, 1)
+        manager = KeyRotationManager(database, self.crypto, batch_size=2, workers=1)
+        assert manager.latest_key_id() is None
+        db_session.add(KeyRotation(encrypted_key="", key_id=7, status='completed'))
+        db_session.commit()
+        assert manager.latest_key_id() is None
+        
+        rotation, keys = manager.begin(db_session, self.kek, self.old_key)
+        manager.job.join()
+        assert manager.latest_key_id() == self.crypto.key_id(keys.current)
+        db_session.close()
+
+
+class TestBenchmarks:
+    """Тесты бенчмарков криптомодуля"""
+    
+    def test_measure(self):
+        """Замер подбирает число вызовов под минимальную длительность"""
+        result = measure(lambda: None, min_time=0.01, repeat=2)
+        assert result['iterations'] > 1 and result['ops_per_sec'] > 0
+    
+    def test_compare_with_baseline(self):
+        """Регрессия - падение ops/sec больше допуска; новые бенчмарки пропускаются"""
+        baseline = {'results': {'a': {'ops_per_sec': 100.0}, 'b': {'ops_per_sec': 100.0}}}
+        current = {'results': {'a': {'ops_per_sec': 85.0}, 'b': {'ops_per_sec': 70.0}, 'c': {'ops_per_sec': 1.0}}}
+        
+        comparison = compare_results(current, baseline, tolerance=0.2)
+        
+        assert [(item['name'], item['regression']) for item in comparison] == [('a', False), ('b', True)]
+
+
+class TestKdfCalibration:
+    """Тесты калибровки KDF"""
+    
+    def test_calibration_respects_floors(self):
+        """Недостижимая цель не ослабляет KDF ниже нижних границ"""
+        argon2 = calibrate_argon2(0.0001, 65536, 1, repeat=1)
+        assert argon2['time_cost'] == 1
+        assert argon2['memory_cost'] >= MIN_ARGON2_MEMORY
+        
+        assert calibrate_pbkdf2(GOSTCrypto(), 0.0001, 50000, repeat=1)['iterations'] == 50000
+    
+    def test_write_env(self, tmp_path):
+        """Существующие переменные обновляются, новые дописываются"""
+        path = tmp_path / '.env'
+        path.write_text("SECRET_KEY=x\nPBKDF2_ITERATIONS=100000\n", encoding='utf-8')
+        
+        write_env(str(path), {'PBKDF2_ITERATIONS': '250000', 'ARGON2_TIME_COST': '2'})
+        assert path.read_text(encoding='utf-8').splitlines() == [
+            'SECRET_KEY=x', 'PBKDF2_ITERATIONS=250000', 'ARGON2_TIME_COST=2'
+        ]
+
+
+class TestKdfPool:
+    """Тесты пула KDF"""
+    
+    def test_memory_admission_and_rejection(self):
+        """Операции сверх бюджета памяти ждут, при переполнении очереди - отказ с Retry-After"""
+        pool = KdfPool(memory_budget=100, workers=4, queue_timeout=0.05, max_queue=1)
+        release = threading.Event()
+        
+        first = pool.submit(60, release.wait)
+        assert pool.stats()['memory_in_use_kib'] == 60
+        
+        with pytest.raises(KdfPoolBusy) as busy:
+            pool.submit(60, release.wait)
+        assert busy.value.retry_after >= 1
+        assert pool.submit(0, lambda: 'pbkdf2').result() == 'pbkdf2'
+        
+        release.set()
+        first.result()
+        assert pool.submit(60, lambda: 'argon2').result() == 'argon2'
+        
+        stats = pool.stats()
+        assert stats['rejected'] == 1 and stats['memory_in_use_kib'] == 0 and stats['queue_depth'] == 0
+        pool.shutdown()
+    
+    def test_verify_and_derive(self):
+        """Проверка пароля и деривация ключа в пуле"""
+        crypto = GOSTCrypto()
+        pool = KdfPool(workers=2)
+        password_hash = crypto.hash_master_password("pw")
+        salt = crypto.generate_salt()
+        
+        assert pool.verify_and_derive(crypto, "pw", password_hash, salt, 1000) == (
+            True, crypto.derive_key_pbkdf2_gost("pw", salt, 1000)
+        )
+        assert pool.verify_and_derive(crypto, "wrong", password_hash, salt, 1000) == (False, None)
+        pool.shutdown()
+    
+    def test_derive_after_verify_within_budget(self):
+        """Деривация только после верного пароля и под резервом памяти проверки"""
+        crypto = GOSTCrypto()
+        pool = KdfPool(workers=2)
+        password_hash = crypto.hash_master_password("pw")
+        reserved = []
+        crypto.derive_kek = lambda *args: reserved.append(pool.stats()['memory_in_use_kib']) or b'kek'
+        
+        assert pool.verify_and_derive(crypto, "wrong", password_hash, b'salt') == (False, None)
+        assert reserved == []
+        assert pool.verify_and_derive(crypto, "pw", password_hash, b'salt') == (True, b'kek')
+        assert reserved == [crypto.ph.memory_cost]
+        assert pool.stats()['memory_in_use_kib'] == 0
+        pool.shutdown()
+    
+    def test_mek_routes_derive_in_pool(self, tmp_path, monkeypatch):
+        """Смена пароля и ротация MEK получают KEK из пула: при перегрузке - 503 с Retry-After"""
+        import app as app_module
+        
+        class BusyKdf:
+            def verify(self, *args):
+                return True
+            
+            def derive_kek(self, *args, **kwargs):
+                raise KdfPoolBusy(3)
+        
+        database = Database(str(tmp_path / 'vault.db'))
+        session = database.get_session()
+        session.add(models.MasterPassword(password_hash='x', salt=base64.b64encode(b'salt').decode()))
+        session.commit()
+        session.close()
+        monkeypatch.setattr(app_module, 'db', database)
+        monkeypatch.setattr(app_module, 'kdf', BusyKdf())
+        monkeypatch.setattr(app_module, 'rotations', KeyRotationManager(database, app_module.crypto, workers=1))
+        monkeypatch.setattr(app_module, 'api_limiter', ApiRateLimiter(':memory:', [], enabled=False))
+        
+        client = app_module.app.test_client()
+        with client.session_transaction() as client_session:
+            client_session['authenticated'] = True
+        responses = [
+            client.post('/api/change-master-password',
+                        json={'current_password': 'password', 'new_password': 'Str0ng!Passw0rd#2024'}),
+            client.post('/api/rotate-mek', json={'master_password': 'password'})
+        ]
+        
+        assert [(r.status_code, r.headers.get('Retry-After')) for r in responses] == [(503, '3')] * 2
+
+
+class TestParallelDecryptor:
+    """Тесты параллельного расшифрования хранилища"""
+    
+    def test_pool_keeps_id_order_and_reports_errors(self):
+        """Результаты собираются по id, поврежденные записи попадают в errors"""
+        crypto = GOSTCrypto()
+        key = crypto.generate_mek()
+        rows = []
+        for entry_id in range(1, 8):
+            fields = {'site_name': f"site{entry_id}", 'username': f"user{entry_id}", 'password': "p"}
+            if entry_id % 2:
+                rows.append((entry_id, crypto.encrypt_record(key, fields), None, None, None, None, None))
+            else:
+                rows.append((entry_id, None, *crypto.encrypt_many(
+                    key, [fields.get(name, '') for name in ('site_name', 'url', 'username', 'password', 'notes')]
+                )))
+        rows[3] = (4, None, "!!!", *rows[3][3:])
+        
+        decryptor = ParallelDecryptor(enabled=True, workers=2, threshold=0, chunk_size=2)
+        try:
+            results, errors = decryptor.decrypt_rows(key, list(reversed(rows)))
+        finally:
+            decryptor.shutdown()
+        
+        assert [entry_id for entry_id, _ in results] == [1, 2, 3, 5, 6, 7]
+        assert results[0][1]['site_name'] == "site1"
+        assert results[1][1] == {'site_name': "site2", 'url': "", 'username': "user2",
+                                 'password': "p", 'notes': ""}
+        assert errors == [{'entry_id': 4, 'error': 'Ошибка расшифрования записи'}]
+
+
+
+class TestParallelCTR:
+    """Тесты многопоточного CTR"""
+    
+    @pytest.mark.parametrize('name', crypto_backends.available_backends('kuznechik'))
+    def test_ctr_into_matches_full_message(self, name):
+        """Гамма диапазона совпадает с соответствующим участком гаммы всего сообщения"""
+        backend = crypto_backends.create_kuznechik_backend(name, KeyScheduleCache())
+        key, nonce = os.urandom(32), os.urandom(8)
+        data = os.urandom(300 * 16 + 5)  # больше 256 блоков: счётчик gostcipher проходит полный круг
+        
+        for standard in (False, True):
+            expected = backend.ctr(key, nonce, data, standard)
+            out = bytearray(len(data) - 4096)
+            backend.ctr_into(key, nonce, memoryview(data)[4096:], out, 256, standard)
+            assert bytes(out) == expected[4096:]
+    
+    def test_parallel_matches_sequential(self):
+        """Диапазоны в потоках дают тот же шифртекст, что и последовательный проход"""
+        crypto = GOSTCrypto(kuznechik_backend='table')
+        crypto.parallel_ctr = ParallelCTR(workers=3, threshold=4096, chunk_size=1000)
+        assert crypto.parallel_ctr.chunk_size == 992
+        key, nonce = crypto.generate_mek(), crypto.generate_nonce()
+        data = os.urandom(300 * 16 + 5)
+        
+        try:
+            assert crypto.parallel_ctr.applies(crypto.kuznechik, len(data))
+            assert not crypto.parallel_ctr.applies(crypto.kuznechik, 4095)
+            for standard in (False, True):
+                assert (crypto._kuznechik_ctr_encrypt(key, nonce, data, standard) ==
+                        crypto.kuznechik.ctr(key, nonce, data, standard))
+            
+            note = "заметка " * 1000
+            assert crypto.decrypt_data(key, crypto.encrypt_data(key, note)) == note
+        finally:
+            crypto.parallel_ctr.shutdown()
+        
+        reference = crypto_backends.create_kuznechik_backend('gostcrypto', KeyScheduleCache())
+        assert not crypto.parallel_ctr.applies(reference, len(data))
+
+
+
+class TestCryptoStream:
+    """Тесты потокового шифрования"""
+    
+    def setup_method(self):
+        self.crypto = GOSTCrypto()
+        self.key = self.crypto.generate_mek()
+    
+    def test_roundtrip_across_chunks(self):
+        """Счётчик продолжается между блоками чтения, прогресс доходит до размера потока"""
+        data = os.urandom(1000)
+        encrypted, decrypted, progress = io.BytesIO(), io.BytesIO(), []
+        
+        assert self.crypto.encrypt_stream(self.key, io.BytesIO(data), encrypted, chunk_size=70,
+                                          progress=lambda done, total: progress.append((done, total))) == 1000
+        assert progress[0] == (64, 1000) and progress[-1] == (1000, 1000)
+        
+        # Тот же конверт, что у encrypt_data: тело совпадает с CTR всего сообщения
+        envelope = self.crypto._open(encrypted.getvalue())
+        assert bytes(envelope.body) == self.crypto._kuznechik_ctr_encrypt(self.key, envelope.nonce, data, True)
+        
+        encrypted.seek(0)
+        assert self.crypto.decrypt_stream(self.key, encrypted, decrypted, chunk_size=48) == 1000
+        assert decrypted.getvalue() == data
+    
+    def test_reads_encrypt_data_values(self, monkeypatch):
+        """Расшифровываются значения encrypt_data обоих форматов, чужой ключ отклоняется"""
+        text = "заметка " * 100
+        for version in (VERSION_LEGACY, CURRENT_VERSION):
+            monkeypatch.setattr(self.crypto, 'envelope_version', version)
+            out = io.BytesIO()
+            self.crypto.decrypt_stream(self.key, io.BytesIO(self.crypto.encrypt_data(self.key, text, raw=True)),
+                                       out, chunk_size=64)
+            assert out.getvalue().decode('utf-8') == text
+        
+        with pytest.raises(ValueError):
+            self.crypto.decrypt_stream(self.crypto.generate_mek(),
+                                       io.BytesIO(self.crypto.encrypt_data(self.key, text, raw=True)), io.BytesIO())
+
+
+
+class TestPasswordGenerator:
+    """Тесты генератора паролей"""
+    
+    def test_unrank_is_bijection_onto_valid_strings(self):
+        """Нумерация перебирает ровно строки, содержащие все классы"""
+        counter = _ClassCounter(('ab', '0'))
+        for length in (2, 3, 4):
+            valid = {''.join(chars) for chars in itertools.product('ab0', repeat=length)
+                     if '0' in chars and {'a', 'b'} & set(chars)}
+            generated = [counter.unrank(rank, length) for rank in range(counter.total(length))]
+            assert len(generated) == len(valid) and set(generated) == valid
+    
+    def test_batch_has_all_classes(self):
+        """Каждый пароль пакета содержит все выбранные классы, энтропия - log2 числа допустимых"""
+        passwords, entropy = PasswordGenerator().passwords(length=15, count=300, use_symbols=False)
+        assert len(set(passwords)) == 300
+        for password in passwords:
+            assert len(password) == 15
+            assert any(c.islower() for c in password)
+            assert any(c.isupper() for c in password)
+            assert any(c.isdigit() for c in password)
+        assert math.log2(62 ** 15) - 1 < entropy < math.log2(62 ** 15)
+        
+        with pytest.raises(ValueError):
+            PasswordGenerator().passwords(count=0)
+    
+    def test_passphrases_from_wordlist(self, tmp_path):
+        """Парольные фразы из словаря EFF-формата, энтропия - words * log2(размер словаря)"""
+        wordlist = tmp_path / 'words.txt'
+        wordlist.write_text(''.join(f"1{i:04d}\tслово{i}\n" for i in range(64)) + "\n", encoding='utf-8')
+        generator = PasswordGenerator(str(wordlist))
+        
+        phrases, entropy = generator.passphrases(words=5, count=20, separator=' ', capitalize=True)
+        assert entropy == 30
+        for phrase in phrases:
+            words = phrase.split(' ')
+            assert len(words) == 5 and all(word.startswith('Слово') for word in words)
+        
+        with pytest.raises(ValueError):
+            PasswordGenerator(str(tmp_path / 'missing.txt')).passphrases()
+
+
+class TestEntryIntegrity:
+    """Тесты имитовставок записей и проверки хранилища"""
+    
+    def setup_method(self):
+        self.crypto = GOSTCrypto()
+        self.key = self.crypto.generate_mek()
+    
+    def test_cmac_matches_reference(self):
+        """CMAC пакетом совпадает с вычислением по одному сообщению для любых длин"""
+        backend = self.crypto.kuznechik
+        reference = crypto_backends.GostcryptoKuznechik(KeyScheduleCache())
+        messages = [os.urandom(length) for length in (0, 1, 15, 16, 17, 32, 100)]
+        
+        assert backend.cmac_many(self.key, messages) == [reference.cmac_many(self.key, [m])[0] for m in messages]
+        assert len(set(backend.cmac_many(self.key, messages))) == len(messages)
+    
+    def test_tags_detect_tampering_and_swap(self):
+        """Имитовставка не совпадает при изменении шифртекста и переносе его в другую строку"""
+        values = self.crypto.encrypt_many(self.key, ["site", "user", "pass"])
+        row = (values[0], None, values[1], values[2], None, None, None, None)
+        tag = self.crypto.entry_tags(self.key, [(1, row)])[0]
+        tampered = bytearray(base64.b64decode(values[2]))
+        tampered[-1] ^= 1
+        
+        assert self.crypto.verify_entry_tags(self.key, [
+            (1, row, tag),
+            (2, row, tag),
+            (1, row[:3] + (base64.b64encode(tampered).decode(),) + row[4:], tag),
+            (1, row, self.crypto.entry_tags(self.crypto.generate_mek(), [(1, row)])[0])
+        ]) == [True, False, False, False]
+    
+    def test_scrub_resumes_and_reports_corrupt(self, tmp_path):
+        """Проверка идет с точки продолжения, находит поврежденные строки и дописывает имитовставки"""
+        database = Database(str(tmp_path / 'vault.db'))
+        db_session = database.get_session()
+        for i in range(6):
+            site, user, password = self.crypto.encrypt_many(self.key, [f"site{i}", "user", f"pass{i}"])
+            db_session.add(PasswordEntry(site_name_enc=site, username_enc=user, password_enc=password))
+        db_session.commit()
+        entries = db_session.query(PasswordEntry).order_by(PasswordEntry.id).all()
+        for entry in entries[:4]:
+            entry.mac_tag = self.crypto.entry_tags(
+                self.key, [(entry.id, tuple(getattr(entry, column) for column in ENTRY_COLUMNS))])[0]
+        entries[1].password_enc = self.crypto.encrypt_data(self.key, "подмена")
+        entries[5].password_enc = self.crypto.encrypt_data(self.crypto.generate_mek(), "чужой ключ")
+        db_session.commit()
+        
+        scrubber = VaultScrubber(database, self.crypto, self.key, batch_size=2, tag_missing=True)
+        first = scrubber.run(max_rows=3)
+        assert first['status'] == 'running' and first['cursor'] == entries[2].id
+        assert first['corrupt_ids'] == [entries[1].id]
+        
+        result = scrubber.run()
+        assert result['status'] == 'completed' and result['rows_checked'] == 6
+        assert result['corrupt_ids'] == [entries[1].id, entries[5].id]
+        db_session.expire_all()
+        assert entries[4].mac_tag and not entries[5].mac_tag
+        db_session.close()
+
+
+class TestCiphertextStorage:
+    """Тесты формата хранения шифртекстов"""
+    
+    def _types(self, database):
+        connection = sqlite3.connect(database.db_path)
+        try:
+            return [row[0] for row in connection.execute("SELECT typeof(password_enc) FROM password_entries")]
+        finally:
+            connection.close()
+    
+    def test_formats_independent_per_database(self, tmp_path):
+        """Базы с разными форматами в одном процессе пишут каждая в своем"""
+        crypto = GOSTCrypto()
+        key = crypto.generate_mek()
+        text_db = Database(str(tmp_path / 'text.db'), ciphertext_storage='base64')
+        blob_db = Database(str(tmp_path / 'blob.db'), ciphertext_storage='binary')
+        for database in (text_db, blob_db):
+            session = database.get_session()
+            site, user, password = crypto.encrypt_many(key, ["site", "user", "secret"], raw=database.binary_storage)
+            session.add(PasswordEntry(site_name_enc=site, username_enc=user, password_enc=password))
+            session.commit()
+            session.close()
+        
+        assert self._types(text_db) == ['text'] and self._types(blob_db) == ['blob']
+    
+    def test_migration_progress_per_table(self, tmp_path):
+        """Миграция формата сообщает число строк своей таблицы"""
+        crypto = GOSTCrypto()
+        key = crypto.generate_mek()
+        session = Database(str(tmp_path / 'vault.db'), ciphertext_storage='base64').get_session()
+        for i in range(3):
+            site, user, password = crypto.encrypt_many(key, [f"site{i}", "user", f"pass{i}"])
+            session.add(PasswordEntry(site_name_enc=site, username_enc=user, password_enc=password))
+        session.commit()
+        session.close()
+        
+        database = Database(str(tmp_path / 'vault.db'), ciphertext_storage='binary')
+        reports = []
+        assert database.migrate_ciphertext_storage(batch_size=2, progress=lambda *report: reports.append(report)) == 3
+        assert reports == [('password_entries', 2), ('password_entries', 3)]
+        assert self._types(database) == ['blob'] * 3
+    
+    def test_migration_keeps_concurrent_edit(self, tmp_path):
+        """Значение, измененное между чтением и записью пакета, не перетирается"""
+        crypto = GOSTCrypto()
+        key = crypto.generate_mek()
+        session = Database(str(tmp_path / 'vault.db'), ciphertext_storage='base64').get_session()
+        site, user, password = crypto.encrypt_many(key, ["site", "user", "old"])
+        session.add(PasswordEntry(site_name_enc=site, username_enc=user, password_enc=password))
+        session.commit()
+        session.close()
+        
+        database = Database(str(tmp_path / 'vault.db'), ciphertext_storage='binary')
+        edited = crypto.encrypt_data(key, "edited")
+        
+        edits = []
+        
+        def edit_before_write(connection, cursor, statement, parameters, context, executemany):
+            # Изменение пользователя до первой записи пакета (пока транзакция не держит блокировку)
+            if statement.startswith('UPDATE password_entries') and not edits:
+                edits.append(statement)
+                other = sqlite3.connect(database.db_path)
+                other.execute("UPDATE password_entries SET password_enc = ?", (edited,))
+                other.commit()
+                other.close()
+        
+        models.event.listen(database.engine, 'before_cursor_execute', edit_before_write)
+        database.migrate_ciphertext_storage()
+        
+        session = database.get_session()
+        assert crypto.decrypt_data(key, session.query(PasswordEntry).one().password_enc) == "edited"
+        session.close()
+
+
+class TestDatabaseProfile:
+    """Тесты профилей соединений SQLite"""
+    
+    def _add_entries(self, database, count):
+        db_session = database.get_session()
+        for i in range(count):
+            db_session.add(PasswordEntry(site_name_enc=f"s{i}", username_enc="u", password_enc="p" * 500))
+        db_session.commit()
+        db_session.close()
+    
+    def test_profiles_applied_per_connection(self, tmp_path):
+        """PRAGMA профиля применяются к каждому соединению; legacy оставляет журнал отката"""
+        database = Database(str(tmp_path / 'wal.db'), pragmas={'cache_size': -4096})
+        with database.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == 'wal'
+            assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+            assert connection.exec_driver_sql("PRAGMA cache_size").scalar() == -4096
+        
+        legacy = Database(str(tmp_path / 'legacy.db'), sqlite_profile='legacy')
+        assert legacy.stats()['journal_mode'] == 'delete'
+        with pytest.raises(ValueError):
+            Database(str(tmp_path / 'bad.db'), pragmas={'synchronous': 'OFF; DROP TABLE x'})
+    
+    def test_reader_does_not_block_writer(self, tmp_path):
+        """В WAL открытая транзакция чтения не мешает записи, копия включает WAL"""
+        database = Database(str(tmp_path / 'vault.db'))
+        self._add_entries(database, 1)
+        
+        with database.engine.connect() as reader:
+            reader.exec_driver_sql("BEGIN")
+            assert reader.exec_driver_sql("SELECT COUNT(*) FROM password_entries").scalar() == 1
+            self._add_entries(database, 1)
+            assert reader.exec_driver_sql("SELECT COUNT(*) FROM password_entries").scalar() == 1
+            reader.exec_driver_sql("ROLLBACK")
+        
+        assert database.wal_size() > 0
+        copy_database(database.db_path, str(tmp_path / 'copy.db'))
+        assert Database(str(tmp_path / 'copy.db')).get_session().query(PasswordEntry).count() == 2
+    
+    def test_wal_bounded_by_checkpoint(self, tmp_path):
+        """WAL сверх лимита сворачивается при возврате соединения в пул"""
+        database = Database(str(tmp_path / 'vault.db'), pragmas={'wal_autocheckpoint': 0})
+        database.CHECKPOINT_EVERY = 1
+        database.wal_limit = 64 << 10
+        for _ in range(5):
+            self._add_entries(database, 50)
+        
+        assert database.checkpoints > 0
+        assert database.wal_size() <= database.wal_limit
+
+
+class TestSchemaMigrations:
+    """Тесты версионных миграций схемы"""
+    
+    def test_legacy_database_upgraded(self, tmp_path):
+        """БД без версии получает новые колонки и индексы, данные сохраняются"""
+        path = str(tmp_path / 'old.db')
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE login_attempts (id INTEGER PRIMARY KEY, "
+                           "ip_address VARCHAR(45) NOT NULL, timestamp DATETIME)")
+        connection.execute("INSERT INTO login_attempts (ip_address) VALUES ('10.0.0.1')")
+        connection.commit()
+        connection.close()
+        
+        database = Database(path)
+        assert database.schema_version == SCHEMA_VERSION
+        with database.engine.connect() as connection:
+            assert connection.exec_driver_sql("SELECT COUNT(*) FROM login_attempts").scalar() == 1
+            columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(login_attempts)")}
+            plan = connection.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM login_attempts WHERE ip_address = '1' AND timestamp > '2020'"
+            ).fetchall()
+        assert 'success' in columns
+        assert 'ix_login_attempts_ip_timestamp' in str(plan)
+    
+    def test_current_schema_skips_create_all(self, tmp_path, monkeypatch):
+        """При актуальной версии схемы create_all не вызывается"""
+        Database(str(tmp_path / 'vault.db'))
+        
+        def fail(*args, **kwargs):
+            raise AssertionError("create_all при актуальной схеме")
+        monkeypatch.setattr(models.Base.metadata, 'create_all', fail)
+        
+        database = Database(str(tmp_path / 'vault.db'))
+        assert database.schema_version == SCHEMA_VERSION and database.migrate() == SCHEMA_VERSION
+
+
+class TestLifecycle:
+    """Тесты объектов процесса"""
+    
+    def test_concurrent_first_access_creates_once(self):
+        """Параллельные первые обращения получают один экземпляр"""
+        created = []
+        barrier = threading.Barrier(8)
+        
+        def factory():
+            created.append(object())
+            return created[-1]
+        
+        singleton = ProcessSingleton(factory)
+        results = []
+        
+        def worker():
+            barrier.wait()
+            results.append(singleton.get())
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(created) == 1 and all(result is created[0] for result in results)
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="нет fork")
+    def test_child_rebuilds_after_fork(self, tmp_path):
+        """После fork дочерний процесс создает свой экземпляр, родительский освобождается on_fork"""
+        released = []
+        singleton = ProcessSingleton(lambda: Database(str(tmp_path / 'vault.db')),
+                                     on_fork=lambda database: released.append(database))
+        parent = singleton.get()
+        
+        pid = os.fork()
+        if pid == 0:
+            child = singleton.get()
+            ok = child is not parent and released == [parent] and child.get_session().query(PasswordEntry).count() == 0
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        
+        assert os.WEXITSTATUS(status) == 0
+        assert singleton.get() is parent and not released
+
+
+class TestAuditWriter:
+    """Тесты отложенной записи журнала аудита"""
+    
+    def test_batches_and_flushes_on_close(self, tmp_path):
+        """События пишутся пакетами, остаток - при закрытии"""
+        database = Database(str(tmp_path / 'vault.db'))
+        writer = AuditWriter(database, batch_size=50, flush_interval=60)
+        for i in range(120):
+            writer.log('list_entries', details=str(i))
+        writer.close()
+        
+        session = database.get_session()
+        logs = session.query(models.AuditLog).order_by(models.AuditLog.id).all()
+        session.close()
+        assert [log.details for log in logs] == [str(i) for i in range(120)]
+        assert writer.stats()['batches'] == 3 and writer.stats()['queue_depth'] == 0
+    
+    def test_sync_event_written_with_preceding(self, tmp_path):
+        """Синхронное событие записано к возврату вместе с событиями до него"""
+        database = Database(str(tmp_path / 'vault.db'))
+        writer = AuditWriter(database, batch_size=1000, flush_interval=60)
+        writer.log('create_entry', entry_id=1)
+        assert writer.stats()['queue_depth'] == 1
+        writer.log('login', success=False, sync=True)
+        
+        session = database.get_session()
+        actions = [log.action for log in session.query(models.AuditLog).order_by(models.AuditLog.id)]
+        session.close()
+        stats = writer.stats()
+        writer.close()
+        assert actions == ['create_entry', 'login']
+        assert stats['sync_writes'] == 1 and stats['queue_depth'] == 0 and stats['max_lag_ms'] >= 0
+    
+    def test_background_flush_after_interval(self, tmp_path):
+        """Фоновый поток записывает пакет через flush_interval"""
+        database = Database(str(tmp_path / 'vault.db'))
+        writer = AuditWriter(database, batch_size=1000, flush_interval=0.05)
+        writer.log('logout')
+        deadline = time.monotonic() + 5
+        while writer.stats()['written'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stats = writer.stats()
+        writer.close()
+        assert stats['written'] == 1 and stats['last_lag_ms'] >= 50
+
+
+class TestLoginRateLimiter:
+    """Тесты ограничения попыток входа"""
+    
+    def test_window_blocks_and_expires(self, tmp_path):
+        """Неудачные попытки блокируют IP до выхода из окна, успешный вход резерв снимает"""
+        limiter = LoginRateLimiter(Database(str(tmp_path / 'vault.db')), max_attempts=3, window=0.2)
+        assert limiter.check('10.0.0.1') == (True, 3)
+        limiter.record('10.0.0.1', True)
+        for _ in range(3):
+            assert limiter.check('10.0.0.1')[0]
+            limiter.record('10.0.0.1', False)
+        assert limiter.check('10.0.0.1') == (False, 0)
+        assert limiter.check('10.0.0.2') == (True, 3)
+        time.sleep(0.25)
+        assert limiter.check('10.0.0.1') == (True, 3)
+        limiter.writer.close()
+    
+    def test_rehydrate_and_prune(self, tmp_path):
+        """Новый процесс восстанавливает окно из БД; старые попытки удаляются"""
+        database = Database(str(tmp_path / 'vault.db'))
+        limiter = LoginRateLimiter(database, max_attempts=2, window=60, retention_days=0)
+        for _ in range(2):
+            limiter.check('10.0.0.1')
+            limiter.record('10.0.0.1', False)
+        limiter.writer.close()
+        session = database.get_session()
+        session.add(models.LoginAttempt(ip_address='10.0.0.9', timestamp=datetime.utcnow() - timedelta(days=90)))
+        session.commit()
+        session.close()
+        
+        restarted = LoginRateLimiter(database, max_attempts=2, window=60, retention_days=30)
+        assert restarted.rehydrate() == 2
+        assert restarted.check('10.0.0.1') == (False, 0)
+        assert restarted.prune() == 1
+        session = database.get_session()
+        assert session.query(models.LoginAttempt).count() == 2
+        session.close()
+        restarted.writer.close()
+    
+    def test_overloaded_kdf_does_not_count_as_failure(self, tmp_path, monkeypatch):
+        """503 из-за перегрузки пула KDF снимает резерв попытки: блокировки без неверного пароля нет"""
+        import app as app_module
+        
+        class BusyKdf:
+            def verify_and_derive(self, *args):
+                raise KdfPoolBusy(1)
+        
+        database = Database(str(tmp_path / 'vault.db'))
+        session = database.get_session()
+        session.add(models.MasterPassword(password_hash='x', salt=base64.b64encode(b'salt').decode()))
+        session.commit()
+        session.close()
+        limiter = LoginRateLimiter(database, max_attempts=2, window=60, retention_days=0)
+        writer = AuditWriter(database)
+        monkeypatch.setattr(app_module, 'db', database)
+        monkeypatch.setattr(app_module, 'kdf', BusyKdf())
+        monkeypatch.setattr(app_module, 'limiter', limiter)
+        monkeypatch.setattr(app_module, 'audit', writer)
+        monkeypatch.setattr(app_module, 'api_limiter', ApiRateLimiter(':memory:', [], enabled=False))
+        
+        client = app_module.app.test_client()
+        statuses = [client.post('/api/login', json={'master_password': 'password'}).status_code for _ in range(4)]
+        
+        assert statuses == [503] * 4
+        assert limiter.check('127.0.0.1') == (True, 2)
+        writer.close()
+        limiter.writer.close()
+
+
+class TestApiRateLimiter:
+    """Тесты ограничения частоты запросов к API"""
+    
+    def test_rule_priority(self):
+        """Правило с IP важнее правила с путем, путь длиннее важнее короткого"""
+        limiter = ApiRateLimiter(':memory:', parse_rules('*=20/60, /api/entries=5/20, POST /api/login=1, *@127.0.0.1=0'))
+        assert limiter.rule_for('GET', '/api/entries/5', '10.0.0.1').key == '/api/entries'
+        assert limiter.rule_for('GET', '/api/entriesx', '10.0.0.1').key == '*'
+        assert limiter.rule_for('GET', '/api/login', '10.0.0.1').key == '*'
+        assert limiter.rule_for('POST', '/api/login', '127.0.0.1').rate == 0
+        with pytest.raises(ValueError):
+            parse_rules('/api/login=fast')
+    
+    def test_bucket_empties_and_refills(self, tmp_path):
+        """Емкость расходуется, токены пополняются со скоростью правила"""
+        limiter = ApiRateLimiter(str(tmp_path / 'buckets.db'), parse_rules('*=20/2'))
+        assert limiter.acquire('GET', '/api/entries', '10.0.0.1')[0]
+        assert limiter.acquire('GET', '/api/entries', '10.0.0.1')[0]
+        allowed, retry_after = limiter.acquire('GET', '/api/entries', '10.0.0.1')
+        assert not allowed and 0 < retry_after <= 0.05
+        assert limiter.acquire('GET', '/api/entries', '10.0.0.2')[0]
+        time.sleep(0.06)
+        assert limiter.acquire('GET', '/api/entries', '10.0.0.1')[0]
+        assert limiter.stats()['limited'] == 1
+        limiter.close()
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="нет fork")
+    def test_buckets_shared_between_processes(self, tmp_path):
+        """Токены, списанные в дочернем процессе, недоступны родителю"""
+        path = str(tmp_path / 'buckets.db')
+        pid = os.fork()
+        if pid == 0:
+            child = ApiRateLimiter(path, parse_rules('*=0.01/3'))
+            ok = all(child.acquire('GET', '/api/entries', '10.0.0.1')[0] for _ in range(3))
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        
+        assert os.WEXITSTATUS(status) == 0
+        limiter = ApiRateLimiter(path, parse_rules('*=0.01/3'))
+        assert not limiter.acquire('GET', '/api/entries', '10.0.0.1')[0]
+        limiter.close()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])